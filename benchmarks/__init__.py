@@ -0,0 +1,10 @@
+"""Repeatable micro- and macro-benchmarks of chido's hot paths.
+
+harness times registered benchmarks and compares them against a saved
+baseline, micro covers path parsing, JSON decoding and encoding, and macro
+covers Set-then-verify round trips against a local fake_ap target.
+
+Usage:
+  python3 -m benchmarks --output=baseline.json
+  python3 -m benchmarks --baseline=baseline.json --filter=Deserialize
+"""
@@ -0,0 +1,49 @@
+"""Runs the benchmarks, see benchmarks/__init__.py."""
+import argparse
+import sys
+
+from absl import logging  # pip install absl-py
+from benchmarks import harness
+from benchmarks import macro
+from benchmarks import micro
+
+_SUITES = (micro, macro)  # Importing them registers their benchmarks.
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmarks chido.')
+  parser.add_argument('--filter', default=None,
+                      help='Regular expression selecting benchmarks by name.')
+  parser.add_argument('--min_time', type=float, default=1.0,
+                      help='Seconds each benchmark runs for.')
+  parser.add_argument('--min_iterations', type=int, default=10,
+                      help='Fewest timed runs of each benchmark.')
+  parser.add_argument('--output', default=None,
+                      help='JSON file the results are written to.')
+  parser.add_argument('--baseline', default=None,
+                      help='JSON results to compare against.')
+  parser.add_argument('--threshold', type=float, default=0.1,
+                      help='Relative slowdown or growth that is a regression.')
+  parser.add_argument('--list', action='store_true',
+                      help='List the benchmarks and exit.')
+  args = parser.parse_args()
+  if args.list:
+    print('\n'.join(harness.BENCHMARKS))
+    return 0
+  logging.set_verbosity(logging.ERROR)  # chido logs every RPC and poll.
+  baseline = harness.ReadJson(args.baseline) if args.baseline else None
+  report = harness.RunAll(args.filter, args.min_time, args.min_iterations)
+  sys.stdout.write(harness.Table(report))
+  if args.output:
+    harness.WriteJson(report, args.output)
+  if baseline is None:
+    return 0
+  regressions = harness.Compare(report, baseline, args.threshold)
+  for name, metric, old, new in regressions:
+    print('REGRESSION %s %s: %.6g -> %.6g (%+.0f%%)' % (
+        name, metric, old, new, (new / old - 1) * 100 if old else 100))
+  return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
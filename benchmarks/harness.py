@@ -0,0 +1,190 @@
+"""Times benchmarks and compares the results against a baseline.
+
+A benchmark is a function returning the callable to time, so any setup (eg.
+starting a fake target) happens before timing starts.  Run calls it until both
+min_time and min_iterations are reached and reports ops/s and latency
+percentiles, then calls it once more under tracemalloc for the peak memory of
+an operation.  Results are plain dicts, written as JSON by WriteJson and
+checked for regressions by Compare.
+"""
+import json
+import os
+import platform
+import re
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterable, List, Optional, Text, Tuple
+
+_VERSION = 1
+_PERCENTILES = (50, 90, 99)
+
+# name -> function returning the operation to time, in registration order.
+BENCHMARKS = {}
+
+
+class Error(Exception):
+  """Module-level Exception class."""
+
+
+class BaselineError(Error):
+  """A baseline file is unreadable or was written by another version."""
+
+
+def Register(name: Text) -> Callable[[Callable[[], Callable[[], Any]]],
+                                     Callable[[], Callable[[], Any]]]:
+  """Decorator registering a benchmark under name."""
+  def Decorator(func):
+    if name in BENCHMARKS:
+      raise Error('Benchmark "%s" is already registered' % name)
+    BENCHMARKS[name] = func
+    return func
+  return Decorator
+
+
+def Percentile(samples: List[float], q: float) -> float:
+  """Returns the q-th percentile (0-100) of sorted samples, interpolated."""
+  rank = (len(samples) - 1) * q / 100.0
+  lower = int(rank)
+  upper = min(lower + 1, len(samples) - 1)
+  return samples[lower] + (samples[upper] - samples[lower]) * (rank - lower)
+
+
+def Run(operation: Callable[[], Any], min_time: float = 1.0,
+        min_iterations: int = 10, warmup: int = 1) -> Dict[Text, Any]:
+  """Times an operation.
+
+  Args:
+    operation: (callable) the operation, called without arguments.
+    min_time: (float) seconds to keep calling the operation for.
+    min_iterations: (int) fewest timed calls.
+    warmup: (int) untimed calls first, to fill caches.
+
+  Returns:
+    dict of iterations, ops_per_sec, mean, min, max and p50, p90 and p99 in
+    seconds, and peak_bytes allocated during one call.
+  """
+  for _ in range(warmup):
+    operation()
+  samples = []
+  start = time.perf_counter()
+  while (len(samples) < min_iterations or
+         time.perf_counter() - start < min_time):
+    before = time.perf_counter()
+    operation()
+    samples.append(time.perf_counter() - before)
+  total = sum(samples)
+  samples.sort()
+  result = {'iterations': len(samples),
+            'ops_per_sec': len(samples) / total if total else float('inf'),
+            'mean': total / len(samples), 'min': samples[0],
+            'max': samples[-1]}
+  for q in _PERCENTILES:
+    result['p%d' % q] = Percentile(samples, q)
+  result['peak_bytes'] = PeakBytes(operation)
+  return result
+
+
+def PeakBytes(operation: Callable[[], Any]) -> int:
+  """Returns the peak bytes allocated by Python during one operation."""
+  was_tracing = tracemalloc.is_tracing()
+  if not was_tracing:
+    tracemalloc.start()
+  try:
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    operation()
+    return max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+  finally:
+    if not was_tracing:
+      tracemalloc.stop()
+
+
+def RunAll(pattern: Optional[Text] = None, min_time: float = 1.0,
+           min_iterations: int = 10,
+           benchmarks: Optional[Dict[Text, Callable]] = None
+          ) -> Dict[Text, Any]:
+  """Runs the benchmarks whose name matches pattern.
+
+  Args:
+    pattern: (str) regular expression searched in the names, None runs all.
+    min_time: (float) seconds each benchmark runs for, see Run.
+    min_iterations: (int) fewest timed calls of each benchmark.
+    benchmarks: (dict) benchmarks to pick from, defaults to BENCHMARKS.
+
+  Returns:
+    the report: a dict of the environment and the result of every benchmark.
+  """
+  results = {}
+  for name, setup in (benchmarks or BENCHMARKS).items():
+    if pattern and not re.search(pattern, name):
+      continue
+    results[name] = Run(setup(), min_time, min_iterations)
+  return {'version': _VERSION, 'python': platform.python_version(),
+          'machine': platform.machine(), 'time': time.time(),
+          'benchmarks': results}
+
+
+def WriteJson(report: Dict[Text, Any], path: Text) -> None:
+  """Atomically writes a report to a JSON file."""
+  directory = os.path.dirname(os.path.abspath(path))
+  with tempfile.NamedTemporaryFile('wt', dir=directory, delete=False) as f:
+    json.dump(report, f, indent=2, sort_keys=True)
+  os.replace(f.name, path)
+
+
+def ReadJson(path: Text) -> Dict[Text, Any]:
+  """Returns a report written by WriteJson.
+
+  Raises:
+    BaselineError: If path is not a report of this version.
+  """
+  try:
+    with open(path, 'rt') as f:
+      report = json.load(f)
+  except (OSError, ValueError) as e:
+    raise BaselineError('Unable to read baseline %s: %s' % (path, e))
+  if not isinstance(report, dict) or report.get('version') != _VERSION:
+    raise BaselineError('%s is not a version %d benchmark report' % (
+        path, _VERSION))
+  return report
+
+
+def Compare(report: Dict[Text, Any], baseline: Dict[Text, Any],
+            threshold: float = 0.1,
+            metrics: Iterable[Text] = ('p50', 'p90', 'peak_bytes')
+           ) -> List[Tuple[Text, Text, float, float]]:
+  """Returns the regressions of a report against a baseline.
+
+  Args:
+    report: (dict) the current report, see RunAll.
+    baseline: (dict) the saved report to compare against.
+    threshold: (float) relative increase of a metric that is a regression,
+      eg. 0.1 for 10%.
+    metrics: (list) result keys compared, lower is better for all of them.
+
+  Returns:
+    list of (benchmark, metric, baseline value, current value) tuples.
+    Benchmarks missing from either report are not compared.
+  """
+  regressions = []
+  for name, result in sorted(report['benchmarks'].items()):
+    old = baseline['benchmarks'].get(name)
+    if old is None:
+      continue
+    for metric in metrics:
+      if metric in old and result[metric] > old[metric] * (1 + threshold):
+        regressions.append((name, metric, old[metric], result[metric]))
+  return regressions
+
+
+def Table(report: Dict[Text, Any]) -> Text:
+  """Returns the results of a report as a text table."""
+  lines = ['%-44s %8s %10s %9s %9s %9s %10s' % (
+      'benchmark', 'iters', 'ops/s', 'p50 ms', 'p90 ms', 'p99 ms', 'peak KiB')]
+  for name, result in sorted(report['benchmarks'].items()):
+    lines.append('%-44s %8d %10.1f %9.3f %9.3f %9.3f %10.1f' % (
+        name, result['iterations'], result['ops_per_sec'],
+        result['p50'] * 1e3, result['p90'] * 1e3, result['p99'] * 1e3,
+        result['peak_bytes'] / 1024.0))
+  return '\n'.join(lines) + '\n'
@@ -0,0 +1,61 @@
+"""Macro-benchmarks: Set-then-verify round trips against a local target.
+
+Every benchmark talks to one in-process fake_ap target, started on first use,
+whose APs converge at once, so the timings are chido's own work: encoding,
+RPCs over loopback, decoding and comparing.  Poll delays come from an
+in-memory convergence.Scheduler without jitter, so earlier runs do not change
+them.
+"""
+import atexit
+import functools
+import os
+from typing import Any, Callable, Text
+
+import chido
+import convergence
+import fake_ap
+from benchmarks import harness
+from benchmarks import micro
+
+
+# Aruba does not accept a Set of the radios container.
+VENDORS = ('arista', 'mist')
+_SERVER = None
+
+
+def _Target() -> None:
+  """Starts the fake target and points chido at it, once."""
+  global _SERVER
+  if _SERVER is not None:
+    return
+  _SERVER, port = fake_ap.Serve(fake_ap.FakeTarget([
+      fake_ap.FakeAp.FromApObject(micro.Ap(vendor), convergence_delay=0)
+      for vendor in micro.VENDORS]))
+  atexit.register(_SERVER.stop, None)
+  os.environ['CHIDO_FAKE_TARGET'] = 'localhost:%d' % port
+  convergence.SCHEDULER = convergence.Scheduler(None, jitter=0.0)
+
+
+def _Radio(vendor: Text) -> Any:
+  ap = micro.Ap(vendor)
+  return ap, chido.GetContainerFromJson(
+      ap, micro.Fixture(vendor + '_radio_base'), 'radios')
+
+
+def _SetContainer(vendor: Text) -> Callable[[], Any]:
+  _Target()
+  ap, radio = _Radio(vendor)
+  return functools.partial(chido.SetContainer, ap, 'radios', radio)
+
+
+def _CycleChannels(vendor: Text) -> Callable[[], Any]:
+  _Target()
+  ap, radio = _Radio(vendor)
+  return functools.partial(chido.CycleChannels, ap, radio)
+
+
+for _vendor in VENDORS:
+  harness.Register('SetContainer/%s/radios' % _vendor)(
+      functools.partial(_SetContainer, _vendor))
+  harness.Register('CycleChannels/%s/5g-20' % _vendor)(
+      functools.partial(_CycleChannels, _vendor))
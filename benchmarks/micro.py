@@ -0,0 +1,161 @@
+"""Micro-benchmarks: path parsing, JSON decoding and encoding.
+
+Nothing here talks to a target; full-tree responses are answered in-process
+by a fake_ap.FakeTarget.
+"""
+import functools
+import glob
+import json
+import os
+from typing import Any, Callable, Text
+
+import chido
+import fake_ap
+import gnmi_lib
+import gnmi_pb2
+import pyangbind.lib.pybindJSON as pybindJSON  # pip install pyangbind
+from pyangbind.lib.serialise import pybindJSONDecoder  # pip install pyangbind
+from benchmarks import harness
+
+# Binding imports
+from bindings.v0_2_0 import binding as v020binding
+from bindings.arista import access_points as arista_aps
+
+
+TESTDATA = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'testdata')
+VENDORS = ('arista', 'aruba', 'mist')
+_HOSTNAMES = {'arista': 'ap-02-102.example.com',
+              'aruba': 'ap-02-104.example.com',
+              'mist': 'ap-02-100.example.com'}
+_MACS = {'arista': '30:86:2D:25:26:27', 'aruba': '48:4A:E9:CC:CB:CA',
+         'mist': '5C:5B:35:01:02:03'}
+# Fixture name, without the vendor, -> container GetContainerFromJson takes.
+_CONTAINERS = {'radio_base': 'radios', 'ssid_base': 'ssids',
+               'ssid_alternate': 'ssids', 'dot11r_base': 'dot11r',
+               'band_steering_base': 'band-steering', 'wmm_base': 'wmm',
+               'ssh_base': 'ssh', 'provision_us': 'provision-aps'}
+# Fixtures of the access-point entry and of its system container.
+_TREES = ('office_base_full', 'office_silo_full', 'system_base')
+# Fixtures that do not adhere to the schema of any binding.
+_INVALID = ('mist_diff_tx',)
+_HOST_PATH = '/access-points/access-point[hostname=%s]'
+_XPATHS = (
+    '/access-points/access-point[hostname=ap-02-100.example.com]/radios/'
+    'radio[id=0]/config/channel',
+    '/access-points/access-point[hostname=ap-02-100.example.com]/ssids/'
+    'ssid[name=Guest]/bssids/bssid[radio-id=0]/state/counters',
+    '/joined-aps/joined-ap[hostname=ap-02-100.example.com]/state')
+
+
+class Ap(object):
+  """The attributes of a chido_test.ApObject chido needs offline."""
+
+  def __init__(self, vendor: Text):
+    self.ap_name = _HOSTNAMES[vendor]
+    self.vendor = vendor
+    self.mac = _MACS[vendor]
+    self.model = self.serial = self.firmware = ''
+    self.targetip = self.targetipv6 = self.targetport = None
+    self.credentials = None
+    self.radio_id, self.radio_freq = '0', 'FREQ_5GHZ'
+
+
+def Fixture(name: Text) -> Text:
+  """Returns the path of a testdata fixture."""
+  return os.path.join(TESTDATA, name + '.json')
+
+
+@harness.Register('PathNames')
+def _PathNames() -> Callable[[], Any]:
+  return lambda: [gnmi_lib.PathNames(xpath) for xpath in _XPATHS]
+
+
+@harness.Register('ParsePath')
+def _ParsePath() -> Callable[[], Any]:
+  names = [gnmi_lib.PathNames(xpath) for xpath in _XPATHS]
+  return lambda: [gnmi_lib.ParsePath(n) for n in names]
+
+
+def _GetContainerFromJson(vendor: Text, fixture: Text,
+                          container: Text) -> Callable[[], Any]:
+  return functools.partial(chido.GetContainerFromJson, Ap(vendor),
+                           Fixture(fixture), container)
+
+
+def _DecodeTree(vendor: Text, fixture: Text) -> Callable[[], Any]:
+  """Decodes a fixture of a whole access point, or of its system container,
+  the way GetContainerFromJson decodes the others."""
+  ap = Ap(vendor)
+  with open(Fixture(fixture), 'rt') as f:
+    json_data = f.read()
+
+  def _Decode():
+    if vendor == 'arista':
+      configs = arista_aps.openconfig_access_points()
+    else:
+      configs = v020binding.openconfig_access_points()
+    obj = configs.access_points.access_point.add(ap.ap_name)
+    if fixture.endswith('system_base'):
+      obj = obj.system
+    return pybindJSONDecoder.load_ietf_json(json.loads(json_data), None, None,
+                                            obj=obj)
+  return _Decode
+
+
+def _RegisterFixtures() -> None:
+  for path in sorted(glob.glob(os.path.join(TESTDATA, '*.json'))):
+    fixture = os.path.basename(path)[:-len('.json')]
+    if fixture in _INVALID:
+      continue
+    vendor, _, rest = fixture.partition('_')
+    if vendor not in VENDORS:  # Shared fixtures, as sent to every vendor.
+      vendor, rest = 'mist', fixture
+    if rest in _CONTAINERS:
+      harness.Register('GetContainerFromJson/' + fixture)(functools.partial(
+          _GetContainerFromJson, vendor, fixture, _CONTAINERS[rest]))
+    elif rest in _TREES:
+      harness.Register('DecodeTree/' + fixture)(
+          functools.partial(_DecodeTree, vendor, fixture))
+
+
+_RegisterFixtures()
+
+
+def FullTreeResponse(vendor: Text) -> gnmi_pb2.GetResponse:
+  """Returns a fake AP's answer to a Get of its whole tree, with the vendor's
+  office config applied and converged."""
+  ap = Ap(vendor)
+  target = fake_ap.FakeTarget([fake_ap.FakeAp.FromApObject(
+      ap, convergence_delay=0)])
+  path = gnmi_lib.ParsePath(gnmi_lib.PathNames(_HOST_PATH % ap.ap_name))
+  with open(Fixture(vendor + '_office_base_full'), 'rb') as f:
+    target.SetResponse(gnmi_pb2.SetRequest(update=[gnmi_pb2.Update(
+        path=path, val=gnmi_pb2.TypedValue(json_ietf_val=f.read()))]), ())
+  return target.GetResponse(gnmi_pb2.GetRequest(
+      path=[path], encoding=gnmi_pb2.JSON_IETF), ())
+
+
+def _Deserialize(vendor: Text) -> Callable[[], Any]:
+  response = FullTreeResponse(vendor)
+  return functools.partial(chido.Deserialize, Ap(vendor), response)
+
+
+def _DumpsTree(vendor: Text) -> Callable[[], Any]:
+  tree = chido.Deserialize(Ap(vendor), FullTreeResponse(vendor))
+  return functools.partial(pybindJSON.dumps, tree, mode='ietf')
+
+
+def _DumpsRadio(vendor: Text) -> Callable[[], Any]:
+  radio = chido.GetContainerFromJson(
+      Ap(vendor), Fixture(vendor + '_radio_base'), 'radios')
+  return functools.partial(pybindJSON.dumps, radio, mode='ietf')
+
+
+for _vendor in VENDORS:
+  harness.Register('Deserialize/' + _vendor)(
+      functools.partial(_Deserialize, _vendor))
+  harness.Register('Dumps/%s/tree' % _vendor)(
+      functools.partial(_DumpsTree, _vendor))
+  harness.Register('Dumps/%s/radio' % _vendor)(
+      functools.partial(_DumpsRadio, _vendor))
@@ -0,0 +1,67 @@
+"""Unit tests for the benchmarks harness."""
+import os
+import tempfile
+import unittest
+
+from benchmarks import harness
+from benchmarks import micro
+
+
+class HarnessTest(unittest.TestCase):
+
+  def _Report(self, **result):
+    values = {'iterations': 10, 'ops_per_sec': 100.0, 'mean': 0.01,
+              'min': 0.01, 'max': 0.01, 'p50': 0.01, 'p90': 0.01,
+              'p99': 0.01, 'peak_bytes': 1000}
+    values.update(result)
+    return {'version': 1, 'benchmarks': {'Op': values}}
+
+  def testPercentile(self):
+    samples = [1.0, 2.0, 3.0, 4.0, 5.0]
+    self.assertEqual(harness.Percentile(samples, 50), 3.0)
+    self.assertEqual(harness.Percentile(samples, 100), 5.0)
+    self.assertAlmostEqual(harness.Percentile(samples, 90), 4.6)
+    self.assertEqual(harness.Percentile([2.0], 99), 2.0)
+
+  def testRun(self):
+    result = harness.Run(lambda: bytearray(100000), min_time=0.0,
+                         min_iterations=5)
+    self.assertEqual(result['iterations'], 5)
+    self.assertGreater(result['ops_per_sec'], 0)
+    self.assertLessEqual(result['p50'], result['p99'])
+    self.assertGreaterEqual(result['peak_bytes'], 100000)
+
+  def testRunAllFilters(self):
+    report = harness.RunAll('^PathNames$', min_time=0.0, min_iterations=2)
+    self.assertEqual(list(report['benchmarks']), ['PathNames'])
+
+  def testCompare(self):
+    baseline = self._Report()
+    self.assertEqual(harness.Compare(self._Report(p50=0.0105), baseline), [])
+    self.assertEqual(
+        harness.Compare(self._Report(p50=0.02, peak_bytes=900), baseline),
+        [('Op', 'p50', 0.01, 0.02)])
+    self.assertEqual(harness.Compare(
+        self._Report(peak_bytes=2000), baseline, metrics=('peak_bytes',)),
+                     [('Op', 'peak_bytes', 1000, 2000)])
+
+  def testBaselineRoundTrip(self):
+    path = os.path.join(tempfile.mkdtemp(), 'baseline.json')
+    harness.WriteJson(self._Report(), path)
+    self.assertEqual(harness.ReadJson(path), self._Report())
+    with open(path, 'wt') as f:
+      f.write('{"version": 0}')
+    with self.assertRaises(harness.BaselineError):
+      harness.ReadJson(path)
+
+  def testEveryFixtureIsCovered(self):
+    names = set(harness.BENCHMARKS)
+    for fixture in os.listdir(micro.TESTDATA):
+      fixture = fixture[:-len('.json')]
+      if fixture != 'mist_diff_tx':
+        self.assertTrue({'GetContainerFromJson/' + fixture,
+                         'DecodeTree/' + fixture} & names, fixture)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -2,17 +2,27 @@
 
 See README for further details.
 """
+import collections
+import contextlib
+import functools
 import json
+import os
+import re
 import socket
+import time
 from absl import flags  # pip install absl-py
 from absl import logging  # pip install absl-py
 import chido_secrets
 import grpc  # pip install grpcio
-from retry import retry  # pip install retry
 import pyangbind.lib.pybindJSON as pybindJSON   # pip install pyangbind
 from pyangbind.lib.serialise import pybindJSONDecoder  # pip install pyangbind
 import constants
+import convergence
 import gnmi_lib
+import gnmi_metrics
+import gnmi_pb2
+import inventory
+import tracing
 
 # Binding imports
 from bindings.v0_2_0 import binding as v020binding
@@ -20,9 +30,19 @@ from bindings.arista import access_points as arista_aps
 from bindings.ap_manager import ap_manager
 
 _HOST_PATH = '/access-points/access-point[hostname=%s]/'
+_JOINED_APS_PATH = '/joined-aps'
 _RESPONSE = 'GNMI RESPONSE:\n%s'
 _SET_UPDATE = 'update'
 _MIST_GCP = 'openconfig.gc1.mist.com'
+# Module prefixes removed from JSON responses before loading them in bindings.
+_STRIP_PREFIXES = (b'openconfig-wifi-types:',)
+_RE_MODULE_PREFIX = re.compile(r'^openconfig-[\w-]+:')
+# How state is fetched for verification: 'container' gets the whole state
+# container (validated against the schema) first, 'leaves' only ever gets the
+# configured leaf paths.
+_STATE_FETCH_MODES = ('container', 'leaves')
+_HOST_PREFIXES = {}  # AP host path -> gnmi_pb2.Path, used as request prefix.
+_USE_MODELS = {}  # Vendor -> gnmi_pb2.ModelData of its OC_MODEL_VERSIONS.
 _SUPPORTED_CONTAINERS = ('radios', 'ssids', 'dot11r', 'band-steering', 'wmm',
                          'ssh', 'provision-aps', 'joined-aps', 'bssids')
 
@@ -57,47 +77,647 @@ class StateMismatchError(Error):
   """If state value does not match configured value."""
 
 
+class StaleStateError(StateMismatchError):
+  """If the state returned is older than the last Set sent to the AP."""
+
+
+class BudgetExhaustedError(Error):
+  """If an operation ran out of its time budget."""
+
+
+class FatalRpcError(Error):
+  """If an RPC failed in a way retrying will not fix, eg. UNAUTHENTICATED."""
+
+
 _ACCEPTABLE_ERRORS = (StateMismatchError, grpc.RpcError)
 _ACCEPTABLE_ERRORS2 = (StateMismatchError, ConfigError, grpc.RpcError)
+# Status codes after which a leaf Get/Set is retried with JSON_IETF values.
+_ENCODING_FALLBACK_CODES = (grpc.StatusCode.INVALID_ARGUMENT,
+                            grpc.StatusCode.UNIMPLEMENTED)
+# State stamped before the last Set is re-polled quickly this many times.
+_STALE_POLLS = 10
+_STALE_POLL_DELAY = 0.5
+# Consecutive transport failures after which a target's RPCs fail fast, and
+# for how long (seconds) before one is tried again.
+_BREAKER_THRESHOLD = 5
+_BREAKER_COOLDOWN = 300
+_BREAKERS = {}  # gNMI target -> gnmi_lib.CircuitBreaker.
+_STUBS = {}  # (vendor, gNMI target) -> pooled gnmi_pb2_grpc.gNMIStub.
+# Deadline of a single RPC, and the default budget of a Set-and-verify.
+_RPC_TIMEOUT = 60
+_DEFAULT_BUDGET = 900
+
+
+class Budget(object):
+  """A time budget shared by a chido operation and everything it calls.
+
+  Functions accepting a budget pass it down, so the time left shrinks across
+  calls and retries.  Every RPC gets the remaining time (capped at
+  rpc_timeout) as its deadline, and time spent is accounted per phase so an
+  exhausted budget can say where the time went.
+  """
+
+  def __init__(self, seconds, rpc_timeout=_RPC_TIMEOUT):
+    """Initializes a Budget.
+
+    Args:
+      seconds: (float) total time allowed.
+      rpc_timeout: (float) upper bound for the deadline of a single RPC.
+    """
+    self.seconds = seconds
+    self.rpc_timeout = rpc_timeout
+    self.start = time.time()
+    self.deadline = self.start + seconds
+    self.phases = collections.OrderedDict()
+    self.current_phase = None
+
+  def Remaining(self):
+    """Returns the seconds left, zero or less once exhausted."""
+    return self.deadline - time.time()
+
+  def Check(self):
+    """Raises BudgetExhaustedError if no time is left."""
+    if self.Remaining() <= 0:
+      raise BudgetExhaustedError('Time budget of %ss exhausted%s. %s' % (
+          self.seconds, ' in %s' % self.current_phase
+          if self.current_phase else '', self.Report()))
+
+  def Timeout(self):
+    """Returns the deadline (seconds) for the next RPC."""
+    self.Check()
+    return min(self.Remaining(), self.rpc_timeout)
+
+  @contextlib.contextmanager
+  def Phase(self, name):
+    """Accounts the time spent in the block to the named phase."""
+    self.Check()
+    outer, self.current_phase = self.current_phase, name
+    start = time.time()
+    try:
+      yield
+    finally:
+      self.phases[name] = self.phases.get(name, 0.0) + time.time() - start
+      self.current_phase = outer
+
+  def Report(self):
+    """Returns the time spent per phase as a string."""
+    elapsed = time.time() - self.start
+    accounted = sum(self.phases.values())
+    parts = ['%s %.1fs' % item for item in self.phases.items()]
+    parts.append('other (retry sleeps, local work) %.1fs' % max(
+        elapsed - accounted, 0))
+    return 'Spent %.1fs: %s' % (elapsed, ', '.join(parts))
+
+
+def _Budgeted(seconds=_DEFAULT_BUDGET):
+  """Decorator giving a function a Budget unless the caller passes one.
+
+  Place it above any _PollUntilConverged decorator so all attempts share the
+  budget.
+
+  Args:
+    seconds: (float) default budget.
+
+  Returns:
+    the decorator.
+  """
+  def Decorator(func):
+    @functools.wraps(func)
+    def Wrapper(*args, **kwargs):
+      if kwargs.get('budget') is None:
+        kwargs['budget'] = Budget(seconds)
+      return func(*args, **kwargs)
+    return Wrapper
+  return Decorator
+
+
+def _Timeout(budget):
+  """Returns the RPC deadline given an optional budget."""
+  return budget.Timeout() if budget else _RPC_TIMEOUT
+
+
+@contextlib.contextmanager
+def _Phase(budget, name, **attributes):
+  """Traces the block as a span and accounts it to the budget's phase, if any.
+
+  Args:
+    budget: (Budget) time budget the phase is accounted to, or None.
+    name: (str) the phase, eg. 'rpc:Get' or 'retry sleep'.
+    **attributes: attributes of the span, see tracing.Tracer.Span.
+  """
+  with tracing.Span(name, **attributes):
+    if budget is None:
+      yield
+    else:
+      with budget.Phase(name):
+        yield
+
+
+def _Traced(name):
+  """Decorator tracing every call of a function as a span named name."""
+  def Decorator(func):
+    @functools.wraps(func)
+    def Wrapper(*args, **kwargs):
+      with tracing.Span(name):
+        return func(*args, **kwargs)
+    return Wrapper
+  return Decorator
+
+
+def _LoadIetf(json_dict, obj):
+  """Loads a JSON_IETF dict into a PyangBind object, traced."""
+  with tracing.Span('binding load'):
+    return pybindJSONDecoder.load_ietf_json(json_dict, None, None, obj=obj)
+
+
+def _Dumps(obj):
+  """Returns the JSON_IETF string of a PyangBind object, traced."""
+  with tracing.Span('serialize'):
+    return pybindJSON.dumps(obj, mode='ietf')
+
 
+def _Breaker(ap):
+  """Returns the circuit breaker of the AP's gNMI target."""
+  breaker = _BREAKERS.get(ap.gnmi_target)
+  if breaker is None:
+    breaker = _BREAKERS.setdefault(ap.gnmi_target, gnmi_lib.CircuitBreaker(
+        ap.gnmi_target, _BREAKER_THRESHOLD, _BREAKER_COOLDOWN))
+  return breaker
 
-def GetPath(ap, xpath):
+
+def TargetIsDown(ap):
+  """Returns whether RPCs to the AP's gNMI target currently fail fast."""
+  if getattr(ap, 'gnmi_target', None) is None:
+    _GetStub(ap)
+  return _Breaker(ap).IsOpen()
+
+
+@contextlib.contextmanager
+def _Guarded(ap):
+  """Records the outcome of the RPCs in the block in the target's breaker.
+
+  Raises:
+    gnmi_lib.CircuitOpenError: If the breaker of the AP's target is open.
+  """
+  breaker = _Breaker(ap)
+  breaker.Check()
+  try:
+    yield
+  except grpc.RpcError as e:
+    breaker.Record(e)
+    raise
+  breaker.Record()
+
+
+@contextlib.contextmanager
+def _Rpc(ap, budget, method):
+  """Guards an RPC with the target's breaker and accounts it to the budget."""
+  with _Guarded(ap), _Phase(budget, 'rpc:' + method):
+    yield
+
+
+def _FailFast(func):
+  """Decorator raising FatalRpcError for RPC errors retrying will not fix.
+
+  Place it below any _PollUntilConverged decorator retrying on grpc.RpcError, so
+  errors such as UNAUTHENTICATED or a certificate mismatch end the retries at
+  once.
+  """
+  @functools.wraps(func)
+  def Wrapper(*args, **kwargs):
+    try:
+      return func(*args, **kwargs)
+    except grpc.RpcError as e:
+      if gnmi_lib.IsRetryable(e):
+        raise
+      raise FatalRpcError('%s failed with %s: %s' % (
+          func.__name__, e.code().name, e.details())) from e
+  return Wrapper
+
+
+def _PollUntilConverged(exceptions, tries=30, container=None, leaf=None,
+                        sets_config=False):
+  """Decorator retrying a verification until the AP's state converged.
+
+  The delays between attempts come from convergence.SCHEDULER, which learns
+  how long (vendor, container, leaf) takes to converge.  Every cycle is also
+  recorded in convergence.RECORDER: the time until config (see _ConfigMatched)
+  and state matched and the number of polls.  The decorated function takes the
+  AP as its first argument and, unless given here, the container as its second
+  and the leaf and its value as 'leaf' and 'value' keyword arguments.
+
+  Args:
+    exceptions: (tuple) exceptions meaning the state did not converge yet.
+    tries: (int) attempts before the last exception is raised.
+    container: (str) container verified by the function.
+    leaf: (str) leaf whose change is verified by the function.
+    sets_config: (bool) Whether the function sends the Set itself, so times
+      are measured from its first attempt instead of the AP's last Set.
+
+  Returns:
+    the decorator.
+  """
+  def Decorator(func):
+    @functools.wraps(func)
+    def Wrapper(ap, *args, **kwargs):
+      key = (ap.vendor, container or args[0], leaf or kwargs.get('leaf') or '*')
+      budget = kwargs.get('budget')
+      delays = convergence.SCHEDULER.Delays(key)
+      start = time.time()
+      since = start if sets_config else getattr(ap, 'last_set_time', start)
+      polls, converged = 0, None
+      retry = False  # Whether the last attempt failed on an RPC error.
+      try:
+        for attempt in range(1, tries + 1):
+          polls += 1
+          try:
+            retrying = gnmi_metrics.Retry(retry)
+            with tracing.Span('attempt', attempt=attempt), retrying:
+              result = func(ap, *args, **kwargs)
+          except exceptions as e:
+            if attempt == tries:
+              raise
+            retry = isinstance(e, grpc.RpcError)
+            delay = next(delays)
+            if budget:
+              delay = max(min(delay, budget.Remaining()), 0)
+            logging.warning('%s, retrying in %.1f seconds...', e, delay)
+            with _Phase(budget, 'retry sleep', reason='not converged'):
+              _Sleep(delay)
+          else:
+            converged = time.time() - since
+            convergence.SCHEDULER.Record(key, converged)
+            return result
+      finally:
+        config_time = getattr(ap, 'config_match_time', None)
+        convergence.RECORDER.Observe(
+            (ap.vendor, ap.model or '', getattr(ap, 'firmware', None) or '',
+             key[1], key[2], str(kwargs.get('value', ''))),
+            polls, converged,
+            config_time - since if config_time and config_time >= since
+            else None)
+    return Wrapper
+  return Decorator
+
+
+def _ConfigMatched(ap):
+  """Marks the config of the AP's last Set as read back and matching."""
+  ap.config_match_time = time.time()
+
+
+def _LabelRpcs(container=None):
+  """Decorator labelling the RPC metrics of a function with a container.
+
+  The function is also traced as a span with the AP, vendor and container as
+  attributes.
+
+  Args:
+    container: (str) fixed container name; if None the container argument of
+      the decorated function (following ap) is used.
+
+  Returns:
+    the decorator.
+  """
+  def Decorator(func):
+    @functools.wraps(func)
+    def Wrapper(ap, *args, **kwargs):
+      name = container or kwargs.get('container') or args[0]
+      with gnmi_metrics.Labels(container=name), tracing.Span(
+          func.__name__, ap=ap.ap_name, vendor=ap.vendor, container=name):
+        return func(ap, *args, **kwargs)
+    return Wrapper
+  return Decorator
+
+
+def GetPath(ap, xpath, data_type='ALL', use_models=False, budget=None):
   """Performs Get request and display response.
 
+  Checks should request only the data they need; eg. config verification asks
+  for CONFIG so the target does not send state and counters along with it.
+
   Args:
     ap: (object) chido_test.ApObject containing all AP attributes.
     xpath: (str) the OpenConfig path to get.
+    data_type: (str) gNMI GetRequest data type, ALL, CONFIG, STATE or
+      OPERATIONAL.
+    use_models: (bool) Whether to restrict the response to the models in
+      constants.OC_MODEL_VERSIONS for the AP's vendor.
+    budget: (Budget) time budget the RPC deadline is taken from.
 
   Raises:
     UnsupportedVendorError: If an AP is an unsupported vendor.
   Returns:
     gnmi_pb2.GetResponse object representing a gNMI GetResponse.
   """
-  ap.targetport = constants.GNMI_TARGETPORTS[ap.vendor]
-  username, password = _GetUserPass(ap.vendor)
+  return GetPaths(ap, [xpath], data_type=data_type, use_models=use_models,
+                  budget=budget)
 
-  path = gnmi_lib.ParsePath(gnmi_lib.PathNames((xpath)))
 
-  if ap.vendor == 'arista':
-    creds = gnmi_lib.CreateCreds(constants.ARISTA_CA_CERT)
-    ap.stub = gnmi_lib.CreateStub(
-        creds, ap.targetip, ap.targetport, 'openconfig.mojonetworks.com')
+def GetPaths(ap, xpaths, data_type='ALL', use_models=False,
+             encoding='JSON_IETF', budget=None):
+  """Performs a single batched Get request for several paths.
+
+  Paths below the AP's host path share it as the request prefix, so only the
+  relative paths are repeated.  See GetPath for the arguments.
+
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    xpaths: (list) the OpenConfig paths to get.
+    data_type: (str) gNMI GetRequest data type.
+    use_models: (bool) Whether to restrict the response to the AP's models.
+    encoding: (str) gNMI Encoding, eg. JSON_IETF or PROTO.
+    budget: (Budget) time budget the RPC deadline is taken from.
+
+  Returns:
+    gnmi_pb2.GetResponse object representing a gNMI GetResponse.
+  """
+  username, password = _GetUserPass(ap.vendor, ap.credentials)
+
+  prefix, paths = _ParsePaths(ap, xpaths)
+  ap.stub = _GetStub(ap)
+
+  with _Rpc(ap, budget, 'Get'):
+    return gnmi_lib.Get(ap.stub, paths, username, password,
+                        data_type=data_type,
+                        use_models=_UseModels(ap, use_models), prefix=prefix,
+                        encoding=encoding, timeout=_Timeout(budget))
+
+
+def _UseModels(ap, use_models):
+  """Returns the ModelData a Get of the AP is restricted to, None for all."""
+  if not use_models:
+    return None
+  if ap.vendor not in _USE_MODELS:
+    _USE_MODELS[ap.vendor] = gnmi_lib.ModelDataList(
+        constants.OC_MODEL_VERSIONS[ap.vendor])
+  return _USE_MODELS[ap.vendor]
+
+
+def _GetPathsFuture(ap, xpaths, data_type='ALL', use_models=False,
+                    encoding='JSON_IETF', budget=None):
+  """Sends a batched Get without waiting for the response, see GetPaths.
+
+  The outcome is recorded in the target's circuit breaker once the RPC
+  completes; a cancelled RPC is not recorded.
+
+  Returns:
+    grpc.Future whose result() is the gnmi_pb2.GetResponse.
+  """
+  username, password = _GetUserPass(ap.vendor, ap.credentials)
+  prefix, paths = _ParsePaths(ap, xpaths)
+  ap.stub = _GetStub(ap)
+  breaker = _Breaker(ap)
+  breaker.Check()
+  future = gnmi_lib.GetFuture(ap.stub, paths, username, password,
+                              data_type=data_type,
+                              use_models=_UseModels(ap, use_models),
+                              prefix=prefix, encoding=encoding,
+                              timeout=_Timeout(budget))
+
+  def _Done(done):
+    if not done.cancelled():
+      error = done.exception()
+      breaker.Record(error if isinstance(error, grpc.RpcError) else None)
+
+  future.add_done_callback(_Done)
+  return future
+
+
+def GetLeafValues(ap, leaf_xpaths, data_type='STATE', budget=None):
+  """Gets several leaves in one Get request and decodes them natively.
+
+  The leaves are requested in the AP's leaf encoding (see _LeafEncoding), so
+  with PROTO encoding the values arrive as scalar TypedValues and are decoded
+  without a JSON parser.
+
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    leaf_xpaths: (list) OpenConfig leaf paths.
+    data_type: (str) gNMI GetRequest data type.
+    budget: (Budget) time budget the RPC deadline is taken from.
+
+  Returns:
+    dict of normalized xpath (see gnmi_lib.NormalizeXpath) to Python value.
+  """
+  return _LeafValues(_GetLeaves(ap, leaf_xpaths, data_type=data_type,
+                                budget=budget))
+
+
+def _GetLeaves(ap, leaf_xpaths, data_type='STATE', fresh=False, budget=None):
+  """Gets leaves in the AP's leaf encoding, falling back to JSON_IETF.
+
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    leaf_xpaths: (list) OpenConfig leaf paths.
+    data_type: (str) gNMI GetRequest data type.
+    fresh: (bool) Whether to re-poll responses older than the last Set (see
+      _GetFreshPaths).
+    budget: (Budget) time budget the RPC deadline is taken from.
+
+  Returns:
+    gnmi_pb2.GetResponse object representing a gNMI GetResponse.
+  """
+  get = _GetFreshPaths if fresh else GetPaths
+  encoding = _LeafEncoding(ap, budget=budget)
+  try:
+    return get(ap, leaf_xpaths, data_type=data_type, use_models=True,
+               encoding=encoding, budget=budget)
+  except grpc.RpcError as e:
+    if encoding == 'JSON_IETF' or e.code() not in _ENCODING_FALLBACK_CODES:
+      raise
+    logging.info('AP %s rejected %s encoding (%s), using JSON_IETF',
+                 ap.ap_name, encoding, e.code())
+    ap.leaf_encoding = 'JSON_IETF'
+    with gnmi_metrics.Retry():
+      return get(ap, leaf_xpaths, data_type=data_type, use_models=True,
+                 encoding='JSON_IETF', budget=budget)
+
+
+def _LeafValues(gnmi_response):
+  """Returns {normalized xpath: decoded value} of every update in a response."""
+  values = {}
+  for notification in gnmi_response.notification:
+    for xpath, val in gnmi_lib.DecodeNotification(notification):
+      values[xpath] = gnmi_lib.DecodeTypedValue(val)
+  return values
+
+
+def _LeafEncoding(ap, budget=None):
+  """Returns the gNMI encoding used for leaf-level requests to the AP.
+
+  The vendor's encoding (see constants.GNMI_LEAF_ENCODINGS) is only used if
+  the AP's Capabilities advertise it, JSON_IETF otherwise.  The choice is kept
+  on the AP, like the JSON_IETF fallback after the AP rejected an encoding.
+
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    budget: (Budget) time budget the Capabilities RPC deadline is taken from.
+  """
+  if getattr(ap, 'leaf_encoding', None):
+    return ap.leaf_encoding
+  encoding = constants.GNMI_LEAF_ENCODINGS.get(ap.vendor, 'JSON_IETF')
+  if encoding != 'JSON_IETF' and encoding not in _SupportedEncodings(
+      ap, budget=budget):
+    logging.info('AP %s does not advertise %s encoding, using JSON_IETF',
+                 ap.ap_name, encoding)
+    encoding = 'JSON_IETF'
+  ap.leaf_encoding = encoding
+  return encoding
+
+
+def _SupportedEncodings(ap, budget=None):
+  """Returns the encodings the AP's Capabilities advertise, () if unknown."""
+  username, password = _GetUserPass(ap.vendor, ap.credentials)
+  ap.stub = _GetStub(ap)
+  try:
+    with _Rpc(ap, budget, 'Capabilities'):
+      response = gnmi_lib.Capabilities(ap.stub, username, password,
+                                       timeout=_Timeout(budget))
+  except grpc.RpcError as e:
+    logging.info('Capabilities of AP %s failed (%s)', ap.ap_name, e.code())
+    return ()
+  known = gnmi_pb2.Encoding.values()
+  return {gnmi_pb2.Encoding.Name(e) for e in response.supported_encodings
+          if e in known}
+
+
+@_Traced('path build')
+def _ParsePaths(ap, xpaths):
+  """Parses xpaths into gNMI Paths, sharing the AP host path as a prefix.
+
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    xpaths: (list) OpenConfig xpaths.
+
+  Returns:
+    (prefix, paths) tuple; prefix is None when the paths can not share the
+    AP's host path (or the AP is not known to apply prefixes, see _Set).
+  """
+  host_path = _HOST_PATH % ap.ap_name
+  supported = getattr(ap, 'prefix_support', None)
+  if supported is None:
+    supported = constants.GNMI_PREFIX_SUPPORT.get(ap.vendor, False)
+  if supported:
+    relative = []
+    for xpath in xpaths:
+      split = gnmi_lib.SplitXpath(xpath, host_path)
+      if split is None:
+        break
+      relative.append(gnmi_lib.ParsePath(gnmi_lib.PathNames(split[1])))
+    else:
+      if host_path not in _HOST_PREFIXES:
+        _HOST_PREFIXES[host_path] = gnmi_lib.ParsePath(
+            gnmi_lib.PathNames(host_path))
+      return _HOST_PREFIXES[host_path], relative
+  return None, [gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath))
+                for xpath in xpaths]
+
+
+@_Traced('stub acquisition')
+def _GetStub(ap):
+  """Returns a gNMI stub for the AP based on its vendor.
+
+  Stubs are pooled per vendor and target, so every RPC to a target shares one
+  channel (and its TLS session) and concurrent RPCs are multiplexed on it.
+
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+
+  Raises:
+    UnsupportedVendorError: If an AP is an unsupported vendor.
+  Returns:
+    gnmi_pb2_grpc.gNMIStub for the AP's gNMI target.
+  """
+  ap.targetport = constants.GNMI_TARGETPORTS[ap.vendor]
+  fake_target = os.environ.get('CHIDO_FAKE_TARGET')
+  cert = None
+  if fake_target:  # A local fake_ap target stands in for every vendor.
+    target, ap.targetport = fake_target.rsplit(':', 1)
+    # APs of a fleet served one per port (see fake_ap.ServeFleet).
+    ap.targetport = str(getattr(ap, 'fake_port', None) or ap.targetport)
+    host_override = None
+  elif ap.vendor == 'arista':
+    cert = constants.ARISTA_CA_CERT
+    target, host_override = ap.targetip, 'openconfig.mojonetworks.com'
   elif ap.vendor == 'aruba':
-    creds = gnmi_lib.CreateCreds(constants.ARUBA_CA_CERT)
-    ap.stub = gnmi_lib.CreateStub(
-        creds, ap.targetip, ap.targetport, 'OpenConfig.arubanetworks.com')
+    cert = constants.ARUBA_CA_CERT
+    target, host_override = ap.targetip, 'OpenConfig.arubanetworks.com'
   elif ap.vendor == 'mist':
-    creds = gnmi_lib.CreateCreds()
-    ap.stub = gnmi_lib.CreateStub(
-        creds, _MIST_GCP, ap.targetport, _MIST_GCP)
+    target, host_override = _MIST_GCP, _MIST_GCP
   else:
     raise UnsupportedVendorError(
         'Unsupported vendor for AP %s, vendor: %s' % (ap.ap_name, ap.vendor))
+  ap.gnmi_target = '%s:%s' % (target, ap.targetport)
+  key = (ap.vendor, ap.gnmi_target)
+  stub = _STUBS.get(key)
+  if stub is None:
+    interceptors = [gnmi_metrics.MetricsInterceptor(ap.vendor, ap.gnmi_target)]
+    if os.environ.get('CHIDO_REPLAY_DIR'):  # Answered from a cassette.
+      stub = gnmi_lib.CreateReplayStub(interceptors=interceptors)
+    else:
+      if os.environ.get('CHIDO_RECORD_DIR'):
+        interceptors.append(gnmi_lib.RecordingInterceptor())
+      creds = None if fake_target else gnmi_lib.CreateCreds(cert)
+      stub = gnmi_lib.CreateStub(creds, target, ap.targetport, host_override,
+                                 interceptors=interceptors)
+    stub = _STUBS.setdefault(key, stub)
+  return stub
+
+
+def _Sleep(seconds):
+  """Sleeps between polls, unless replaying a cassette as fast as possible."""
+  if os.environ.get('CHIDO_REPLAY_DIR'):
+    gnmi_lib.PLAYER.Sleep(seconds)
+  else:
+    time.sleep(seconds)
+
 
-  return gnmi_lib.Get(ap.stub, path, username, password)
+def SubscribePath(ap, xpaths, mode='STREAM', sub_mode='SAMPLE',
+                  sample_interval=10 * 10**9, use_aliases=True, aliases=None,
+                  encoding=None, budget=None):
+  """Subscribes to the given paths and yields every decoded update.
 
+  Aliases are negotiated by default, so long-lived counter subscriptions on deep
+  paths (eg. .../bssids/bssid/state/counters) do not repeat the full path in
+  every update.
 
-def SetConfig(ap, json_path='', xpath='', json_str=''):
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    xpaths: (list) OpenConfig paths to subscribe to.
+    mode: (str) SubscriptionList mode, one of STREAM, ONCE or POLL.
+    sub_mode: (str) Subscription mode, eg. TARGET_DEFINED, ON_CHANGE, SAMPLE.
+    sample_interval: (int) nanoseconds between samples in SAMPLE mode.
+    use_aliases: (bool) Whether the target may define aliases.
+    aliases: (dict) client-defined aliases, eg. {'#tx-mcs': xpath}.
+    encoding: (str) gNMI Encoding, defaults to the AP's leaf encoding.
+    budget: (Budget) time budget bounding the whole stream, unbounded if None.
+
+  Yields:
+    (xpath, value) tuples for every update received, values decoded with
+    gnmi_lib.DecodeTypedValue.
+  """
+  username, password = _GetUserPass(ap.vendor, ap.credentials)
+  prefix, paths = _ParsePaths(ap, xpaths)
+  ap.stub = _GetStub(ap)
+  alias_table = gnmi_lib.AliasTable()
+  responses = gnmi_lib.Subscribe(
+      ap.stub, paths, username, password, mode=mode, sub_mode=sub_mode,
+      sample_interval=sample_interval, use_aliases=use_aliases,
+      aliases=aliases, alias_table=alias_table, prefix=prefix,
+      encoding=encoding or _LeafEncoding(ap, budget=budget),
+      timeout=budget.Timeout() if budget else None)
+  with _Guarded(ap):
+    for response in responses:
+      if response.sync_response:
+        if mode == 'ONCE':
+          return
+        continue
+      for xpath, val in gnmi_lib.DecodeNotification(response.update,
+                                                    alias_table):
+        yield xpath, gnmi_lib.DecodeTypedValue(val)
+
+
+def SetConfig(ap, json_path='', xpath='', json_str='', budget=None):
   """Performs Set request and display response.
 
   If no xpath is provided _HOST_PATH is used.  Either json_path or json_str must
@@ -108,6 +728,7 @@ def SetConfig(ap, json_path='', xpath='', json_str=''):
     json_path: (str) full path to JSON file.
     xpath: (str) Explicit OpenConfig tree xpath.
     json_str: (str) A valid json string.
+    budget: (Budget) time budget the RPC deadline is taken from.
 
   Returns:
     ap.gnmi_set_status: (bool) whether the gNMI SET operation passed or failed.
@@ -121,34 +742,216 @@ def SetConfig(ap, json_path='', xpath='', json_str=''):
     raise ValueError('No valid path or json string provided to set config')
 
   payload = json.loads(json_data)
-  username, password = _GetUserPass(ap.vendor)
+  username, password = _GetUserPass(ap.vendor, ap.credentials)
 
-  if xpath:
-    paths = gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath))
-  else:
-    paths = gnmi_lib.ParsePath(gnmi_lib.PathNames((_HOST_PATH % ap.ap_name)))
+  ap.stub = _GetStub(ap)
 
-  if ap.vendor == 'arista':
-    creds = gnmi_lib.CreateCreds(constants.ARISTA_CA_CERT)
-    ap.stub = gnmi_lib.CreateStub(creds, ap.targetip, ap.targetport,
-                                  'openconfig.mojonetworks.com')
-  elif ap.vendor == 'aruba':
-    creds = gnmi_lib.CreateCreds(constants.ARUBA_CA_CERT)
-    ap.stub = gnmi_lib.CreateStub(creds, ap.targetip, ap.targetport,
-                                  'OpenConfig.arubanetworks.com')
-  elif ap.vendor == 'mist':
-    creds = gnmi_lib.CreateCreds()
-    ap.stub = gnmi_lib.CreateStub(creds, _MIST_GCP,
-                                  constants.GNMI_TARGETPORTS['mist'], _MIST_GCP)
+  config_response = _Set(ap, [xpath or _HOST_PATH % ap.ap_name],
+                         lambda prefix, paths: gnmi_lib.Set(
+                             ap.stub, paths[0], username, password, payload,
+                             _SET_UPDATE, prefix=prefix,
+                             timeout=_Timeout(budget)), budget=budget)
+  logging.info(_RESPONSE, config_response)
+  ap.gnmi_set_status = True
+
+  return ap.gnmi_set_status
+
+
+def SetLeaves(ap, xpath, leaf_values, budget=None):
+  """Performs a leaf-scoped Set request for the given leaves.
+
+  Leaves are sent in the AP's leaf encoding, scalar TypedValues for PROTO.  If
+  the target rejects those the leaves are re-sent as JSON_IETF values, and
+  JSON_IETF is remembered for the AP so later calls do not pay for the failed
+  attempt again.
 
-  config_response = gnmi_lib.Set(ap.stub, paths, username, password,
-                                 payload, _SET_UPDATE)
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    xpath: (str) OpenConfig config container xpath holding the leaves.
+    leaf_values: (dict) leaf name (as in the model, eg. 'channel-width') to
+      value.
+    budget: (Budget) time budget the RPC deadline is taken from.
+
+  Returns:
+    ap.gnmi_set_status: (bool) whether the gNMI SET operation passed or failed.
+  """
+  if not leaf_values:  # Nothing changed, nothing to send.
+    ap.gnmi_set_status = True
+    return ap.gnmi_set_status
+  username, password = _GetUserPass(ap.vendor, ap.credentials)
+  leaf_xpaths = [xpath.rstrip('/') + '/' + leaf for leaf in leaf_values]
+  ap.stub = _GetStub(ap)
+
+  def _Request(encoding):
+    return lambda prefix, paths: gnmi_lib.SetLeaves(
+        ap.stub, list(zip(paths, leaf_values.values())), username, password,
+        encoding=encoding, prefix=prefix, timeout=_Timeout(budget))
+
+  encoding = _LeafEncoding(ap, budget=budget)
+  try:
+    config_response = _Set(ap, leaf_xpaths, _Request(encoding), budget=budget)
+  except grpc.RpcError as e:
+    if encoding == 'JSON_IETF' or e.code() not in _ENCODING_FALLBACK_CODES:
+      raise
+    logging.info('AP %s rejected scalar leaf values (%s), using JSON_IETF',
+                 ap.ap_name, e.code())
+    ap.leaf_encoding = 'JSON_IETF'
+    with gnmi_metrics.Retry():
+      config_response = _Set(ap, leaf_xpaths, _Request('JSON_IETF'),
+                             budget=budget)
   logging.info(_RESPONSE, config_response)
   ap.gnmi_set_status = True
 
   return ap.gnmi_set_status
 
 
+def _Set(ap, xpaths, request, budget=None):
+  """Sends a Set of xpaths, re-sending it with full paths if the prefix was lost.
+
+  A target ignoring the request prefix applies the Set at the relative paths
+  without an error; its UpdateResults then are not at prefix + paths.  The Set
+  is re-sent with full paths, which the AP keeps using (see _ParsePaths).
+
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    xpaths: (list) the OpenConfig paths of the Set.
+    request: (callable) sends the Set given the prefix (None without one) and
+      the paths, returning the gnmi_pb2.SetResponse.
+    budget: (Budget) time budget the RPC is accounted to.
+
+  Returns:
+    gnmi_pb2.SetResponse of the Set.
+  """
+  prefix, paths = _ParsePaths(ap, xpaths)
+  start = time.time()
+  with _Rpc(ap, budget, 'Set'):
+    set_response = request(prefix, paths)
+  if prefix is not None and not _SetAtPaths(prefix, paths, set_response):
+    logging.warning('AP %s ignored the request prefix, using full paths',
+                    ap.ap_name)
+    ap.prefix_support = False
+    prefix, paths = _ParsePaths(ap, xpaths)
+    start = time.time()
+    with _Rpc(ap, budget, 'Set'), gnmi_metrics.Retry():
+      set_response = request(prefix, paths)
+  _RecordSet(ap, set_response, time.time() - start)
+  return set_response
+
+
+def _SetAtPaths(prefix, paths, set_response):
+  """Returns whether the results of a SetResponse are at prefix + paths.
+
+  Results without a path can not tell and are trusted.
+  """
+  expected = {gnmi_lib.JoinXpaths(gnmi_lib.PathToXpath(prefix),
+                                  gnmi_lib.PathToXpath(path))
+              for path in paths}
+  response_prefix = gnmi_lib.PathToXpath(set_response.prefix)
+  for result in set_response.response:
+    xpath = gnmi_lib.PathToXpath(result.path)
+    if xpath != '/' and gnmi_lib.JoinXpaths(response_prefix,
+                                            xpath) not in expected:
+      return False
+  return True
+
+
+def _RecordSet(ap, set_response, rtt):
+  """Records when the last Set was applied and how long the RPC took.
+
+  The SetResponse timestamp is taken from the AP's clock, like the notification
+  timestamps it is later compared with.  The local clock is not a substitute
+  (it may be skewed), so targets that leave it unset get no staleness check.
+
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    set_response: (gnmi_pb2.SetResponse) response to the Set.
+    rtt: (float) seconds the Set RPC took, as seen by the client.
+  """
+  ap.last_set_ns = set_response.timestamp
+  ap.last_set_rtt = rtt
+  ap.last_set_time = time.time() - rtt
+  logging.info('Set RPC to AP %s took %.3fs', ap.ap_name, rtt)
+
+
+def _ResponseTimestamp(gnmi_response):
+  """Returns the newest notification timestamp (ns) in a response, or 0."""
+  return max((n.timestamp for n in gnmi_response.notification), default=0)
+
+
+def _GetFreshPath(ap, xpath, data_type='STATE', budget=None):
+  """Gets a path, re-polling briefly while the response predates the last Set.
+
+  See _GetFreshPaths.
+  """
+  return _GetFreshPaths(ap, [xpath], data_type=data_type, use_models=True,
+                        budget=budget)
+
+
+def _GetFreshPaths(ap, xpaths, data_type='STATE', use_models=False,
+                   encoding='JSON_IETF', polls=_STALE_POLLS,
+                   poll_delay=_STALE_POLL_DELAY, budget=None):
+  """Gets paths, re-polling briefly while the response predates the last Set.
+
+  A target may answer from a cache that has not caught up with the Set yet;
+  comparing against that only leads to a mismatch and a long retry delay.
+  Responses without timestamps, or when no Set was recorded, are accepted.
+
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    xpaths: (list) the OpenConfig paths to get in one request.
+    data_type: (str) gNMI GetRequest data type.
+    use_models: (bool) Whether to restrict the response to the AP's models.
+    encoding: (str) gNMI Encoding, eg. JSON_IETF or PROTO.
+    polls: (int) Gets sent before giving up on stale responses.
+    poll_delay: (float) seconds between them.
+    budget: (Budget) time budget of the operation.
+
+  Raises:
+    StaleStateError: If every response predates the last Set.
+  Returns:
+    gnmi_pb2.GetResponse object representing a gNMI GetResponse.
+  """
+  since = getattr(ap, 'last_set_ns', 0)
+  for _ in range(polls):
+    gnmi_response = GetPaths(ap, xpaths, data_type=data_type,
+                             use_models=use_models, encoding=encoding,
+                             budget=budget)
+    stamp = _ResponseTimestamp(gnmi_response)
+    if not since or not stamp or stamp >= since:
+      return gnmi_response
+    logging.info('State of %s on AP %s is %.3fs older than the last Set',
+                 ', '.join(xpaths), ap.ap_name, (since - stamp) / 1e9)
+    with _Phase(budget, 'retry sleep', reason='stale'):
+      _Sleep(poll_delay)
+  raise StaleStateError('State of %s on AP %s predates the last Set' %
+                        (', '.join(xpaths), ap.ap_name))
+
+
+def _RecordApplyLatency(ap, gnmi_response):
+  """Records the AP-side apply latency once state matches the last Set.
+
+  This is the notification timestamp minus the Set timestamp, both from the
+  AP's clock, and is reported separately from the Set RPC round trip.
+
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    gnmi_response: (gnmi_pb2.GetResponse) the state response that matched.
+  """
+  since = getattr(ap, 'last_set_ns', 0)
+  stamp = _ResponseTimestamp(gnmi_response)
+  if not since or not stamp:
+    return
+  ap.apply_latency = max(stamp - since, 0) / 1e9
+  logging.info('AP %s applied config in %.3fs (Set RPC round trip %.3fs)',
+               ap.ap_name, ap.apply_latency, getattr(ap, 'last_set_rtt', 0))
+
+
+def _ChangedLeafs(previous, current):
+  """Returns the items of the current leaf dict that differ from previous."""
+  return {leaf: value for leaf, value in current.items()
+          if previous.get(leaf) != value}
+
+
 def _GetContainer(ap, container):
   """Returns an OC Object (YANGBaseClass) given a container name.
 
@@ -217,11 +1020,12 @@ def GetContainerFromJson(ap, json_path, container):
   with open(json_path, 'rt') as data_file:
     json_data = data_file.read()
 
-  return pybindJSONDecoder.load_ietf_json(json.loads(json_data), None,
-                                          None, obj=container.config)
+  return _LoadIetf(json.loads(json_data), container.config)
 
 
-def CycleChannels(ap, radio_obj, five_g=True, width=20):
+@_LabelRpcs('radios')
+def CycleChannels(ap, radio_obj, five_g=True, width=20, leaf_set=True,
+                  state_fetch='container', budget=None):
   """Cycles through all available channels.
 
   Channels are set on the object and config is sent to the AP.  Config leaf is
@@ -229,17 +1033,26 @@ def CycleChannels(ap, radio_obj, five_g=True, width=20):
   It takes roughly ~50 secs per channel or ~22 minutes for all 20MHz.  Varies
   per vendor.
 
+  The first channel is sent as the full radio container; with leaf_set, later
+  channels only send the leaves that changed (see SetLeaves).
+
   Args:
     ap: (object) chido_test.ApObject containing all AP attributes.
     radio_obj: (YANGBaseClass) OC radio container object.
     five_g: (bool) Whether target is 5GHz radio.
     width: (int) Channel width, eg. 20, 40, 80.
+    leaf_set: (bool) Whether to send only the changed leaves after the first
+      channel.
+    state_fetch: (str) how state is fetched, see _VerifyContainerState.
+    budget: (Budget) time budget for the whole cycle, by default every channel
+      gets a budget of its own.
   """
   ap.radio_id = '0' if five_g else '1'
   ap.radio_freq = 'FREQ_5GHZ' if five_g else 'FREQ_2GHZ'
   path = _GetPathByContainer(ap, 'radios')
 
   channels = _GetChannelSet(five_g, width)
+  sent = None
   for channel in channels:
     logging.info('Setting radio id %s to channel %s', ap.radio_id, channel)
     if not five_g:
@@ -248,51 +1061,87 @@ def CycleChannels(ap, radio_obj, five_g=True, width=20):
     radio_obj.channel_width = width
     radio_obj.channel = channel
     radio_obj.id = ap.radio_id
-    json_str = pybindJSON.dumps(radio_obj, mode='ietf')
-    SetConfig(ap, xpath=path, json_str=json_str)
-    _VerifyRadioContainer(ap, radio_obj, five_g)
-
-
-def CycleTransmitPowers(ap, radio_obj, power_levels, five_g=True):
+    leafs = {'channel-width': width, 'channel': channel}
+    step_budget = budget or Budget(_DEFAULT_BUDGET)
+    if leaf_set and sent is not None:
+      SetLeaves(ap, path, _ChangedLeafs(sent, leafs), budget=step_budget)
+    else:
+      json_str = _Dumps(radio_obj)
+      SetConfig(ap, xpath=path, json_str=json_str, budget=step_budget)
+    sent = leafs
+    _VerifyRadioContainer(ap, radio_obj, five_g, leaf='channel',
+                          value=channel, state_fetch=state_fetch,
+                          budget=step_budget)
+
+
+@_LabelRpcs('radios')
+def CycleTransmitPowers(ap, radio_obj, power_levels, five_g=True,
+                        leaf_set=True, state_fetch='container', budget=None):
   """Cycles through the given power_levels.
 
   Powers are set on the object and config is sent to the AP.  Config leaf is
   then verified, followed by comparing all values in the state leaf vs config.
 
+  The first power level is sent as the full radio container; with leaf_set,
+  later levels only send the transmit-power leaf (see SetLeaves).
+
   Args:
     ap: (object) chido_test.ApObject containing all AP attributes.
     radio_obj: (YANGBaseClass) OC radio container object.
     power_levels: (list) integers representing the radio transmit-power.
     five_g: (bool) Whether target is 5GHz radio.
+    leaf_set: (bool) Whether to send only the changed leaves after the first
+      power level.
+    state_fetch: (str) how state is fetched, see _VerifyContainerState.
+    budget: (Budget) time budget for the whole cycle, by default every power
+      level gets a budget of its own.
   """
   ap.radio_id = '0' if five_g else '1'
   ap.radio_freq = 'FREQ_5GHZ' if five_g else 'FREQ_2GHZ'
   path = _GetPathByContainer(ap, 'radios')
 
+  sent = None
   for power in power_levels:
     logging.info('Setting radio id %s to transmit-power %s', ap.radio_id, power)
     if not five_g:
       radio_obj.id = ap.radio_id
       radio_obj.operating_frequency = ap.radio_freq
     radio_obj.transmit_power = power
-    json_str = pybindJSON.dumps(radio_obj, mode='ietf')
-    SetConfig(ap, xpath=path, json_str=json_str)
-    logging.info('Sent power of %s as %s to %s', power, json_str, path)
-    _VerifyRadioContainer(ap, radio_obj, five_g)
-
-
-@retry(exceptions=_ACCEPTABLE_ERRORS2, tries=30, delay=10, max_delay=300)
-def DisableRadio(ap, radio_obj, five_g=True):
+    leafs = {'transmit-power': power}
+    step_budget = budget or Budget(_DEFAULT_BUDGET)
+    if leaf_set and sent is not None:
+      SetLeaves(ap, path, _ChangedLeafs(sent, leafs), budget=step_budget)
+      logging.info('Sent power of %s as a leaf to %s', power, path)
+    else:
+      json_str = _Dumps(radio_obj)
+      SetConfig(ap, xpath=path, json_str=json_str, budget=step_budget)
+      logging.info('Sent power of %s as %s to %s', power, json_str, path)
+    sent = leafs
+    _VerifyRadioContainer(ap, radio_obj, five_g, leaf='transmit-power',
+                          value=power, state_fetch=state_fetch,
+                          budget=step_budget)
+
+
+@_LabelRpcs('radios')
+@_Budgeted()
+@_PollUntilConverged(_ACCEPTABLE_ERRORS2, container='radios', leaf='enabled',
+                     sets_config=True)
+@_FailFast
+def DisableRadio(ap, radio_obj, five_g=True, budget=None):
   """Disables radio.
 
   Args:
     ap: (object) chido_test.ApObject containing all AP attributes.
     radio_obj: (YANGBaseClass) OC radio container object.
     five_g: (bool) Whether target is 5GHz radio.
+    budget: (Budget) time budget shared by all attempts.
 
   Raises:
     ConfigError: if radio config does not match.
     StateMismatchError: if the radio did not get disabled.
+    BudgetExhaustedError: if the budget ran out before the radio was disabled.
+    FatalRpcError: if an RPC failed in a way retrying will not fix.
+    gnmi_lib.CircuitOpenError: if the AP's target stopped answering.
   """
   ap.radio_id = '0' if five_g else '1'
   ap.radio_freq = 'FREQ_5GHZ' if five_g else 'FREQ_2GHZ'
@@ -304,33 +1153,34 @@ def DisableRadio(ap, radio_obj, five_g=True):
     radio_obj.operating_frequency = ap.radio_freq
     radio_obj.channel = 1
   radio_obj.enabled = False
-  json_str = pybindJSON.dumps(radio_obj, mode='ietf')
-  SetConfig(ap, xpath=path, json_str=json_str)
-  expected_config = pybindJSON.dumps(radio_obj, mode='ietf')  # string format.
+  json_str = _Dumps(radio_obj)
+  SetConfig(ap, xpath=path, json_str=json_str, budget=budget)
+  expected_config = _Dumps(radio_obj)  # string format.
   # We reset path in case some parameters changed based above.
   path = _GetPathByContainer(ap, 'radios')
 
-  gnmi_response = GetPath(ap, path)
-  json_bytes = gnmi_response.notification[0].update[0].val.json_ietf_val
-  json_bytes = json_bytes.replace(b'openconfig-wifi-types:', b'')
-  retrieved_config_obj = pybindJSONDecoder.load_ietf_json(
-      json.loads(json_bytes), None, None, obj=radio_obj)
-  retrieved_config = pybindJSON.dumps(retrieved_config_obj, mode='ietf')
+  gnmi_response = GetPath(ap, path, data_type='CONFIG', use_models=True,
+                          budget=budget)
+  with _Phase(budget, 'decode'):
+    json_dict = _ResponseJson(gnmi_response, path)
+    retrieved_config_obj = _LoadIetf(json_dict, radio_obj)
+    retrieved_config = _Dumps(retrieved_config_obj)
   if expected_config != retrieved_config:
     logging.info(expected_config)
     logging.info(retrieved_config)
     raise ConfigError('Radio "%s" config does not match config sent' %
                       ap.radio_id)
+  _ConfigMatched(ap)
 
   path = path.replace('/config', '/state')
   radio = _GetContainer(ap, 'radios')
-  gnmi_response = GetPath(ap, path)
-  json_bytes = gnmi_response.notification[0].update[0].val.json_ietf_val
-  json_bytes = json_bytes.replace(b'openconfig-wifi-types:', b'')
-  radio_state = pybindJSONDecoder.load_ietf_json(
-      json.loads(json_bytes), None, None, obj=radio.state)
+  gnmi_response = _GetFreshPath(ap, path, budget=budget)
+  with _Phase(budget, 'decode'):
+    json_dict = _ResponseJson(gnmi_response, path)
+    radio_state = _LoadIetf(json_dict, radio.state)
   if radio_state.enabled:
     raise StateMismatchError('Radio %s not disabled')
+  _RecordApplyLatency(ap, gnmi_response)
 
   logging.info('Radio "%s" was disabled', ap.radio_id)
 
@@ -340,8 +1190,9 @@ def CheckPortIsOpen(ap, port=22):
   # Note: This is an integration test, consider moving to integration section.
   try:
     s = socket.create_connection((ap.ap_name, port), 5)
-  except socket.timeout:
-    logging.info('Timeout connecting to port %s on AP: %s', port, ap.ap_name)
+  except OSError as e:  # Timeouts, refused connections and unknown hosts.
+    logging.info('Unable to connect to port %s on AP %s: %s', port, ap.ap_name,
+                 e)
     return False
   else:
     s.close()
@@ -349,27 +1200,89 @@ def CheckPortIsOpen(ap, port=22):
   return True
 
 
-def ValidateJoinedAPs(ap):
+@_LabelRpcs('joined-aps')
+def ValidateJoinedAPs(ap, joined_aps=None, budget=None):
   """Validates the joined-aps adheres to schema and returns a state object.
 
   Args:
     ap: (object) chido_test.ApObject containing all AP attributes.
+    joined_aps: (YANGBaseClass) GetJoinedAPs of the AP's manager, to take the
+      state from instead of a Get of the AP's own joined-ap.
+    budget: (Budget) time budget the RPC deadline is taken from.
 
   Returns:
     YANGBaseClass object with data from the JSON /joined-aps/ state response.
+
+  Raises:
+    StateMismatchError: When the AP is not in joined_aps.
   """
+  if joined_aps is not None:
+    if ap.ap_name not in joined_aps.joined_ap:
+      raise StateMismatchError('AP %s is not joined to its AP manager' %
+                               ap.ap_name)
+    return joined_aps.joined_ap[ap.ap_name].state
   joined_aps_obj = _GetContainer(ap, 'joined-aps')
   path = '/joined-aps/joined-ap[hostname=%s]/state' % ap.ap_name
-  gnmi_response = GetPath(ap, path)
-  json_bytes = gnmi_response.notification[0].update[0].val.json_ietf_val
-  json_bytes = json_bytes.replace(b'openconfig-wifi-types:', b'')
-  state = pybindJSONDecoder.load_ietf_json(
-      json.loads(json_bytes), None, None, obj=joined_aps_obj.state)
+  gnmi_response = GetPath(ap, path, data_type='STATE', use_models=True,
+                          budget=budget)
+  json_dict = _ResponseJson(gnmi_response, path)
+  state = _LoadIetf(json_dict, joined_aps_obj.state)
 
   return state
 
 
-def ValidateContainer(ap, container):
+@_LabelRpcs('joined-aps')
+def GetJoinedAPs(ap, budget=None):
+  """Returns the joined-aps of an AP manager, from one Get of /joined-aps.
+
+  The response is deserialized with the ap_manager binding, so the whole list
+  adheres to schema.
+
+  Args:
+    ap: (object) chido_test.ApObject of the AP manager, ie. any AP reached
+      through it (eg. the Mist cloud, or an Arista AP for itself).
+    budget: (Budget) time budget the RPC deadline is taken from.
+
+  Returns:
+    YANGBaseClass joined-aps object, its joined_ap list keyed by hostname.
+  """
+  joined_aps_obj = ap_manager.openconfig_ap_manager().joined_aps
+  gnmi_response = GetPath(ap, _JOINED_APS_PATH, data_type='STATE',
+                          use_models=True, budget=budget)
+  _LoadIetf(_ResponseJson(gnmi_response, _JOINED_APS_PATH), joined_aps_obj)
+  return joined_aps_obj
+
+
+def DiscoverJoinedAPs(ap, joined_aps=None, budget=None):
+  """Returns the APs joined to an AP manager as an inventory.
+
+  Args:
+    ap: (object) chido_test.ApObject of the AP manager, see GetJoinedAPs.
+    joined_aps: (YANGBaseClass) GetJoinedAPs of the manager, Get if None.
+    budget: (Budget) time budget the RPC deadline is taken from.
+
+  Returns:
+    inventory.Inventory with an inventory.ApRecord per joined AP, with the
+    vendor and credentials of ap.  Fields the AP does not report are None,
+    rather than the defaults of an inventory file.
+  """
+  if joined_aps is None:
+    joined_aps = GetJoinedAPs(ap, budget=budget)
+  records = []
+  for hostname, joined_ap in joined_aps.joined_ap.items():
+    state = joined_ap.state
+    records.append(inventory.ApRecord(
+        hostname=hostname, vendor=ap.vendor, credentials=ap.credentials,
+        targetip=state.ipv4, targetipv6=state.ipv6, mac=state.mac.upper(),
+        model=state.model, serial=state.serial,
+        firmware=state.software_version, opstate=state.opstate,
+        power_source=state.power_source))
+  logging.info('Discovered %d APs joined to %s', len(records), ap.ap_name)
+  return inventory.Inventory(records)
+
+
+@_LabelRpcs()
+def ValidateContainer(ap, container, budget=None):
   """Validates a container adheres to schema and returns a state object.
 
   # TODO(xavier):  This function should aim to replace ValidateJoinedAPs.
@@ -377,6 +1290,7 @@ def ValidateContainer(ap, container):
   Args:
     ap: (object) chido_test.ApObject containing all AP attributes.
     container: (str) a supported container within the model.
+    budget: (Budget) time budget the RPC deadline is taken from.
 
   Returns:
     YANGBaseClass object with data from the JSON state response.
@@ -387,20 +1301,19 @@ def ValidateContainer(ap, container):
   if '/config' in path:
     has_state = True
     path = path.replace('/config', '/state')
-  gnmi_response = GetPath(ap, path)
-  json_bytes = gnmi_response.notification[0].update[0].val.json_ietf_val
-  json_bytes = json_bytes.replace(b'openconfig-wifi-types:', b'')
+  gnmi_response = GetPath(ap, path, data_type='STATE' if has_state else 'ALL',
+                          use_models=True, budget=budget)
+  json_dict = _ResponseJson(gnmi_response, path)
   if has_state:
-    state = pybindJSONDecoder.load_ietf_json(
-        json.loads(json_bytes), None, None, obj=container_obj.state)
+    state = _LoadIetf(json_dict, container_obj.state)
   else:
-    state = pybindJSONDecoder.load_ietf_json(
-        json.loads(json_bytes), None, None, obj=container_obj)
+    state = _LoadIetf(json_dict, container_obj)
   # print(pybindJSON.dumps(state, mode='ietf'))
 
   return state
 
 
+@_Traced('path build')
 def _GetPathByContainer(ap, container):
   """Returns OC config path based on a container name.
 
@@ -445,7 +1358,10 @@ def _GetPathByContainer(ap, container):
     return '/provision-aps/provision-ap[mac=%s]/config' % ap.mac.upper()
 
 
-def SetContainer(ap, container, config_obj):
+@_LabelRpcs()
+@_Budgeted()
+def SetContainer(ap, container, config_obj, state_fetch='container',
+                 budget=None):
   """Sets a container config and verifies it based on config obj provided.
 
   This function works where setting and verifying the container does not require
@@ -457,24 +1373,32 @@ def SetContainer(ap, container, config_obj):
     ap: (object) chido_test.ApObject containing all AP attributes.
     container: (str) a supported container within the model.
     config_obj: (YANGBaseClass) OC config object matching the container.
+    state_fetch: (str) how state is fetched, see _VerifyContainerState.
+    budget: (Budget) time budget for setting and verifying the container.
   Raises:
     ConfigError: If the config leaf does not match config sent.
+    BudgetExhaustedError: If the budget ran out before state converged.
   """
   path = _GetPathByContainer(ap, container)
-  json_str = pybindJSON.dumps(config_obj, mode='ietf')
-  SetConfig(ap, xpath=path, json_str=json_str)
-  expected_config = pybindJSON.dumps(config_obj, mode='ietf')
-  gnmi_response = GetPath(ap, path)
-
-  json_bytes = gnmi_response.notification[0].update[0].val.json_ietf_val
-  json_bytes = json_bytes.replace(b'openconfig-wifi-types:', b'')
-  retrieved_config_obj = pybindJSONDecoder.load_ietf_json(
-      json.loads(json_bytes), None, None, obj=config_obj)
-  retrieved_config = pybindJSON.dumps(retrieved_config_obj, mode='ietf')
-  if expected_config != retrieved_config:
-    logging.info('Expected:\n%s', expected_config)
-    logging.info('Retrieved:\n%s', retrieved_config)
-    raise ConfigError('Container config does not match config sent')
+  json_str = _Dumps(config_obj)
+  SetConfig(ap, xpath=path, json_str=json_str, budget=budget)
+  expected_config = _Dumps(config_obj)
+  gnmi_response, state_future = _GetConfigAndState(
+      ap, path, expected_config, state_fetch, budget=budget)
+
+  try:
+    with _Phase(budget, 'decode'):
+      json_dict = _ResponseJson(gnmi_response, path)
+      retrieved_config_obj = _LoadIetf(json_dict, config_obj)
+      retrieved_config = _Dumps(retrieved_config_obj)
+    if expected_config != retrieved_config:
+      logging.info('Expected:\n%s', expected_config)
+      logging.info('Retrieved:\n%s', retrieved_config)
+      raise ConfigError('Container config does not match config sent')
+  except Exception:
+    state_future.cancel()  # The state is moot while config does not match.
+    raise
+  _ConfigMatched(ap)
 
   # Now verify the state.
   path = path.replace('/config', '/state')
@@ -484,14 +1408,83 @@ def SetContainer(ap, container, config_obj):
   leafs = [l.replace('openconfig-access-points:', '').replace(
       'openconfig-ap-manager:', '').replace('-', '_')
            for l in configured_keys]
-  _VerifyContainerState(ap, container, path, leafs, retrieved_config_obj)
+  _VerifyContainerState(ap, container, path, leafs, retrieved_config_obj,
+                        state_fetch=state_fetch, prefetched=state_future,
+                        budget=budget)
 
 
-@retry(exceptions=_ACCEPTABLE_ERRORS, tries=30, delay=10, max_delay=300)
-def _VerifyContainerState(ap, container, path, leafs, config_obj):
+def _GetConfigAndState(ap, path, expected_config, state_fetch, budget=None):
+  """Gets a config container while its state is fetched concurrently.
+
+  Both reads go out at once on the target's pooled channel, so verifying the
+  state does not wait another round trip after the config check.  The caller
+  cancels the state read if the config does not match.
+
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    path: (str) Explicit OpenConfig tree config xpath.
+    expected_config: (str) JSON_IETF config that was sent.
+    state_fetch: (str) 'container' or 'leaves', see _VerifyContainerState.
+    budget: (Budget) time budget the RPC deadlines are taken from.
+
+  Returns:
+    (gnmi_pb2.GetResponse of the config, grpc.Future of the state response).
+  """
+  state_path = path.replace('/config', '/state')
+  if state_fetch == 'leaves':
+    state_xpaths = [state_path.rstrip('/') + '/' + key.split(':', 1)[-1]
+                    for key in sorted(json.loads(expected_config))]
+    encoding = _LeafEncoding(ap, budget=budget)
+  else:
+    state_xpaths, encoding = [state_path], 'JSON_IETF'
+  state_future = _GetPathsFuture(ap, state_xpaths, data_type='STATE',
+                                 use_models=True, encoding=encoding,
+                                 budget=budget)
+  try:
+    return (GetPath(ap, path, data_type='CONFIG', use_models=True,
+                    budget=budget), state_future)
+  except Exception:
+    state_future.cancel()
+    raise
+
+
+def _PrefetchedState(ap, tracker, budget=None):
+  """Returns the concurrently fetched first state poll, None if unusable.
+
+  The response is dropped when its RPC failed (the regular poll then handles
+  the error) or when it predates the last Set.
+  """
+  future, tracker.prefetched = tracker.prefetched, None
+  if future is None:
+    return None
+  try:
+    with _Phase(budget, 'rpc:Get'):
+      gnmi_response = future.result()
+  except grpc.RpcError as e:
+    logging.info('Concurrent state Get to AP %s failed (%s), polling again',
+                 ap.ap_name, e.code())
+    return None
+  since = getattr(ap, 'last_set_ns', 0)
+  stamp = _ResponseTimestamp(gnmi_response)
+  if since and stamp and stamp < since:
+    return None
+  return gnmi_response
+
+
+@_Budgeted()
+def _VerifyContainerState(ap, container, path, leafs, config_obj, leaf=None,
+                          value=None, state_fetch='container', prefetched=None,
+                          budget=None):
   """Verifies a given OC container given a list of leaves.
 
-  The check is retried using a fuzzy incremental backoff.
+  The check is retried with delays learned from earlier convergence times (see
+  convergence.Scheduler) until it passes or the budget is exhausted.  With the
+  'container' state_fetch the first poll gets the whole state container and
+  validates it against the schema.  With 'leaves' the first poll only gets the
+  configured leaf paths, in one Get, and compares their scalar values; counters
+  and other subtrees of the state container are never transferred or decoded.
+  Either way later polls only get the leaves that have not converged yet (see
+  LeafTracker).
 
   Args:
     ap: (object) chido_test.ApObject containing all AP attributes.
@@ -499,42 +1492,179 @@ def _VerifyContainerState(ap, container, path, leafs, config_obj):
     path: (str) Explicit OpenConfig tree state xpath.
     leafs: (list) Every leaf configured to verify against state.
     config_obj: (YANGBaseClass) OC config container object from AP.
+    leaf: (str) the changed leaf convergence is learned for, '*' if None.
+    value: (object) the value the leaf was set to, a label of the measurement.
+    state_fetch: (str) 'container' or 'leaves', see above.
+    prefetched: (grpc.Future) the first state poll, already sent by
+      _GetConfigAndState.
+    budget: (Budget) time budget shared by all attempts.
   Raises:
-    StateMismatchError: When a state leaf does not match expected values.
-  """
-  yang_obj = _GetContainer(ap, container)
-  gnmi_response = GetPath(ap, path)
-  json_bytes = gnmi_response.notification[0].update[0].val.json_ietf_val
-  json_bytes = json_bytes.replace(b'openconfig-wifi-types:', b'')
-  state_obj = pybindJSONDecoder.load_ietf_json(
-      json.loads(json_bytes), None, None, obj=yang_obj.state)
+    StateMismatchError: When state leaves do not match expected values, listing
+      every one of them.
+    ValueError: When state_fetch is not a known mode.
+    BudgetExhaustedError: When the budget ran out, with a per-phase report.
+    FatalRpcError: When an RPC failed in a way retrying will not fix.
+    gnmi_lib.CircuitOpenError: When the AP's target stopped answering.
+  """
+  if state_fetch not in _STATE_FETCH_MODES:
+    raise ValueError('Unknown state fetch mode "%s"' % state_fetch)
+  tracker = LeafTracker(ap, path, _ExpectedLeafs(config_obj, leafs))
+  tracker.prefetched = prefetched
+  _PollContainerState(ap, container, tracker, leaf=leaf, value=value,
+                      whole_container=state_fetch == 'container',
+                      budget=budget)
+  logging.info('Config leafs matched in state for AP %s: %s', ap.ap_name,
+               tracker.Report())
+
+
+@_PollUntilConverged(_ACCEPTABLE_ERRORS)
+@_FailFast
+def _PollContainerState(ap, container, tracker, leaf=None, value=None,
+                        whole_container=True, budget=None):
+  """Polls the state once, raising StateMismatchError until all converged.
+
+  Args:
+    ap: (object) chido_test.ApObject containing all AP attributes.
+    container: (str) name of the container to be verified.
+    tracker: (LeafTracker) the leaves to verify and their progress.
+    leaf: (str) the changed leaf, see _PollUntilConverged.
+    value: (object) the value the leaf was set to, see _PollUntilConverged.
+    whole_container: (bool) Whether the first poll gets the whole container.
+    budget: (Budget) time budget shared by all attempts.
+  """
+  del leaf, value  # Only labels of the measurement.
+  gnmi_response = _PrefetchedState(ap, tracker, budget=budget)
+  if whole_container and not tracker.polls:
+    yang_obj = _GetContainer(ap, container)
+    if gnmi_response is None:
+      gnmi_response = _GetFreshPath(ap, tracker.path, budget=budget)
+    with _Phase(budget, 'decode'):
+      json_dict = _ResponseJson(gnmi_response, tracker.path)
+      state_obj = _LoadIetf(json_dict, yang_obj.state)
+      values = _IetfLeafs(state_obj)
+  else:
+    if gnmi_response is None:
+      gnmi_response = _GetLeaves(ap, tracker.PendingXpaths(), fresh=True,
+                                 budget=budget)
+    with _Phase(budget, 'decode'):
+      values = _PolledLeafs(gnmi_response)
   # Verify the configured values to the state values.
-  _CompareLeafs(ap, leafs, config_obj, state_obj)
+  with _Phase(budget, 'compare'):
+    tracker.Update(values)
+    tracker.Check()
+  _RecordApplyLatency(ap, gnmi_response)
+
+
+def _PolledLeafs(gnmi_response):
+  """Returns {leaf name: value} of a Get of leaf paths.
+
+  Targets answering a leaf path with a JSON object of its parent container are
+  handled too.
+  """
+  values = {}
+  for xpath, value in _LeafValues(gnmi_response).items():
+    name = xpath.rsplit('/', 1)[-1].split(':', 1)[-1]
+    if isinstance(value, dict):
+      values.update((key.split(':', 1)[-1], val) for key, val in value.items())
+    else:
+      values[name] = value
+  return values
+
 
+def _IetfLeafs(container_obj):
+  """Returns {leaf name: JSON_IETF value} of a binding, without module names."""
+  return {key.split(':', 1)[-1]: value for key, value in json.loads(
+      _Dumps(container_obj)).items()}
 
-def _CompareLeafs(ap, leafs, config_container, state_container):
-  """Compares leafs in a container from config vs state.
 
-  The expectation is that all configured leafs must match state leafs values.
+def _ExpectedLeafs(config_obj, leafs):
+  """Returns {leaf name: configured JSON_IETF value} of the given leafs.
 
   Args:
-    ap: (object) chido_test.ApObject containing all AP attributes.
-    leafs: (list) Every leaf name configured to verify against state.
-    config_container: (YANGBaseClass) OC config container object.
-    state_container: (YANGBaseClass) OC state container object.
+    config_obj: (YANGBaseClass) OC config container object.
+    leafs: (list) binding attribute names, eg. 'channel_width'.
+  """
+  attrs = set(leafs)
+  return {name: value for name, value in _IetfLeafs(config_obj).items()
+          if name.replace('-', '_') in attrs}
 
-  Raises:
-    StateMismatchError: When a state leaf does not match expected values.
+
+def _LeafScalar(value):
+  """Normalizes a leaf value so JSON_IETF and PROTO decoded values compare.
+
+  Identities lose their module name, numbers and decimals compare by their
+  string form (JSON_IETF sends 64-bit integers as strings) and leaf-lists
+  element-wise.
   """
-  for leaf in leafs:
-    c_val = getattr(config_container, leaf)
-    s_val = getattr(state_container, leaf)
-    if c_val != s_val:
-      logging.info('Leaf "%s" mismatch on AP %s.  Expected "%s", '
-                   'got "%s"', leaf, ap.ap_name, c_val, s_val)
-      raise StateMismatchError('Leaf "%s" mismatch on AP %s.  Expected "%s", '
-                               'got "%s"' % (leaf, ap.ap_name, c_val, s_val))
-  logging.info('Config leafs matched in state for AP %s: %s', ap.ap_name, leafs)
+  if isinstance(value, (list, tuple)):
+    return tuple(_LeafScalar(v) for v in value)
+  if isinstance(value, bool) or value is None:
+    return value
+  if isinstance(value, bytes):
+    value = value.decode('utf8')
+  return _RE_MODULE_PREFIX.sub('', str(value))
+
+
+class LeafTracker(object):
+  """Tracks which configured leaves of a state container have converged."""
+
+  def __init__(self, ap, path, expected):
+    """Initializes a LeafTracker.
+
+    Args:
+      ap: (object) chido_test.ApObject containing all AP attributes.
+      path: (str) the state container xpath.
+      expected: (dict) leaf name to the configured value.
+    """
+    self.ap = ap
+    self.path = path
+    self.expected = expected
+    self.pending = set(expected)
+    self.converged = {}  # Leaf name -> seconds from the start to converge.
+    self.last = {}  # Leaf name -> value of the latest poll.
+    self.polls = 0
+    self.start = getattr(ap, 'last_set_time', None) or time.time()
+    self.prefetched = None  # grpc.Future of the first poll, if already sent.
+
+  def PendingXpaths(self):
+    """Returns the xpaths of the leaves that have not converged."""
+    return [self.path.rstrip('/') + '/' + leaf for leaf in sorted(self.pending)]
+
+  def Update(self, values):
+    """Records a poll of the state.
+
+    Args:
+      values: (dict) leaf name to state value; leaves missing from it are not
+        populated in state yet.
+    """
+    self.polls += 1
+    elapsed = time.time() - self.start
+    for leaf in sorted(self.pending):
+      self.last[leaf] = values.get(leaf)
+      if _LeafScalar(self.last[leaf]) == _LeafScalar(self.expected[leaf]):
+        self.converged[leaf] = elapsed
+        self.pending.discard(leaf)
+
+  def Check(self):
+    """Raises StateMismatchError listing every leaf that has not converged."""
+    if not self.pending:
+      return
+    mismatches = ['"%s" expected "%s", got "%s"' % (
+        leaf, self.expected[leaf], self.last.get(leaf))
+                  for leaf in sorted(self.pending)]
+    for mismatch in mismatches:
+      logging.info('Leaf %s on AP %s', mismatch, self.ap.ap_name)
+    raise StateMismatchError('%d leaf mismatch(es) on AP %s after %d poll(s): '
+                             '%s' % (len(mismatches), self.ap.ap_name,
+                                     self.polls, '; '.join(mismatches)))
+
+  def Report(self):
+    """Returns when each leaf converged, in seconds from the Set."""
+    return ', '.join(
+        ['%s %.1fs' % (leaf, seconds)
+         for leaf, seconds in sorted(self.converged.items(),
+                                     key=lambda item: item[1])] +
+        ['%s pending' % leaf for leaf in sorted(self.pending)])
 
 
 def _GetChannelSet(five_g, width):
@@ -557,41 +1687,53 @@ def _GetChannelSet(five_g, width):
   return (1, 6, 11)
 
 
-def _VerifyRadioContainer(ap, radio_obj, five_g=True):
+def _VerifyRadioContainer(ap, radio_obj, five_g=True, leaf=None, value=None,
+                          state_fetch='container', budget=None):
   """Verifies the config and state leafs ensuring they match the sent config.
 
   Args:
     ap: (object) chido_test.ApObject containing all AP attributes.
     radio_obj: (YANGBaseClass) OC radio config container object.
     five_g: (bool) Whether target is 5GHz radio.
+    leaf: (str) the changed leaf, eg. 'channel'.
+    value: (object) the value the leaf was set to.
+    state_fetch: (str) how state is fetched, see _VerifyContainerState.
+    budget: (Budget) time budget for verifying config and state.
   Raises:
     ConfigError: If the config leaf does not match config sent.
   """
   # Check the config leaf.
-  expected_config = pybindJSON.dumps(radio_obj, mode='ietf')  # string format.
+  expected_config = _Dumps(radio_obj)  # string format.
   ap.radio_id = '0' if five_g else '1'
   ap.radio_freq = 'FREQ_5GHZ' if five_g else 'FREQ_2GHZ'
   path = _GetPathByContainer(ap, 'radios')
 
-  gnmi_response = GetPath(ap, path)
+  gnmi_response, state_future = _GetConfigAndState(
+      ap, path, expected_config, state_fetch, budget=budget)
 
-  json_bytes = gnmi_response.notification[0].update[0].val.json_ietf_val
-  json_bytes = json_bytes.replace(b'openconfig-wifi-types:', b'')
-  retrieved_config_obj = pybindJSONDecoder.load_ietf_json(
-      json.loads(json_bytes), None, None, obj=radio_obj)
-  retrieved_config = pybindJSON.dumps(retrieved_config_obj, mode='ietf')
-  if expected_config != retrieved_config:
-    logging.info('Expected:\n%s', expected_config)
-    logging.info('Retrieved:\n%s', retrieved_config)
-    raise ConfigError('Radio "%s" config does not match config sent' %
-                      ap.radio_id)
+  try:
+    with _Phase(budget, 'decode'):
+      json_dict = _ResponseJson(gnmi_response, path)
+      retrieved_config_obj = _LoadIetf(json_dict, radio_obj)
+      retrieved_config = _Dumps(retrieved_config_obj)
+    if expected_config != retrieved_config:
+      logging.info('Expected:\n%s', expected_config)
+      logging.info('Retrieved:\n%s', retrieved_config)
+      raise ConfigError('Radio "%s" config does not match config sent' %
+                        ap.radio_id)
+  except Exception:
+    state_future.cancel()  # The state is moot while config does not match.
+    raise
+  _ConfigMatched(ap)
 
   # Now verify the state.
   path = path.replace('/config', '/state')
   configured_keys = json.loads(expected_config).keys()
   leafs = [l.replace('openconfig-access-points:', '').replace('-', '_')
            for l in configured_keys]
-  _VerifyContainerState(ap, 'radios', path, leafs, retrieved_config_obj)
+  _VerifyContainerState(ap, 'radios', path, leafs, retrieved_config_obj,
+                        leaf=leaf, value=value, state_fetch=state_fetch,
+                        prefetched=state_future, budget=budget)
 
 
 def Deserialize(ap, gnmi_response, del_messages=True):
@@ -604,25 +1746,52 @@ def Deserialize(ap, gnmi_response, del_messages=True):
   ap_obj = ap_base.access_points.access_point.add(ap.ap_name)
 
   # TODO(xavier): Figure out why pybindJSONDecoder needs this workaround.
-  json_bytes = gnmi_response.notification[0].update[0].val.json_ietf_val
-  json_bytes = json_bytes.replace(b'openconfig-aaa:', b'')
-  json_bytes = json_bytes.replace(b'openconfig-wifi-types:', b'')
-  json_dict = json.loads(json_bytes)
+  json_dict = _ResponseJson(
+      gnmi_response, _HOST_PATH % ap.ap_name,
+      strip=(b'openconfig-aaa:', b'openconfig-wifi-types:'))
   if del_messages:
     # Delete inconsistently implemented model. Test separately.
     json_dict['openconfig-access-points:system'].pop('messages', None)
 
-  binded_obj = pybindJSONDecoder.load_ietf_json(json_dict, None, None,
-                                                obj=ap_obj)
+  binded_obj = _LoadIetf(json_dict, ap_obj)
   # print(pybindJSON.dumps(binded_obj, mode='ietf'))
 
   return binded_obj
 
 
-def _GetUserPass(vendor):
-  """Returns username and password as a tuple given a vendor string."""
+@_Traced('decode-normalize')
+def _ResponseJson(gnmi_response, xpath, strip=_STRIP_PREFIXES):
+  """Returns the JSON value of xpath assembled from a whole GetResponse.
+
+  Every notification and update is merged (see gnmi_lib.AssembleNotifications)
+  so targets splitting a container across several of them are not truncated.
+
+  Args:
+    gnmi_response: (gnmi_pb2.GetResponse) response to a Get of xpath.
+    xpath: (str) the OpenConfig path that was requested.
+    strip: (tuple) byte strings removed from the JSON before decoding.
+
+  Returns:
+    dict holding the JSON_IETF value of xpath, empty if nothing was returned.
+  """
+  json_dict = gnmi_lib.AssembleNotifications(gnmi_response.notification, xpath,
+                                             strip)
+  return json_dict if json_dict is not None else {}
+
+
+def _GetUserPass(vendor, credentials=None):
+  """Returns username and password as a tuple given a vendor string.
+
+  Args:
+    vendor: (str) vendor of the AP.
+    credentials: (str) name of the AP's credentials in its inventory record,
+      the keys <credentials>_user and <credentials>_pass, if set.
+  """
   username, password = '', ''
-  if vendor in ('aruba', 'arista'):
+  if credentials:
+    username = _GetKey(credentials + '_user')
+    password = _GetKey(credentials + '_pass')
+  elif vendor in ('aruba', 'arista'):
     username, password = 'admin', 'admin'
   else:
     username = _GetKey('mist_user')
@@ -634,12 +1803,10 @@ def _GetUserPass(vendor):
 def _GetKey(key_name):
   """Gets key from keystore/local, ensuring the return value is a text type."""
   # TODO(xavierc):  Store keys somehwere.
-  if key_name == 'mist_pass' or key_name == 'mist_user':
-    try:
-      key = chido_secrets.mist_pass if key_name == 'mist_pass' else chido_secrets.mist_user
-      logging.info('Got key through local secrets')
-      return key
-    except NameError:
-      logging.error('Unable to get key from local secrets')
+  key = getattr(chido_secrets, key_name, None)
+  if key is not None:
+    logging.info('Got key through local secrets')
+    return key
+  logging.error('Unable to get key from local secrets')
 
   raise GetKeyError('Unable to obtain key: %s' % key_name)
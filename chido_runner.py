@@ -0,0 +1,424 @@
+"""Runs chido tests as a dependency graph, concurrently where it is safe.
+
+Tests declare the tests they depend on and how long they are expected to take
+with Schedule, eg. radio tests need the base config and the joined-aps check
+needs the AP provisioned:
+
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=900)
+  def test004FiveRadio20Cycle(self):
+
+ParallelSuite builds a DAG of the tests and runs it on at most max_workers
+threads:
+  - a test starts once the tests it depends on passed, tests depending on one
+    that failed or was skipped are skipped.
+  - tests changing an AP run one at a time per AP, read_only ones (eg.
+    Deserialize, ValidateJoinedAPs) run alongside any other test.
+  - of the tests ready to start, the one heading the longest chain of expected
+    durations starts first, so a long sweep does not hold up the end of a run.
+  - tests without a Schedule run after the test loaded before them on their
+    AP, so the tests of an AP without any run in order, as unittest would.
+
+Each test reports into a result of its own.  The results of an AP are
+replayed into the runner's result once all its tests are done, so reports are
+not interleaved and any unittest runner (eg. unittest.TextTestRunner) prints
+them as usual.  Module and class fixtures (setUpModule, setUpClass) run once,
+around everything.
+
+Usage:
+  python3 chido_runner.py --workers=3 chido_test
+  python3 chido_runner.py chido_test.AristaTest chido_test.MistTest
+"""
+import argparse
+import collections
+import os
+import sys
+import unittest
+from concurrent import futures
+from typing import (Any, Callable, Iterable, List, Optional, Sequence,
+                    Text, Tuple, Union)
+
+from absl import logging  # pip install absl-py
+
+
+DEFAULT_SECONDS = 60.0  # Expected duration of tests without one.
+_Schedule = collections.namedtuple('_Schedule',
+                                   ('after', 'seconds', 'read_only'))
+
+
+class Error(Exception):
+  """Module-level Exception class."""
+
+
+class ScheduleError(Error):
+  """Raised when the dependencies of tests do not form a DAG."""
+
+
+def Schedule(after: Union[Text, Sequence[Text]] = (),
+             seconds: float = DEFAULT_SECONDS, read_only: bool = False):
+  """Declares the dependencies and expected duration of a test method.
+
+  Args:
+    after: (str or list) names of the test methods of the same class the test
+      runs after.
+    seconds: (float) expected duration of the test.
+    read_only: (bool) whether the test only reads from the AP, so it can run
+      alongside the other tests of the AP.
+
+  Returns:
+    a decorator of test methods.
+  """
+  if isinstance(after, str):
+    after = (after,)
+
+  def Decorator(func):
+    func.schedule = _Schedule(tuple(after), seconds, read_only)
+    return func
+
+  return Decorator
+
+
+def ApKey(test: unittest.TestCase) -> Text:
+  """Returns the AP a test runs against: its ap_key, or vendor attribute.
+
+  Tests without either (eg. offline unit tests) are grouped by class.
+  """
+  return (getattr(test, 'ap_key', None) or getattr(test, 'vendor', None) or
+          '%s.%s' % (type(test).__module__, type(test).__name__))
+
+
+def Flatten(tests: Iterable[Any]) -> List[unittest.TestCase]:
+  """Returns the test cases of a (nested) suite, in order."""
+  cases = []
+  for test in tests:
+    if isinstance(test, unittest.TestSuite):
+      cases.extend(Flatten(test))
+    else:
+      cases.append(test)
+  return cases
+
+
+class _RecordedResult(unittest.TestResult):
+  """Records the events of one AP's tests to replay them into another result.
+
+  The events are the TestResult callbacks (startTest, addSuccess, ...) with
+  their arguments, in order.
+  """
+
+  def __init__(self):
+    super(_RecordedResult, self).__init__()
+    self.events = []
+
+  def _Record(name):
+    def Method(self, *args):
+      self.events.append((name, args))
+      getattr(unittest.TestResult, name)(self, *args)
+    return Method
+
+  startTest = _Record('startTest')
+  stopTest = _Record('stopTest')
+  addSuccess = _Record('addSuccess')
+  addError = _Record('addError')
+  addFailure = _Record('addFailure')
+  addSkip = _Record('addSkip')
+  addExpectedFailure = _Record('addExpectedFailure')
+  addUnexpectedSuccess = _Record('addUnexpectedSuccess')
+  addSubTest = _Record('addSubTest')
+  del _Record
+
+  def Replay(self, result: unittest.TestResult) -> None:
+    """Calls the recorded events on result."""
+    for name, args in self.events:
+      getattr(result, name)(*args)
+
+
+class Node(object):
+  """A test in the DAG."""
+
+  def __init__(self, test: unittest.TestCase, ap: Text, index: int):
+    """Initializes a Node from the Schedule of the test, if any.
+
+    Args:
+      test: (unittest.TestCase) the test.
+      ap: (str) AP the test runs against.
+      index: (int) position of the test in the suite.
+    """
+    self.test = test
+    self.ap = ap
+    self.index = index
+    self.name = test.id().rsplit('.', 1)[-1]
+    self.schedule = getattr(getattr(type(test), self.name, None), 'schedule',
+                            None)
+    schedule = self.schedule or _Schedule((), DEFAULT_SECONDS, False)
+    self.seconds = schedule.seconds
+    self.read_only = schedule.read_only
+    self.deps = []
+    self.dependents = []
+    self.chain = self.seconds  # Expected duration of the longest chain.
+
+  def __repr__(self):
+    return 'Node(%s)' % self.test.id()
+
+
+def BuildDag(tests: Iterable[unittest.TestCase],
+             key: Callable[[unittest.TestCase], Text] = ApKey) -> List[Node]:
+  """Returns the nodes of tests, linked to their dependencies.
+
+  Dependencies on tests of the class missing from tests (eg. when running a
+  single test) are ignored.
+
+  Args:
+    tests: (list) test cases.
+    key: (callable) returns the AP of a test, see ApKey.
+
+  Returns:
+    the nodes, in the order of tests.
+
+  Raises:
+    ScheduleError: a test depends on a method its class does not have, or the
+      dependencies have a cycle.
+  """
+  nodes = [Node(test, key(test), index) for index, test in enumerate(tests)]
+  by_name = {(type(node.test), node.name): node for node in nodes}
+  previous = {}  # AP -> node of the last test without a Schedule.
+  for node in nodes:
+    if node.schedule is None:
+      if node.ap in previous:
+        node.deps.append(previous[node.ap])
+      previous[node.ap] = node
+      continue
+    for name in node.schedule.after:
+      if not hasattr(type(node.test), name):
+        raise ScheduleError('%s runs after %s, which %s does not have' % (
+            node.test.id(), name, type(node.test).__name__))
+      dep = by_name.get((type(node.test), name))
+      if dep is not None:
+        node.deps.append(dep)
+  for node in nodes:
+    for dep in node.deps:
+      dep.dependents.append(node)
+  for node in reversed(_Sorted(nodes)):
+    node.chain = node.seconds + max(
+        [dependent.chain for dependent in node.dependents] or [0.0])
+  return nodes
+
+
+def _Sorted(nodes: List[Node]) -> List[Node]:
+  """Returns nodes sorted topologically.
+
+  Raises:
+    ScheduleError: the dependencies have a cycle.
+  """
+  order = []
+  visiting = []
+  visited = set()
+
+  def _Visit(node):
+    if node in visited:
+      return
+    if node in visiting:
+      cycle = visiting[visiting.index(node):] + [node]
+      raise ScheduleError('Dependency cycle: %s' % ' -> '.join(
+          n.test.id() for n in cycle))
+    visiting.append(node)
+    for dep in node.deps:
+      _Visit(dep)
+    visiting.pop()
+    visited.add(node)
+    order.append(node)
+
+  for node in nodes:
+    _Visit(node)
+  return order
+
+
+class ParallelSuite(unittest.TestSuite):
+  """A suite running its tests as a DAG, see the module docstring."""
+
+  def __init__(self, tests: Iterable[Any] = (), max_workers: int = 4,
+               key: Callable[[unittest.TestCase], Text] = ApKey):
+    """Initializes a ParallelSuite.
+
+    Args:
+      tests: (list) tests or suites, nested suites are flattened.
+      max_workers: (int) most tests running at the same time.
+      key: (callable) returns the AP of a test, see ApKey.
+    """
+    super(ParallelSuite, self).__init__(Flatten(tests))
+    self.max_workers = max(max_workers, 1)
+    self.key = key
+
+  def run(self, result, debug=False):
+    nodes = BuildDag(self, self.key)
+    modules = _Fixtures(self, 'setUpModule', 'tearDownModule',
+                        lambda test: sys.modules[type(test).__module__])
+    if not _SetUp(modules, self, result):
+      return result
+    classes = []  # Class fixtures set up.
+    try:
+      for fixture in _Fixtures(self, 'setUpClass', 'tearDownClass', type):
+        if _SetUp([fixture], _Tests(self, fixture[0]), result):
+          classes.append(fixture)
+      _Run([node for node in nodes
+            if any(type(node.test) is cls for cls, _, _ in classes)],
+           result, self.max_workers)
+    finally:
+      for fixture in reversed(classes):
+        _TearDown([fixture], _Tests(self, fixture[0]), result)
+        fixture[0].doClassCleanups()
+      _TearDown(modules, self, result)
+    return result
+
+
+def _Tests(tests: Iterable[unittest.TestCase],
+           cls: type) -> List[unittest.TestCase]:
+  """Returns the tests of class cls."""
+  return [test for test in tests if type(test) is cls]
+
+
+def _Run(nodes: List[Node], result: unittest.TestResult,
+         max_workers: int) -> None:
+  """Runs the tests of nodes in dependency order, reporting to result."""
+  included = set(nodes)  # Dependencies on other nodes are ignored.
+  waiting = sorted(nodes, key=lambda node: (-node.chain, node.index))
+  passed = {}  # Node -> whether its test passed.
+  reports = collections.defaultdict(list)  # AP -> results not replayed yet.
+  left = collections.Counter(node.ap for node in nodes)
+  busy = set()  # APs running a test changing them.
+  running = {}  # Future -> node.
+
+  def _Done(node, recorded):
+    passed[node] = recorded.wasSuccessful() and not recorded.skipped
+    if result.failfast and not recorded.wasSuccessful():
+      result.stop()
+    reports[node.ap].append(recorded)
+    left[node.ap] -= 1
+    if not left[node.ap]:
+      for report in reports.pop(node.ap):
+        report.Replay(result)
+
+  try:
+    with futures.ThreadPoolExecutor(max_workers) as executor:
+      while waiting or running:
+        for node in list(waiting):
+          if result.shouldStop or len(running) >= max_workers:
+            break
+          deps = [dep for dep in node.deps if dep in included]
+          if (any(dep not in passed for dep in deps) or
+              (not node.read_only and node.ap in busy)):
+            continue
+          waiting.remove(node)
+          failed = [dep for dep in deps if not passed[dep]]
+          if failed:
+            _Done(node, _Skipped(node.test, '%s did not pass' % (
+                failed[0].name)))
+            continue
+          if not node.read_only:
+            busy.add(node.ap)
+          running[executor.submit(_RunTest, node.test)] = node
+        if not running:
+          if result.shouldStop:
+            break
+          continue  # Only skips, look for tests they unblocked.
+        done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+        for future in done:
+          node = running.pop(future)
+          if not node.read_only:
+            busy.discard(node.ap)
+          _Done(node, future.result())
+  finally:
+    for ap_reports in reports.values():  # APs with tests left when stopped.
+      for report in ap_reports:
+        report.Replay(result)
+
+
+def _RunTest(test: unittest.TestCase) -> _RecordedResult:
+  """Runs test, returning its result."""
+  recorded = _RecordedResult()
+  test(recorded)
+  return recorded
+
+
+def _Skipped(test: unittest.TestCase, reason: Text) -> _RecordedResult:
+  """Returns the result of skipping test."""
+  recorded = _RecordedResult()
+  recorded.startTest(test)
+  recorded.addSkip(test, reason)
+  recorded.stopTest(test)
+  return recorded
+
+
+def _Fixtures(tests: Iterable[unittest.TestCase], setup: Text, teardown: Text,
+              owner: Callable[[unittest.TestCase], Any]
+             ) -> List[Tuple[Any, Optional[Callable], Optional[Callable]]]:
+  """Returns the distinct (owner, setup, teardown) fixtures of tests."""
+  fixtures = collections.OrderedDict()
+  for test in tests:
+    obj = owner(test)
+    if id(obj) not in fixtures:
+      fixtures[id(obj)] = (obj, getattr(obj, setup, None),
+                           getattr(obj, teardown, None))
+  return list(fixtures.values())
+
+
+def _SetUp(fixtures, tests: Iterable[unittest.TestCase],
+           result: unittest.TestResult) -> bool:
+  """Calls the setup of every fixture, reporting an error to every test if one
+  fails.
+
+  Returns:
+    whether every setup passed.
+  """
+  for _, setup, _ in fixtures:
+    if setup is None:
+      continue
+    try:
+      setup()
+    except Exception:  # pylint: disable=broad-except
+      exc_info = sys.exc_info()
+      for test in tests:
+        result.startTest(test)
+        result.addError(test, exc_info)
+        result.stopTest(test)
+      return False
+  return True
+
+
+def _TearDown(fixtures, tests: Iterable[unittest.TestCase],
+              result: unittest.TestResult) -> None:
+  """Calls the teardown of every fixture, in reverse order."""
+  for _, _, teardown in reversed(fixtures):
+    if teardown is None:
+      continue
+    try:
+      teardown()
+    except Exception:  # pylint: disable=broad-except
+      test = list(tests)[-1]
+      result.startTest(test)
+      result.addError(test, sys.exc_info())
+      result.stopTest(test)
+
+
+def main(argv: Optional[List[Text]] = None) -> int:
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('tests', nargs='*', default=['chido_test'],
+                      help='Test modules, classes or methods.')
+  parser.add_argument('--workers', type=int, default=4,
+                      help='Most tests running at the same time.')
+  parser.add_argument('--verbosity', '-v', type=int, default=2,
+                      help='unittest verbosity.')
+  parser.add_argument('--failfast', '-f', action='store_true',
+                      help='Stop after the first failure.')
+  args = parser.parse_args(argv)
+  logging.set_verbosity(logging.INFO)
+  if os.environ.get('CHIDO_RECORD_DIR') or os.environ.get('CHIDO_REPLAY_DIR'):
+    args.workers = 1  # One cassette is recorded or replayed at a time.
+  suite = ParallelSuite(
+      unittest.defaultTestLoader.loadTestsFromNames(args.tests),
+      max_workers=args.workers)
+  result = unittest.TextTestRunner(verbosity=args.verbosity,
+                                   failfast=args.failfast).run(suite)
+  return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
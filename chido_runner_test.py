@@ -0,0 +1,216 @@
+"""Unit tests for chido_runner."""
+import threading
+import time
+import unittest
+
+import chido_runner
+
+
+_DELAY = 0.2
+_EVENTS = []
+_LOCK = threading.Lock()
+
+
+def _Event(*event):
+  with _LOCK:
+    _EVENTS.append(event)
+
+
+def _ApTests():
+  """Returns the test cases of two fake APs, hidden from test discovery."""
+
+  class _ApTest(unittest.TestCase):
+    vendor = None
+    set_up_classes = 0
+
+    @classmethod
+    def setUpClass(cls):
+      super(_ApTest, cls).setUpClass()
+      cls.set_up_classes += 1
+
+    def _Run(self):
+      _Event(self.vendor, self._testMethodName, 'start')
+      time.sleep(_DELAY)
+      _Event(self.vendor, self._testMethodName, 'end')
+
+  class _AristaTest(_ApTest):
+    vendor = 'arista'
+
+    def test001(self):
+      self._Run()
+
+    def test002(self):
+      self._Run()
+      self.fail('channel mismatch')
+
+  class _MistTest(_ApTest):
+    vendor = 'mist'
+
+    def test001(self):
+      self._Run()
+
+    def test002(self):
+      self.skipTest('not supported')
+
+  return _AristaTest, _MistTest
+
+
+def _DagTest():
+  """Returns the test case of an AP with scheduled tests."""
+
+  class _DagTest(unittest.TestCase):
+    vendor = 'arista'
+
+    def _Run(self):
+      _Event(self._testMethodName, 'start')
+      time.sleep(_DELAY)
+      _Event(self._testMethodName, 'end')
+
+    @chido_runner.Schedule(seconds=1)
+    def testBaseConfig(self):
+      self._Run()
+
+    @chido_runner.Schedule(after='testBaseConfig', seconds=5)
+    def testSsid(self):
+      self._Run()
+
+    @chido_runner.Schedule(after='testBaseConfig', seconds=50)
+    def testSweep(self):
+      self._Run()
+
+    @chido_runner.Schedule(after='testBaseConfig', seconds=1, read_only=True)
+    def testDeserialize(self):
+      self._Run()
+
+    @chido_runner.Schedule(after='testSsid', seconds=1)
+    def testSsidFails(self):
+      self._Run()
+      self.fail('ssid mismatch')
+
+    @chido_runner.Schedule(after='testSsidFails', seconds=1, read_only=True)
+    def testValidateSsid(self):
+      self._Run()
+
+  return _DagTest
+
+
+def _Suite(*classes, **kwargs):
+  loader = unittest.defaultTestLoader
+  return chido_runner.ParallelSuite(
+      [loader.loadTestsFromTestCase(cls) for cls in classes], **kwargs)
+
+
+class ParallelSuiteTest(unittest.TestCase):
+
+  def setUp(self):
+    super(ParallelSuiteTest, self).setUp()
+    del _EVENTS[:]
+    self.arista, self.mist = _ApTests()
+
+  def testApsRunConcurrently(self):
+    result = unittest.TestResult()
+    start = time.time()
+    _Suite(self.arista, self.mist).run(result)
+    self.assertLess(time.time() - start, 3.5 * _DELAY)
+    self.assertEqual(result.testsRun, 4)
+    self.assertEqual(len(result.failures), 1)
+    self.assertEqual(len(result.skipped), 1)
+    self.assertEqual((self.arista.set_up_classes, self.mist.set_up_classes),
+                     (1, 1))
+
+  def testTestsOfAnApRunInOrder(self):
+    _Suite(self.arista, self.mist).run(unittest.TestResult())
+    arista = [event[1:] for event in _EVENTS if event[0] == 'arista']
+    self.assertEqual(arista, [('test001', 'start'), ('test001', 'end'),
+                              ('test002', 'start'), ('test002', 'end')])
+
+  def testBoundedParallelism(self):
+    start = time.time()
+    _Suite(self.arista, self.mist, max_workers=1).run(unittest.TestResult())
+    self.assertGreaterEqual(time.time() - start, 3 * _DELAY)
+
+  def testReportsAreNotInterleaved(self):
+    result = unittest.TestResult()
+    started = []
+    result.startTest = lambda test: started.append(test.vendor)
+    _Suite(self.arista, self.mist).run(result)
+    self.assertIn(started, (['arista', 'arista', 'mist', 'mist'],
+                            ['mist', 'mist', 'arista', 'arista']))
+
+  def testFailfast(self):
+    result = unittest.TestResult()
+    result.failfast = True
+    _Suite(self.arista, max_workers=1).run(result)
+    self.assertEqual(len(result.failures), 1)
+    self.assertTrue(result.shouldStop)
+
+
+class DagTest(unittest.TestCase):
+
+  def setUp(self):
+    super(DagTest, self).setUp()
+    del _EVENTS[:]
+    self.cls = _DagTest()
+
+  def _Started(self):
+    return [event[0] for event in _EVENTS if event[1] == 'start']
+
+  def testBuildDag(self):
+    nodes = chido_runner.BuildDag(chido_runner.Flatten(
+        unittest.defaultTestLoader.loadTestsFromTestCase(self.cls)))
+    chains = {node.name: node.chain for node in nodes}
+    self.assertEqual(chains['testBaseConfig'], 51)
+    self.assertEqual(chains['testSsid'], 7)
+
+  def testDependenciesAndLongestChainFirst(self):
+    result = unittest.TestResult()
+    _Suite(self.cls).run(result)
+    started = self._Started()
+    self.assertEqual(started[0], 'testBaseConfig')
+    self.assertEqual(started[1:3], ['testSweep', 'testDeserialize'])
+    self.assertLess(started.index('testSsid'), started.index('testSsidFails'))
+    self.assertEqual(result.testsRun, 6)
+    self.assertEqual(len(result.failures), 1)
+    self.assertEqual(result.skipped[0][0]._testMethodName, 'testValidateSsid')
+
+  def testReadOnlyTestsRunAlongside(self):
+    start = time.time()
+    _Suite(self.cls).run(unittest.TestResult())
+    # Base config, sweep (with deserialize), ssid and ssid fails in sequence.
+    self.assertLess(time.time() - start, 4.5 * _DELAY)
+    running = 0
+    for event in _EVENTS:
+      if event[0] != 'testDeserialize':
+        running += 1 if event[1] == 'start' else -1
+        self.assertLessEqual(running, 1)
+
+  def testRunningOneTest(self):
+    result = unittest.TestResult()
+    chido_runner.ParallelSuite([self.cls('testSweep')]).run(result)
+    self.assertEqual(self._Started(), ['testSweep'])
+    self.assertTrue(result.wasSuccessful())
+
+  def testScheduleErrors(self):
+
+    class _CycleTest(unittest.TestCase):
+
+      @chido_runner.Schedule(after='testB')
+      def testA(self):
+        pass
+
+      @chido_runner.Schedule(after='testA')
+      def testB(self):
+        pass
+
+      @chido_runner.Schedule(after='testMissing')
+      def testC(self):
+        pass
+
+    with self.assertRaisesRegex(chido_runner.ScheduleError, 'cycle'):
+      chido_runner.BuildDag([_CycleTest('testA'), _CycleTest('testB')])
+    with self.assertRaisesRegex(chido_runner.ScheduleError, 'testMissing'):
+      chido_runner.BuildDag([_CycleTest('testC')])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,13 +1,28 @@
+import os
+import re
+import threading
 import time
 import unittest
 
 from absl import logging  # pip install absl-py
 import chido
+import chido_runner
+import convergence
+import fake_ap
+import gnmi_lib
+import gnmi_metrics
+import inventory
+import tracing
 
 
 _FILES = 'testdata/'
 # OC Paths
 _HOST_PATH = '/access-points/access-point[hostname=%s]/'
+_FAKE_DELAY = 0.5  # Seconds until a fake AP's state reflects a Set.
+_FAKE_SERVER = None
+# AP manager (vendor, gNMI target) -> its joined-aps, see ChidoTest._JoinedAPs.
+_JOINED_APS = {}
+_JOINED_APS_LOCK = threading.Lock()
 
 
 class ApObject(object):
@@ -28,374 +43,529 @@ class ApObject(object):
     self.opstate = None
     self.power_source = None
     self.serial = None
+    self.firmware = None
     self.stub = None
     self.vendor = ''
+    self.credentials = None
+
+  @classmethod
+  def FromRecord(cls, record):
+    """Returns an ApObject with the attributes of an inventory.ApRecord."""
+    ap_obj = cls(record.hostname)
+    for name in inventory.FIELDS:
+      if name != 'hostname':
+        setattr(ap_obj, name, getattr(record, name))
+    return ap_obj
+
+
+def _Parameterize(cls):
+  """Runs the tests of a vendor's class against each AP of that vendor.
+
+  The class tests the first AP of its vendor in the inventory (see
+  inventory.Cached), a subclass named after the hostname is added to the module
+  for each other one.
+
+  Args:
+    cls: (type) ChidoTest subclass with a vendor.
+
+  Returns:
+    cls.
+  """
+  records = inventory.Cached().ByVendor(cls.vendor)
+  for i, record in enumerate(records):
+    attributes = {'record': record, 'ap_key': record.hostname}
+    if not i:
+      for name, value in attributes.items():
+        setattr(cls, name, value)
+      continue
+    name = '%s_%s' % (cls.__name__, re.sub(r'\W', '_', record.hostname))
+    globals()[name] = type(name, (cls,), attributes)
+  return cls
+
+
+def setUpModule():
+  # CHIDO_FAKE_TARGET=local runs the tests against an in-process fake_ap
+  # target emulating the APs of the inventory, instead of the real APs.
+  global _FAKE_SERVER
+  # Convergence delays learned from the APs are kept across runs.
+  convergence.Persist()
+  # CHIDO_REPLAY_REALTIME replays cassettes at the pace they were recorded.
+  gnmi_lib.PLAYER.realtime = bool(os.environ.get('CHIDO_REPLAY_REALTIME'))
+  if os.environ.get('CHIDO_FAKE_TARGET') == 'local':
+    target = fake_ap.FakeTarget([
+        fake_ap.FakeAp.FromApObject(ApObject.FromRecord(record),
+                                    convergence_delay=_FAKE_DELAY)
+        for record in inventory.Cached()])
+    _FAKE_SERVER, port = fake_ap.Serve(target)
+    os.environ['CHIDO_FAKE_TARGET'] = 'localhost:%d' % port
 
 
 class ChidoTest(unittest.TestCase):
+  # Tests declare the tests they depend on and their expected duration with
+  # chido_runner.Schedule, chido_runner.py runs them as a DAG.
+  # Vendor of the AP under test, its tests are skipped while it is down.
+  vendor = None
+  # Inventory record and hostname of the AP under test, see _Parameterize.
+  record = None
+  ap_key = None
 
   def setUp(self):
     super(ChidoTest, self).setUp()
 
-    self.ap_arista = ApObject(
-        'ap-02-102.example.com')
-    self.ap_mist = ApObject(
-        'ap-02-100.example.com')
-    self.ap_aruba = ApObject(
-        'ap-02-104.example.com')
-    ap_objs = [self.ap_arista, self.ap_aruba, self.ap_mist]
-
-    for ap_obj in ap_objs:
-      if ap_obj is self.ap_arista:
-        ap_obj.mac = '30:86:2D:25:26:27'
-        ap_obj.vendor = 'arista'
-        ap_obj.targetport = '8080'
-        ap_obj.targetip = '100.77.250.242'
-        ap_obj.targetipv6 = '2001:15c:33:10:3286:2dff:fe25:e61f'
-        ap_obj.model = 'C-130'
-        ap_obj.opstate = 'UP'
-        ap_obj.power_source = 'AT'
-        ap_obj.serial = '12330862D25E'
-      elif ap_obj is self.ap_mist:
-        ap_obj.mac = '5C:5B:35:01:02:03'
-        ap_obj.vendor = 'mist'
-        ap_obj.targetport = '443'
-        ap_obj.targetip = '100.66.236.21'
-        ap_obj.targetipv6 = ''
-        ap_obj.model = 'AP41'
-        ap_obj.opstate = 'UP'
-        ap_obj.power_source = 'AT'
-        ap_obj.serial = '1231001117020'
-      elif ap_obj is self.ap_aruba:
-        ap_obj.mac = '48:4A:E9:CC:CB:CA'
-        ap_obj.vendor = 'aruba'
-        ap_obj.targetport = '10162'
-        ap_obj.targetip = '100.66.236.4'
-        ap_obj.targetipv6 = '2001:15c:33:11:4a4a:e9ff:fec3:9db4'
-        ap_obj.model = 'AP-345-US'
-        ap_obj.opstate = 'UP'
-        ap_obj.power_source = 'AT'
-        ap_obj.serial = '123CNH1K51'
+    if self.record is None:
+      self.skipTest('No %s AP in the inventory' % self.vendor)
+    self.ap = ApObject.FromRecord(self.record)
+
+    # CHIDO_RECORD_DIR records every RPC of a test in a cassette there, which
+    # CHIDO_REPLAY_DIR replays instead of talking to the APs.
+    cassette = '%s.%s.cassette' % (type(self).__name__, self._testMethodName)
+    if os.environ.get('CHIDO_RECORD_DIR'):
+      gnmi_lib.RECORDER.Open(os.path.join(os.environ['CHIDO_RECORD_DIR'],
+                                          cassette))
+      self.addCleanup(gnmi_lib.RECORDER.Close)
+    elif os.environ.get('CHIDO_REPLAY_DIR'):
+      path = os.path.join(os.environ['CHIDO_REPLAY_DIR'], cassette)
+      if not os.path.exists(path) or not gnmi_lib.PLAYER.Load(path):
+        self.skipTest('No RPCs recorded in %s' % path)
+
+    if chido.TargetIsDown(self.ap):
+      self.skipTest('gNMI target of %s is not answering' % self.ap.ap_name)
+
+  def _JoinedAPs(self):
+    """Returns the joined-aps of the AP's manager, one Get per manager.
+
+    A cassette holds the RPCs of one test, so tests recording or replaying one
+    make their own Get.
+    """
+    if (os.environ.get('CHIDO_RECORD_DIR') or
+        os.environ.get('CHIDO_REPLAY_DIR')):
+      return chido.GetJoinedAPs(self.ap)
+    manager = (self.ap.vendor, self.ap.gnmi_target)
+    with _JOINED_APS_LOCK:
+      if manager not in _JOINED_APS:
+        _JOINED_APS[manager] = chido.GetJoinedAPs(self.ap)
+      return _JOINED_APS[manager]
+
+  def _CheckDiscovered(self):
+    """Checks the AP's manager reports the AP as in its inventory record."""
+    discovered = chido.DiscoverJoinedAPs(
+        self.ap, joined_aps=self._JoinedAPs()).Get(self.ap.ap_name)
+    self.assertIsNotNone(discovered)
+    for name in ('mac', 'model', 'serial', 'opstate', 'power_source',
+                 'targetip', 'targetipv6'):
+      self.assertEqual(getattr(discovered, name), getattr(self.record, name),
+                       name)
 
   def tearDown(self):
     super(ChidoTest, self).tearDown()
-    time.sleep(2)
+    if _FAKE_SERVER is None and not os.environ.get('CHIDO_REPLAY_DIR'):
+      time.sleep(2)
 
 
+@_Parameterize
 class AristaTest(ChidoTest):
+  vendor = 'arista'
 
+  @chido_runner.Schedule(seconds=30)
   def test001BaseConfigOfficeArista(self):
     # Ensures an office config is accepted.
-    self.assertTrue(chido.SetConfig(self.ap_arista,
+    self.assertTrue(chido.SetConfig(self.ap,
                                     _FILES + 'arista_office_base_full.json'))
 
+  @chido_runner.Schedule(after='test001BaseConfigOfficeArista', seconds=30)
   def test002BaseConfigRFSiloArista(self):
     # Ensures an office + rf silo config is accepted.
-    self.assertTrue(chido.SetConfig(self.ap_arista,
+    self.assertTrue(chido.SetConfig(self.ap,
                                     _FILES + 'arista_office_silo_full.json'))
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=10,
+                          read_only=True)
   def test003DeserializeArista(self):
     # Ensure full tree including state leaves are deserialized/adhere to schema.
-    gnmi_response = chido.GetPath(self.ap_arista,
-                                  _HOST_PATH % self.ap_arista.ap_name)
-    chido.Deserialize(self.ap_arista, gnmi_response)
+    gnmi_response = chido.GetPath(self.ap, _HOST_PATH % self.ap.ap_name)
+    chido.Deserialize(self.ap, gnmi_response)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=900)
   def test004FiveRadio20Cycle(self):
     # Cycles through all 20MHz channels.
     radio = chido.GetContainerFromJson(
-        self.ap_arista, _FILES + 'arista_radio_base.json', 'radios')
-    chido.CycleChannels(self.ap_arista, radio)
+        self.ap, _FILES + 'arista_radio_base.json', 'radios')
+    chido.CycleChannels(self.ap, radio)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=450)
   def test005FiveRadio40Cycle(self):
     # Cycles through all 40MHz channels.
     radio = chido.GetContainerFromJson(
-        self.ap_arista, _FILES + 'arista_radio_base.json', 'radios')
-    chido.CycleChannels(self.ap_arista, radio, width=40)
+        self.ap, _FILES + 'arista_radio_base.json', 'radios')
+    chido.CycleChannels(self.ap, radio, width=40)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=240)
   def test006FiveRadio80Cycle(self):
     # Cycles through all 80MHz channels.
     radio = chido.GetContainerFromJson(
-        self.ap_arista, _FILES + 'arista_radio_base.json', 'radios')
-    chido.CycleChannels(self.ap_arista, radio, width=80)
+        self.ap, _FILES + 'arista_radio_base.json', 'radios')
+    chido.CycleChannels(self.ap, radio, width=80)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=300)
   def test007TwoRadioCycle(self):
     # Test 2G radio channels.
     radio = chido.GetContainerFromJson(
-        self.ap_arista, _FILES + 'arista_radio_base.json', 'radios')
-    chido.CycleChannels(self.ap_arista, radio, five_g=False)
+        self.ap, _FILES + 'arista_radio_base.json', 'radios')
+    chido.CycleChannels(self.ap, radio, five_g=False)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=120)
   def test008FiveRadioPowerCycle(self):
     # Cycles through some power levels (ie. 6, 10, 15)
     radio = chido.GetContainerFromJson(
-        self.ap_arista, _FILES + 'arista_radio_base.json', 'radios')
-    chido.CycleTransmitPowers(self.ap_arista, radio, [6, 10, 15])
+        self.ap, _FILES + 'arista_radio_base.json', 'radios')
+    chido.CycleTransmitPowers(self.ap, radio, [6, 10, 15])
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=60)
   def test009FiveRadioDisable(self):
     radio = chido.GetContainerFromJson(
-        self.ap_arista, _FILES + 'arista_radio_base.json', 'radios')
-    chido.DisableRadio(self.ap_arista, radio)
+        self.ap, _FILES + 'arista_radio_base.json', 'radios')
+    chido.DisableRadio(self.ap, radio)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=60)
   def test010TwoRadioDisable(self):
     radio = chido.GetContainerFromJson(
-        self.ap_arista, _FILES + 'arista_radio_base.json', 'radios')
-    chido.DisableRadio(self.ap_arista, radio, five_g=False)
+        self.ap, _FILES + 'arista_radio_base.json', 'radios')
+    chido.DisableRadio(self.ap, radio, five_g=False)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=30)
   def test011SSIDBase(self):
     # Test basic SSID configuration with commonly used parameters.
-    ssid = chido.GetContainerFromJson(self.ap_arista,
+    ssid = chido.GetContainerFromJson(self.ap,
                                       _FILES + 'arista_ssid_base.json', 'ssids')
-    chido.SetContainer(self.ap_arista, 'ssids', ssid)
+    chido.SetContainer(self.ap, 'ssids', ssid)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=30)
   def test012SSIDAlternetate(self):
     # Similar to base but flip boolean parameters.
     ssid = chido.GetContainerFromJson(
-        self.ap_arista, _FILES + 'arista_ssid_alternate.json', 'ssids')
-    chido.SetContainer(self.ap_arista, 'ssids', ssid)
+        self.ap, _FILES + 'arista_ssid_alternate.json', 'ssids')
+    chido.SetContainer(self.ap, 'ssids', ssid)
 
   # def test013Dot11rBase(self):
-  #   dot11r = chido.GetContainerFromJson(self.ap_arista,
+  #   dot11r = chido.GetContainerFromJson(self.ap,
   #                                       _FILES + 'dot11r_base.json', 'dot11r')
-  #   chido.SetContainer(self.ap_arista, 'dot11r', dot11r)
+  #   chido.SetContainer(self.ap, 'dot11r', dot11r)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=30)
   def test014BandSteeringBase(self):
     band_steering = chido.GetContainerFromJson(
-        self.ap_arista, _FILES + 'band_steering_base.json', 'band-steering')
-    chido.SetContainer(self.ap_arista, 'band-steering', band_steering)
+        self.ap, _FILES + 'band_steering_base.json', 'band-steering')
+    chido.SetContainer(self.ap, 'band-steering', band_steering)
 
   # def test015WmmBase(self):
   #   wmm = chido.GetContainerFromJson(
-  #       self.ap_arista, _FILES + 'wmm_base.json', 'wmm')
-  #   chido.SetContainer(self.ap_arista, 'wmm', wmm)
+  #       self.ap, _FILES + 'wmm_base.json', 'wmm')
+  #   chido.SetContainer(self.ap, 'wmm', wmm)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=30)
   def test016DisableSSH(self):
-    ssh = chido.GetContainerFromJson(self.ap_arista, _FILES + 'ssh_base.json',
+    ssh = chido.GetContainerFromJson(self.ap, _FILES + 'ssh_base.json',
                                      'ssh')
-    chido.SetContainer(self.ap_arista, 'ssh', ssh)
-    self.assertFalse(chido.CheckPortIsOpen(self.ap_arista, 22))
+    chido.SetContainer(self.ap, 'ssh', ssh)
+    self.assertFalse(chido.CheckPortIsOpen(self.ap, 22))
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloArista', seconds=30)
   def test017ProvisionUS(self):
     provision_aps = chido.GetContainerFromJson(
-        self.ap_arista, _FILES + 'arista_provision_us.json', 'provision-aps')
-    chido.SetContainer(self.ap_arista, 'provision-aps', provision_aps)
+        self.ap, _FILES + 'arista_provision_us.json', 'provision-aps')
+    chido.SetContainer(self.ap, 'provision-aps', provision_aps)
 
+  @chido_runner.Schedule(after='test017ProvisionUS', seconds=10,
+                          read_only=True)
   def test018ValidateJoinedAPs(self):
-    state = chido.ValidateJoinedAPs(self.ap_arista)
-    self.assertEqual(state.hostname, self.ap_arista.ap_name)
-    self.assertEqual(state.mac.upper(), self.ap_arista.mac)
-    self.assertEqual(state.model, self.ap_arista.model)
-    self.assertEqual(state.opstate, self.ap_arista.opstate)
-    self.assertEqual(state.power_source, self.ap_arista.power_source)
-    self.assertEqual(state.serial, self.ap_arista.serial)
-    self.assertEqual(state.ipv4, self.ap_arista.targetip)
-    self.assertEqual(state.ipv6, self.ap_arista.targetipv6)
+    state = chido.ValidateJoinedAPs(self.ap, joined_aps=self._JoinedAPs())
+    self.assertEqual(state.hostname, self.ap.ap_name)
+    self.assertEqual(state.mac.upper(), self.ap.mac)
+    self.assertEqual(state.model, self.ap.model)
+    self.assertEqual(state.opstate, self.ap.opstate)
+    self.assertEqual(state.power_source, self.ap.power_source)
+    self.assertEqual(state.serial, self.ap.serial)
+    self.assertEqual(state.ipv4, self.ap.targetip)
+    self.assertEqual(state.ipv6, self.ap.targetipv6)
     self.assertTrue(state.enabled)
     self.assertGreater(state.uptime, 1)
 
+  @chido_runner.Schedule(after='test017ProvisionUS', seconds=10, read_only=True)
+  def test021DiscoverJoinedAPs(self):
+    # Lists every AP joined to the AP's manager in one Get.
+    self._CheckDiscovered()
+
 
+@_Parameterize
 class ArubaTest(ChidoTest):
+  vendor = 'aruba'
 
+  @chido_runner.Schedule(seconds=30)
   def test001BaseConfigOfficeAruba(self):
-    self.assertTrue(chido.SetConfig(self.ap_aruba,
+    self.assertTrue(chido.SetConfig(self.ap,
                                     _FILES + 'aruba_office_base_full.json'))
 
+  @chido_runner.Schedule(after='test001BaseConfigOfficeAruba', seconds=30)
   def test002BaseConfigRFSiloAruba(self):
-    self.assertTrue(chido.SetConfig(self.ap_aruba,
+    self.assertTrue(chido.SetConfig(self.ap,
                                     _FILES + 'aruba_office_silo_full.json'))
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloAruba', seconds=10,
+                          read_only=True)
   def test003DeserializeAruba(self):
-    gnmi_response = chido.GetPath(self.ap_aruba,
-                                  _HOST_PATH % self.ap_aruba.ap_name)
-    chido.Deserialize(self.ap_aruba, gnmi_response)
+    gnmi_response = chido.GetPath(self.ap, _HOST_PATH % self.ap.ap_name)
+    chido.Deserialize(self.ap, gnmi_response)
 
     # TODO(issue#): Aruba bug -- unable to set container.
 #   def test004FiveRadio20Cycle(self):
 #     radio = chido.GetContainerFromJson(
-#         self.ap_aruba, _FILES + 'aruba_radio_base.json', 'radios')
-#     chido.CycleChannels(self.ap_aruba, radio)
+#         self.ap, _FILES + 'aruba_radio_base.json', 'radios')
+#     chido.CycleChannels(self.ap, radio)
 
 #   def test005FiveRadio40Cycle(self):
 #     radio = chido.GetContainerFromJson(
-#         self.ap_aruba, _FILES + 'aruba_radio_base.json', 'radios')
-#     chido.CycleChannels(self.ap_aruba, radio, width=40)
+#         self.ap, _FILES + 'aruba_radio_base.json', 'radios')
+#     chido.CycleChannels(self.ap, radio, width=40)
 
 #   def test006FiveRadio80Cycle(self):
 #     radio = chido.GetContainerFromJson(
-#         self.ap_aruba, _FILES + 'aruba_radio_base.json', 'radios')
-#     chido.CycleChannels(self.ap_aruba, radio, width=80)
+#         self.ap, _FILES + 'aruba_radio_base.json', 'radios')
+#     chido.CycleChannels(self.ap, radio, width=80)
 
 #   def test007TwoRadioCycle(self):
 #     radio = chido.GetContainerFromJson(
-#         self.ap_aruba, _FILES + 'aruba_radio_base.json', 'radios')
-#     chido.CycleChannels(self.ap_aruba, radio, five_g=False)
+#         self.ap, _FILES + 'aruba_radio_base.json', 'radios')
+#     chido.CycleChannels(self.ap, radio, five_g=False)
 
 #   def test008FiveRadioPowerCycle(self):
 #     radio = chido.GetContainerFromJson(
-#         self.ap_aruba, _FILES + 'aruba_radio_base.json', 'radios')
-#     chido.CycleTransmitPowers(self.ap_aruba, radio, [6, 10, 15])
+#         self.ap, _FILES + 'aruba_radio_base.json', 'radios')
+#     chido.CycleTransmitPowers(self.ap, radio, [6, 10, 15])
 
 #   def test009FiveRadioDisable(self):
 #     radio = chido.GetContainerFromJson(
-#         self.ap_aruba, _FILES + 'aruba_radio_base.json', 'radios')
-#     chido.DisableRadio(self.ap_aruba, radio)
+#         self.ap, _FILES + 'aruba_radio_base.json', 'radios')
+#     chido.DisableRadio(self.ap, radio)
 
 #   def test010TwoRadioDisable(self):
 #     radio = chido.GetContainerFromJson(
-#         self.ap_aruba, _FILES + 'aruba_radio_base.json', 'radios')
-#     chido.DisableRadio(self.ap_aruba, radio, five_g=False)
+#         self.ap, _FILES + 'aruba_radio_base.json', 'radios')
+#     chido.DisableRadio(self.ap, radio, five_g=False)
 
 #   def test011SSIDBase(self):
-#     ssid = chido.GetContainerFromJson(self.ap_aruba,
+#     ssid = chido.GetContainerFromJson(self.ap,
 #                                       _FILES + 'aruba_ssid_base.json',
 #                                       'ssids')
-#     chido.SetContainer(self.ap_aruba, 'ssids', ssid)
+#     chido.SetContainer(self.ap, 'ssids', ssid)
 
 #   def test012SSIDAlternetate(self):
 #     ssid = chido.GetContainerFromJson(
-#         self.ap_aruba, _FILES + 'aruba_ssid_alternate.json', 'ssids')
-#     chido.SetContainer(self.ap_aruba, 'ssids', ssid)
+#         self.ap, _FILES + 'aruba_ssid_alternate.json', 'ssids')
+#     chido.SetContainer(self.ap, 'ssids', ssid)
 
 #   def test013Dot11rBase(self):
-#     dot11r = chido.GetContainerFromJson(self.ap_aruba,
+#     dot11r = chido.GetContainerFromJson(self.ap,
 #                                         _FILES + 'dot11r_base.json', 'dot11r')
-#     chido.SetContainer(self.ap_aruba, 'dot11r', dot11r)
+#     chido.SetContainer(self.ap, 'dot11r', dot11r)
 
 #   def test014BandSteeringBase(self):
 #     band_steering = chido.GetContainerFromJson(
-#         self.ap_aruba, _FILES + 'band_steering_base.json', 'band-steering')
-#     chido.SetContainer(self.ap_aruba, 'band-steering', band_steering)
+#         self.ap, _FILES + 'band_steering_base.json', 'band-steering')
+#     chido.SetContainer(self.ap, 'band-steering', band_steering)
 
 #   def test015WmmBase(self):
 #     wmm = chido.GetContainerFromJson(
-#         self.ap_aruba, _FILES + 'wmm_base.json', 'wmm')
-#     chido.SetContainer(self.ap_aruba, 'wmm', wmm)
+#         self.ap, _FILES + 'wmm_base.json', 'wmm')
+#     chido.SetContainer(self.ap, 'wmm', wmm)
 
 #  def test016DisableSSH(self):
-#    ssh = chido.GetContainerFromJson(self.ap_aruba, _FILES + 'ssh_base.json',
+#    ssh = chido.GetContainerFromJson(self.ap, _FILES + 'ssh_base.json',
 #                                     'ssh')
-#    chido.SetContainer(self.ap_aruba, 'ssh', ssh)
-#    self.assertFalse(chido.CheckPortIsOpen(self.ap_aruba, 22))
+#    chido.SetContainer(self.ap, 'ssh', ssh)
+#    self.assertFalse(chido.CheckPortIsOpen(self.ap, 22))
 
   # def test017ProvisionUS(self):
   #   # TODO(issue#): This is broken in some firmwares.
   #   provision_aps = chido.GetContainerFromJson(
-  #       self.ap_aruba, _FILES + 'aruba_provision_us.json', 'provision-aps')
-  #   chido.SetContainer(self.ap_aruba, 'provision-aps', provision_aps)
+  #       self.ap, _FILES + 'aruba_provision_us.json', 'provision-aps')
+  #   chido.SetContainer(self.ap, 'provision-aps', provision_aps)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloAruba', seconds=10,
+                          read_only=True)
   def test018ValidateJoinedAPs(self):
-    state = chido.ValidateJoinedAPs(self.ap_aruba)
-    self.assertEqual(state.hostname, self.ap_aruba.ap_name)
-    self.assertEqual(state.mac.upper(), self.ap_aruba.mac)
-    self.assertEqual(state.model, self.ap_aruba.model)
-    self.assertEqual(state.opstate, self.ap_aruba.opstate)
-    self.assertEqual(state.power_source, self.ap_aruba.power_source)
-    self.assertEqual(state.serial, self.ap_aruba.serial)
-    self.assertEqual(state.ipv4, self.ap_aruba.targetip)
-    self.assertEqual(state.ipv6, self.ap_aruba.targetipv6)
+    state = chido.ValidateJoinedAPs(self.ap, joined_aps=self._JoinedAPs())
+    self.assertEqual(state.hostname, self.ap.ap_name)
+    self.assertEqual(state.mac.upper(), self.ap.mac)
+    self.assertEqual(state.model, self.ap.model)
+    self.assertEqual(state.opstate, self.ap.opstate)
+    self.assertEqual(state.power_source, self.ap.power_source)
+    self.assertEqual(state.serial, self.ap.serial)
+    self.assertEqual(state.ipv4, self.ap.targetip)
+    self.assertEqual(state.ipv6, self.ap.targetipv6)
     self.assertTrue(state.enabled)
     self.assertGreater(state.uptime, 1)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloAruba', seconds=10,
+                          read_only=True)
+  def test021DiscoverJoinedAPs(self):
+    # Lists every AP joined to the AP's manager in one Get.
+    self._CheckDiscovered()
 
+
+@_Parameterize
 class MistTest(ChidoTest):
+  vendor = 'mist'
 
+  @chido_runner.Schedule(seconds=30)
   def test001BaseConfigOfficeMist(self):
-    self.assertTrue(chido.SetConfig(self.ap_mist,
+    self.assertTrue(chido.SetConfig(self.ap,
                                     _FILES + 'mist_office_base_full.json'))
 
+  @chido_runner.Schedule(after='test001BaseConfigOfficeMist', seconds=30)
   def test002BaseConfigRFSiloMist(self):
-    self.assertTrue(chido.SetConfig(self.ap_mist,
+    self.assertTrue(chido.SetConfig(self.ap,
                                     _FILES + 'mist_office_silo_full.json'))
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=10,
+                          read_only=True)
   def test003DeserializeMist(self):
-    gnmi_response = chido.GetPath(self.ap_mist,
-                                  _HOST_PATH % self.ap_mist.ap_name)
-    chido.Deserialize(self.ap_mist, gnmi_response)
+    gnmi_response = chido.GetPath(self.ap, _HOST_PATH % self.ap.ap_name)
+    chido.Deserialize(self.ap, gnmi_response)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=900)
   def test004FiveRadio20Cycle(self):
     radio = chido.GetContainerFromJson(
-        self.ap_mist, _FILES + 'mist_radio_base.json', 'radios')
-    chido.CycleChannels(self.ap_mist, radio)
+        self.ap, _FILES + 'mist_radio_base.json', 'radios')
+    chido.CycleChannels(self.ap, radio)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=450)
   def test005FiveRadio40Cycle(self):
     radio = chido.GetContainerFromJson(
-        self.ap_mist, _FILES + 'mist_radio_base.json', 'radios')
-    chido.CycleChannels(self.ap_mist, radio, width=40)
+        self.ap, _FILES + 'mist_radio_base.json', 'radios')
+    chido.CycleChannels(self.ap, radio, width=40)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=240)
   def test006FiveRadio80Cycle(self):
     radio = chido.GetContainerFromJson(
-        self.ap_mist, _FILES + 'mist_radio_base.json', 'radios')
-    chido.CycleChannels(self.ap_mist, radio, width=80)
+        self.ap, _FILES + 'mist_radio_base.json', 'radios')
+    chido.CycleChannels(self.ap, radio, width=80)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=300)
   def test007TwoRadioCycle(self):
     radio = chido.GetContainerFromJson(
-        self.ap_mist, _FILES + 'mist_radio_base.json', 'radios')
-    chido.CycleChannels(self.ap_mist, radio, five_g=False)
+        self.ap, _FILES + 'mist_radio_base.json', 'radios')
+    chido.CycleChannels(self.ap, radio, five_g=False)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=120)
   def test008FiveRadioPowerCycle(self):
     # Note: Mist AP41 maxes out at 18 transmit-power.
     radio = chido.GetContainerFromJson(
-        self.ap_mist, _FILES + 'mist_radio_base.json', 'radios')
-    chido.CycleTransmitPowers(self.ap_mist, radio, [6, 10, 15])
+        self.ap, _FILES + 'mist_radio_base.json', 'radios')
+    chido.CycleTransmitPowers(self.ap, radio, [6, 10, 15])
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=60)
   def test009FiveRadioDisable(self):
     radio = chido.GetContainerFromJson(
-        self.ap_mist, _FILES + 'mist_radio_base.json', 'radios')
-    chido.DisableRadio(self.ap_mist, radio)
+        self.ap, _FILES + 'mist_radio_base.json', 'radios')
+    chido.DisableRadio(self.ap, radio)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=60)
   def test010TwoRadioDisable(self):
     radio = chido.GetContainerFromJson(
-        self.ap_mist, _FILES + 'mist_radio_base.json', 'radios')
-    chido.DisableRadio(self.ap_mist, radio, five_g=False)
+        self.ap, _FILES + 'mist_radio_base.json', 'radios')
+    chido.DisableRadio(self.ap, radio, five_g=False)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=30)
   def test011SSIDBase(self):
-    ssid = chido.GetContainerFromJson(self.ap_mist,
+    ssid = chido.GetContainerFromJson(self.ap,
                                       _FILES + 'mist_ssid_base.json', 'ssids')
-    chido.SetContainer(self.ap_mist, 'ssids', ssid)
+    chido.SetContainer(self.ap, 'ssids', ssid)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=30)
   def test012SSIDAlternetate(self):
     ssid = chido.GetContainerFromJson(
-        self.ap_mist, _FILES + 'mist_ssid_alternate.json', 'ssids')
-    chido.SetContainer(self.ap_mist, 'ssids', ssid)
+        self.ap, _FILES + 'mist_ssid_alternate.json', 'ssids')
+    chido.SetContainer(self.ap, 'ssids', ssid)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=30)
   def test013Dot11rBase(self):
-    dot11r = chido.GetContainerFromJson(self.ap_mist,
+    dot11r = chido.GetContainerFromJson(self.ap,
                                         _FILES + 'dot11r_base.json', 'dot11r')
-    chido.SetContainer(self.ap_mist, 'dot11r', dot11r)
+    chido.SetContainer(self.ap, 'dot11r', dot11r)
 
   # TODO(issue#): Unsupported containers by Mist below.
   # def test014BandSteeringBase(self):
   #   band_steering = chido.GetContainerFromJson(
-  #       self.ap_mist, _FILES + 'band_steering_base.json', 'band-steering')
-  #   chido.SetContainer(self.ap_mist, 'band-steering', band_steering)
+  #       self.ap, _FILES + 'band_steering_base.json', 'band-steering')
+  #   chido.SetContainer(self.ap, 'band-steering', band_steering)
 
   # def test015WmmBase(self):
   #   wmm = chido.GetContainerFromJson(
-  #       self.ap_mist, _FILES + 'wmm_base.json', 'wmm')
-  #   chido.SetContainer(self.ap_mist, 'wmm', wmm)
+  #       self.ap, _FILES + 'wmm_base.json', 'wmm')
+  #   chido.SetContainer(self.ap, 'wmm', wmm)
 
+  @chido_runner.Schedule(seconds=0, read_only=True)
   def test016DisableSSH(self):
     # N/A for Mist.
     pass
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=30)
   def test017ProvisionUS(self):
     provision_aps = chido.GetContainerFromJson(
-        self.ap_mist, _FILES + 'mist_provision_us.json', 'provision-aps')
-    chido.SetContainer(self.ap_mist, 'provision-aps', provision_aps)
+        self.ap, _FILES + 'mist_provision_us.json', 'provision-aps')
+    chido.SetContainer(self.ap, 'provision-aps', provision_aps)
 
   # TODO(b/123654785): Mist does not support IPv6 well, so the response
   # deserialization fails for state.ipv6.
   # def test018ValidateJoinedAPs(self):
-  #   state = chido.ValidateJoinedAPs(self.ap_mist)
-  #   self.assertEqual(state.hostname, self.ap_mist.ap_name)
-  #   self.assertEqual(state.mac.upper(), self.ap_mist.mac)
-  #   self.assertEqual(state.model, self.ap_mist.model)
-  #   self.assertEqual(state.opstate, self.ap_mist.opstate)
-  #   self.assertEqual(state.power_source, self.ap_mist.power_source)
-  #   self.assertEqual(state.serial, self.ap_mist.serial)
-  #   self.assertEqual(state.ipv4, self.ap_mist.targetip)
-  #   self.assertEqual(state.ipv6, self.ap_mist.targetipv6)
+  #   state = chido.ValidateJoinedAPs(self.ap)
+  #   self.assertEqual(state.hostname, self.ap.ap_name)
+  #   self.assertEqual(state.mac.upper(), self.ap.mac)
+  #   self.assertEqual(state.model, self.ap.model)
+  #   self.assertEqual(state.opstate, self.ap.opstate)
+  #   self.assertEqual(state.power_source, self.ap.power_source)
+  #   self.assertEqual(state.serial, self.ap.serial)
+  #   self.assertEqual(state.ipv4, self.ap.targetip)
+  #   self.assertEqual(state.ipv6, self.ap.targetipv6)
   #   self.assertTrue(state.enabled)
   #   self.assertGreater(state.uptime, 1)
 
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=30)
+  def test019SSIDLeafStateFetch(self):
+    # Verifies state through the configured leaf paths only.
+    ssid = chido.GetContainerFromJson(self.ap,
+                                      _FILES + 'mist_ssid_base.json', 'ssids')
+    chido.SetContainer(self.ap, 'ssids', ssid, state_fetch='leaves')
+
+  @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=120)
+  def test020FiveRadioPowerCycleLeafStateFetch(self):
+    radio = chido.GetContainerFromJson(
+        self.ap, _FILES + 'mist_radio_base.json', 'radios')
+    chido.CycleTransmitPowers(self.ap, radio, [6, 10, 15],
+                              state_fetch='leaves')
+
+  # TODO(b/123654785): Same IPv6 deserialization failure as test018.
+  # @chido_runner.Schedule(after='test002BaseConfigRFSiloMist', seconds=10,
+  #                        read_only=True)
+  # def test021DiscoverJoinedAPs(self):
+  #   self._CheckDiscovered()
+
+
+def tearDownModule():
+  # Set CHIDO_METRICS_FILE to keep the gNMI RPC metrics of the run.
+  if os.environ.get('CHIDO_METRICS_FILE'):
+    gnmi_metrics.REGISTRY.WriteText(os.environ['CHIDO_METRICS_FILE'])
+  # Set CHIDO_CONVERGENCE_REPORT to keep the convergence times of the run.
+  if os.environ.get('CHIDO_CONVERGENCE_REPORT'):
+    convergence.RECORDER.WriteJson(os.environ['CHIDO_CONVERGENCE_REPORT'])
+  logging.info('Convergence times:\n%s', convergence.RECORDER.Table())
+  # Set CHIDO_TRACE_FILE to keep the spans of the run, see tracing.py.
+  if tracing.TRACER.enabled:
+    tracing.TRACER.Write(os.environ['CHIDO_TRACE_FILE'])
+    logging.info('Time per span:\n%s', tracing.TRACER.Table())
+  if _FAKE_SERVER is not None:
+    _FAKE_SERVER.stop(None)
+
 
 if __name__ == '__main__':
   logging.set_verbosity(logging.INFO)
@@ -0,0 +1,447 @@
+"""Unit tests for chido, talking to an in-process fake target.
+
+chido_test.py runs against APs (or a fake target standing in for them); these
+test chido's own logic offline.
+"""
+import decimal
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import chido
+import chido_test
+import constants
+import convergence
+import fake_ap
+import gnmi_lib
+import gnmi_metrics
+import gnmi_pb2
+import grpc
+
+
+_FILES = 'testdata/'
+_DELAY = 0.2
+_MIST = 'ap-02-100.example.com'
+_RADIO = '/access-points/access-point[hostname=%s]/radios/radio[id=0]/%s'
+_HOSTNAME = '/access-points/access-point[hostname=%s]/hostname' % _MIST
+
+
+def _Path(xpath):
+  return gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath))
+
+
+class _FakeTargetTest(unittest.TestCase):
+  """Serves a fake Mist AP, which chido reaches through CHIDO_FAKE_TARGET."""
+
+  def setUp(self):
+    super(_FakeTargetTest, self).setUp()
+    self.target = fake_ap.FakeTarget([
+        fake_ap.FakeAp(_MIST, 'mist', mac='5C:5B:35:01:02:03', model='AP41',
+                       convergence_delay=_DELAY)])
+    server, port = fake_ap.Serve(self.target)
+    self.addCleanup(server.stop, None)
+    environ = mock.patch.dict(os.environ,
+                              {'CHIDO_FAKE_TARGET': 'localhost:%d' % port})
+    environ.start()
+    self.addCleanup(environ.stop)
+    # Learned delays stay out of ~/.chido and of the other tests.
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    scheduler = mock.patch.object(
+        convergence, 'SCHEDULER',
+        convergence.Scheduler(os.path.join(directory.name, 'convergence.json')))
+    scheduler.start()
+    self.addCleanup(scheduler.stop)
+    self.ap = chido_test.ApObject(_MIST)
+    self.ap.vendor = 'mist'
+    self.ap.mac = '5C:5B:35:01:02:03'
+    self.ap.model = 'AP41'
+
+
+class PrefixTest(_FakeTargetTest):
+
+  def _SetResponse(self, prefix, xpaths):
+    return gnmi_pb2.SetResponse(prefix=prefix, response=[
+        gnmi_pb2.UpdateResult(path=_Path(xpath),
+                              op=gnmi_pb2.UpdateResult.UPDATE)
+        for xpath in xpaths])
+
+  def testUnverifiedVendorGetsFullPaths(self):
+    with mock.patch.dict(constants.GNMI_PREFIX_SUPPORT, {'mist': False}):
+      prefix, paths = chido._ParsePaths(self.ap, [_RADIO % (_MIST, 'config')])
+    self.assertIsNone(prefix)
+    self.assertEqual(gnmi_lib.PathToXpath(paths[0]),
+                     _RADIO % (_MIST, 'config'))
+
+  def testSetAtPaths(self):
+    prefix = _Path('/access-points/access-point[hostname=%s]' % _MIST)
+    paths = [_Path('/radios/radio[id=0]/config')]
+    self.assertTrue(chido._SetAtPaths(prefix, paths, self._SetResponse(
+        prefix, ['/radios/radio[id=0]/config'])))
+    self.assertTrue(chido._SetAtPaths(prefix, paths, self._SetResponse(
+        None, [_RADIO % (_MIST, 'config')])))
+    self.assertTrue(chido._SetAtPaths(prefix, paths, self._SetResponse(
+        None, [])))
+    # The target dropped the prefix and applied the Set at the relative path.
+    self.assertFalse(chido._SetAtPaths(prefix, paths, self._SetResponse(
+        None, ['/radios/radio[id=0]/config'])))
+
+  def testIgnoredPrefixIsResentWithFullPaths(self):
+    sent = []
+
+    def _Request(prefix, paths):
+      sent.append(prefix)
+      return self._SetResponse(None, [gnmi_lib.PathToXpath(p) for p in paths])
+
+    chido._GetStub(self.ap)
+    with mock.patch.dict(constants.GNMI_PREFIX_SUPPORT, {'mist': True}):
+      chido._Set(self.ap, [_RADIO % (_MIST, 'config')], _Request)
+      self.assertEqual(len(sent), 2)
+      self.assertIsNotNone(sent[0])
+      self.assertIsNone(sent[1])
+      self.assertIs(self.ap.prefix_support, False)
+      self.assertIsNone(chido._ParsePaths(
+          self.ap, [_RADIO % (_MIST, 'config')])[0])
+
+  def testPrefixAppliedByTarget(self):
+    with mock.patch.dict(constants.GNMI_PREFIX_SUPPORT, {'mist': True}):
+      self.assertTrue(chido.SetConfig(
+          self.ap, _FILES + 'mist_radio_base.json',
+          xpath=_RADIO % (_MIST, 'config')))
+    self.assertIsNone(getattr(self.ap, 'prefix_support', None))
+    config = chido._ResponseJson(chido.GetPath(
+        self.ap, _RADIO % (_MIST, 'config'), data_type='CONFIG'),
+                                 _RADIO % (_MIST, 'config'))
+    self.assertEqual(config['openconfig-access-points:channel'], 36)
+
+
+class LeafEncodingTest(_FakeTargetTest):
+
+  def testAdvertisedEncoding(self):
+    self.assertEqual(chido._LeafEncoding(self.ap), 'PROTO')
+    values = chido.GetLeafValues(self.ap, [_HOSTNAME], data_type='ALL')
+    self.assertEqual(list(values.values()), [_MIST])
+
+  def testEncodingNotAdvertised(self):
+    mist = fake_ap.PROFILES['mist']
+    self.target.aps[_MIST].profile = fake_ap.Profile(
+        'mist', mist.binding, qualify_all=True, encodings=('JSON_IETF',))
+    self.assertEqual(chido._LeafEncoding(self.ap), 'JSON_IETF')
+    self.assertEqual(self.ap.leaf_encoding, 'JSON_IETF')
+
+  def testFallbackIsCountedAsRetry(self):
+    mist = fake_ap.PROFILES['mist']
+    self.target.aps[_MIST].profile = fake_ap.Profile(
+        'mist', mist.binding, qualify_all=True, encodings=('JSON_IETF',))
+    self.ap.leaf_encoding = 'PROTO'  # Eg. advertised, but rejected.
+    for _ in range(3):  # Polls sending the same Get are not retries.
+      self.assertEqual(chido.GetLeafValues(self.ap, [_HOSTNAME],
+                                           data_type='ALL'),
+                       {_HOSTNAME: _MIST})
+    self.assertEqual(self.ap.leaf_encoding, 'JSON_IETF')
+    get = [stats for stats in gnmi_metrics.REGISTRY.Snapshot()
+           if stats['target'] == self.ap.gnmi_target and
+           stats['method'] == 'Get']
+    self.assertEqual(get[0]['codes'], {'INVALID_ARGUMENT': 1, 'OK': 3})
+    self.assertEqual(get[0]['retries'], 1)
+
+  def testVendorWithoutLeafEncoding(self):
+    with mock.patch.dict(constants.GNMI_LEAF_ENCODINGS, clear=True):
+      self.assertEqual(chido._LeafEncoding(self.ap), 'JSON_IETF')
+
+
+class FreshStateTest(_FakeTargetTest):
+
+  def setUp(self):
+    super(FreshStateTest, self).setUp()
+    get_paths = mock.patch.object(chido, 'GetPaths', wraps=chido.GetPaths)
+    self.get_paths = get_paths.start()
+    self.addCleanup(get_paths.stop)
+
+  def _GetFresh(self, polls=20):
+    return chido._GetFreshPaths(self.ap, [_HOSTNAME], data_type='ALL',
+                                polls=polls, poll_delay=0.05)
+
+  def testWithoutSet(self):
+    self.assertTrue(self._GetFresh().notification)
+    self.assertEqual(self.get_paths.call_count, 1)
+
+  def testStaleThenFresh(self):
+    # The Set is stamped ahead of the state the target serves for 0.3s.
+    self.ap.last_set_ns = time.time_ns() + 300 * 10**6
+    gnmi_response = self._GetFresh()
+    self.assertGreaterEqual(chido._ResponseTimestamp(gnmi_response),
+                            self.ap.last_set_ns)
+    self.assertGreater(self.get_paths.call_count, 1)
+
+  def testPollsExhausted(self):
+    self.ap.last_set_ns = time.time_ns() + 3600 * 10**9
+    with self.assertRaises(chido.StaleStateError):
+      self._GetFresh(polls=3)
+    self.assertEqual(self.get_paths.call_count, 3)
+
+
+class ConfigMismatchTest(_FakeTargetTest):
+  """The AP keeps its config, so the state read sent alongside is cancelled."""
+
+  def setUp(self):
+    super(ConfigMismatchTest, self).setUp()
+    self.assertTrue(chido.SetConfig(self.ap, _FILES + 'mist_radio_base.json',
+                                    xpath=_RADIO % (_MIST, 'config')))
+    # State Gets are held until the test ends, so they are still in flight
+    # when config is compared.
+    self.state_gets = []
+    release = threading.Event()
+    self.addCleanup(release.set)
+    serve = self.target._Serve
+
+    def _Serve(method, request, context):
+      if method == 'Get' and request.type == gnmi_pb2.GetRequest.STATE:
+        self.state_gets.append(request)
+        release.wait(10)
+      return serve(method, request, context)
+
+    self.target._Serve = _Serve
+    self.futures = []
+
+    def _GetPathsFuture(*args, **kwargs):
+      self.futures.append(get_paths_future(*args, **kwargs))
+      return self.futures[-1]
+
+    get_paths_future = chido._GetPathsFuture
+    for name, patch in (('_GetPathsFuture', _GetPathsFuture),
+                        ('SetConfig', mock.DEFAULT),
+                        ('SetLeaves', mock.DEFAULT)):
+      patcher = mock.patch.object(chido, name, patch)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    verify = mock.patch.object(chido, '_VerifyContainerState')
+    self.verify = verify.start()
+    self.addCleanup(verify.stop)
+
+  def _CheckStateReadCancelled(self):
+    self.assertEqual(len(self.futures), 1)
+    self.assertTrue(self.futures[0].cancelled())
+    self.assertEqual(len(self.state_gets), 1)  # The concurrent read, no poll.
+    self.verify.assert_not_called()
+
+  def testSetContainer(self):
+    radio = chido.GetContainerFromJson(self.ap, _FILES + 'mist_radio_base.json',
+                                       'radios')
+    radio.channel = 40
+    self.ap.radio_id = '0'
+    with self.assertRaisesRegex(chido.ConfigError, 'does not match'):
+      chido.SetContainer(self.ap, 'radios', radio)
+    self._CheckStateReadCancelled()
+
+  def testCycleTransmitPowers(self):
+    radio = chido.GetContainerFromJson(self.ap, _FILES + 'mist_radio_base.json',
+                                       'radios')
+    with self.assertRaisesRegex(chido.ConfigError,
+                                'Radio "0" config does not match'):
+      chido.CycleTransmitPowers(self.ap, radio, [10, 15],
+                                state_fetch='leaves')
+    self._CheckStateReadCancelled()
+
+
+class JoinedAPsTest(_FakeTargetTest):
+
+  def testOneGetPerManager(self):
+    with mock.patch.object(chido, 'GetPath', wraps=chido.GetPath) as get_path:
+      joined_aps = chido.GetJoinedAPs(self.ap)
+      state = chido.ValidateJoinedAPs(self.ap, joined_aps=joined_aps)
+      discovered = chido.DiscoverJoinedAPs(self.ap, joined_aps=joined_aps)
+    self.assertEqual(get_path.call_count, 1)
+    self.assertEqual(state.hostname, _MIST)
+    self.assertEqual(discovered.Get(_MIST).mac, self.ap.mac)
+    self.assertEqual(discovered.Get(_MIST).opstate, 'UP')
+
+  def testNotJoined(self):
+    joined_aps = chido.GetJoinedAPs(self.ap)
+    with self.assertRaisesRegex(chido.StateMismatchError,
+                                'AP ap-9.example.com is not joined'):
+      chido.ValidateJoinedAPs(chido_test.ApObject('ap-9.example.com'),
+                              joined_aps=joined_aps)
+
+  def testDiscoveredRecordsHaveNoDefaults(self):
+    joined_aps = chido.GetJoinedAPs(self.ap)
+    joined_aps.joined_ap[_MIST].state._unset_power_source()
+    record = chido.DiscoverJoinedAPs(self.ap, joined_aps=joined_aps).Get(_MIST)
+    self.assertIsNone(record.power_source)
+
+
+class LeafScalarTest(unittest.TestCase):
+
+  def _Scalars(self, proto, json_ietf):
+    """Returns the scalars of a PROTO and a JSON_IETF encoded leaf value."""
+    return (chido._LeafScalar(gnmi_lib.DecodeTypedValue(proto)),
+            chido._LeafScalar(gnmi_lib.DecodeTypedValue(
+                gnmi_pb2.TypedValue(json_ietf_val=json_ietf.encode('utf8')))))
+
+  def testIntegers(self):
+    # JSON_IETF sends 64-bit integers as strings.
+    self.assertEqual(*self._Scalars(gnmi_pb2.TypedValue(uint_val=36), '36'))
+    self.assertEqual(*self._Scalars(gnmi_pb2.TypedValue(uint_val=2**40),
+                                    '"%d"' % 2**40))
+    self.assertEqual(*self._Scalars(gnmi_pb2.TypedValue(int_val=-60), '-60'))
+
+  def testIdentities(self):
+    proto, json_ietf = self._Scalars(
+        gnmi_pb2.TypedValue(string_val='openconfig-wifi-types:FREQ_5GHZ'),
+        '"FREQ_5GHZ"')
+    self.assertEqual(proto, 'FREQ_5GHZ')
+    self.assertEqual(proto, json_ietf)
+
+  def testBooleansAreNotStrings(self):
+    proto, json_ietf = self._Scalars(gnmi_pb2.TypedValue(bool_val=True),
+                                     'true')
+    self.assertIs(proto, True)
+    self.assertIs(json_ietf, True)
+    self.assertNotEqual(chido._LeafScalar('true'), proto)
+
+  def testDecimals(self):
+    proto, json_ietf = self._Scalars(gnmi_pb2.TypedValue(
+        decimal_val=gnmi_pb2.Decimal64(digits=155, precision=1)), '"15.5"')
+    self.assertEqual(proto, json_ietf)
+    self.assertEqual(chido._LeafScalar(decimal.Decimal('15.5')), '15.5')
+
+  def testLeafLists(self):
+    proto = gnmi_pb2.TypedValue(leaflist_val=gnmi_pb2.ScalarArray(element=[
+        gnmi_pb2.TypedValue(uint_val=channel) for channel in (1, 6, 11)]))
+    self.assertEqual(self._Scalars(proto, '[1, 6, 11]'),
+                     (('1', '6', '11'),) * 2)
+
+  def testMissingValue(self):
+    self.assertIsNone(chido._LeafScalar(
+        gnmi_lib.DecodeTypedValue(gnmi_pb2.TypedValue())))
+
+
+class LeafTrackerTest(unittest.TestCase):
+
+  def setUp(self):
+    super(LeafTrackerTest, self).setUp()
+    self.ap = chido_test.ApObject(_MIST)
+    self.ap.last_set_time = time.time() - 5
+    self.tracker = chido.LeafTracker(
+        self.ap, _RADIO % (_MIST, 'state/'),
+        {'channel': 36, 'operating-frequency': 'FREQ_5GHZ', 'enabled': True})
+
+  def testPendingXpaths(self):
+    self.assertEqual(self.tracker.PendingXpaths(), [
+        _RADIO % (_MIST, 'state/channel'), _RADIO % (_MIST, 'state/enabled'),
+        _RADIO % (_MIST, 'state/operating-frequency')])
+
+  def testLeavesConvergeAcrossUpdates(self):
+    self.tracker.Update({'channel': '36', 'enabled': False})
+    self.assertEqual(self.tracker.pending, {'enabled', 'operating-frequency'})
+    self.assertEqual(self.tracker.PendingXpaths(), [
+        _RADIO % (_MIST, 'state/enabled'),
+        _RADIO % (_MIST, 'state/operating-frequency')])
+    with self.assertRaisesRegex(
+        chido.StateMismatchError, r'2 leaf mismatch\(es\) on AP %s after 1 '
+        r'poll\(s\): "enabled" expected "True", got "False"; '
+        r'"operating-frequency" expected "FREQ_5GHZ", got "None"' % _MIST):
+      self.tracker.Check()
+    self.tracker.Update({
+        'enabled': True,
+        'operating-frequency': 'openconfig-wifi-types:FREQ_5GHZ'})
+    self.tracker.Check()
+    self.assertEqual(self.tracker.polls, 2)
+    self.assertEqual(set(self.tracker.converged), set(self.tracker.expected))
+    self.assertGreaterEqual(min(self.tracker.converged.values()), 5)
+    self.assertRegex(self.tracker.Report(),
+                     r'^channel 5\.\ds, enabled 5\.\ds, '
+                     r'operating-frequency 5\.\ds$')
+
+  def testDeletedLeaf(self):
+    self.tracker.Update({'channel': 40, 'enabled': True,
+                         'operating-frequency': 'FREQ_5GHZ'})
+    self.assertEqual(self.tracker.last['channel'], 40)
+    # The leaf was deleted from state, eg. while the radio restarts.
+    self.tracker.Update({})
+    self.assertIsNone(self.tracker.last['channel'])
+    self.assertEqual(self.tracker.pending, {'channel'})
+    with self.assertRaisesRegex(chido.StateMismatchError,
+                                '"channel" expected "36", got "None"'):
+      self.tracker.Check()
+    # Converged leaves are not polled again, a delete does not undo them.
+    self.assertEqual(set(self.tracker.converged),
+                     {'enabled', 'operating-frequency'})
+    self.assertTrue(self.tracker.Report().endswith(', channel pending'))
+    self.tracker.Update({'channel': 36})
+    self.tracker.Check()
+    self.assertFalse(self.tracker.pending)
+
+
+class CheckPortIsOpenTest(unittest.TestCase):
+
+  def setUp(self):
+    super(CheckPortIsOpenTest, self).setUp()
+    self.ap = chido_test.ApObject('localhost')
+    self.listener = socket.socket()
+    self.addCleanup(self.listener.close)
+    self.listener.bind(('localhost', 0))
+    self.port = self.listener.getsockname()[1]
+
+  def testOpenPort(self):
+    self.listener.listen(1)
+    self.assertTrue(chido.CheckPortIsOpen(self.ap, self.port))
+
+  def testClosedPort(self):
+    self.assertFalse(chido.CheckPortIsOpen(self.ap, self.port))
+
+  def testUnknownHost(self):
+    self.assertFalse(chido.CheckPortIsOpen(
+        chido_test.ApObject('ap.invalid'), self.port))
+
+
+class BudgetTest(_FakeTargetTest):
+
+  def testRpcDeadlineIsTheRemainingTime(self):
+    self.assertAlmostEqual(chido.Budget(10, rpc_timeout=60).Timeout(), 10,
+                           delta=0.5)
+    self.assertEqual(chido.Budget(100, rpc_timeout=5).Timeout(), 5)
+
+  def testRpcDeadlinePropagates(self):
+    self.target.faults = fake_ap.Faults(rtt=5.0)
+    start = time.time()
+    with self.assertRaises(grpc.RpcError) as e:
+      chido.GetPath(self.ap, _HOSTNAME, budget=chido.Budget(0.3))
+    self.assertEqual(e.exception.code(), grpc.StatusCode.DEADLINE_EXCEEDED)
+    self.assertLess(time.time() - start, 2)
+
+  def testExhaustedBudgetReportsPhases(self):
+    budget = chido.Budget(0.1)
+    with self.assertRaisesRegex(chido.BudgetExhaustedError,
+                                'Time budget of 0.1s exhausted in rpc:Get'):
+      with budget.Phase('rpc:Get'):
+        time.sleep(0.15)
+        budget.Timeout()
+    with self.assertRaisesRegex(chido.BudgetExhaustedError,
+                                r'exhausted\. Spent 0\.\ds: rpc:Get 0\.\ds'):
+      budget.Timeout()
+
+  def testDefaultBudget(self):
+    budgeted = chido._Budgeted(5)(lambda ap, budget=None: budget)
+    self.assertEqual(budgeted(self.ap).seconds, 5)
+    budget = chido.Budget(1)
+    self.assertIs(budgeted(self.ap, budget=budget), budget)
+
+  def testBudgetEndsVerification(self):
+    # State never converges, so polls go on until the budget is exhausted.
+    self.target.aps[_MIST].convergence_delay = 3600
+    ssid = chido.GetContainerFromJson(self.ap, _FILES + 'mist_ssid_base.json',
+                                      'ssids')
+    start = time.time()
+    with self.assertRaisesRegex(chido.BudgetExhaustedError,
+                                'Time budget of 1.0s exhausted'):
+      chido.SetContainer(self.ap, 'ssids', ssid, budget=chido.Budget(1.0))
+    self.assertLess(time.time() - start, 3)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -6,6 +6,45 @@ GNMI_TARGETPORTS = {
     'cisco': '10161',
     'aruba': '10162'
 }
+# Whether the vendor is known to apply a request prefix (shared by all paths
+# in it).  Set it once verified against the vendor's APs; others get full paths.
+GNMI_PREFIX_SUPPORT = {
+    'mist': False,
+    'arista': False,
+    'aruba': False
+}
+# Encoding used for leaf-level Get/Set/Subscribe; PROTO carries scalar
+# TypedValues.  chido only uses it if the AP's Capabilities advertise it, and
+# falls back to JSON_IETF per AP if the target rejects it anyway.
+GNMI_LEAF_ENCODINGS = {
+    'mist': 'PROTO',
+    'arista': 'PROTO',
+    'aruba': 'PROTO'
+}
+# Model versions supported by each vendor, see README "Updating bindings".
+OC_MODEL_VERSIONS = {
+    'arista': {
+        'openconfig-access-points': '0.3.0',
+        'openconfig-ap-manager': '0.1.1',
+        'openconfig-wifi-mac': '0.4.0',
+        'openconfig-wifi-phy': '0.4.0',
+        'openconfig-wifi-types': '0.1.1'
+    },
+    'aruba': {
+        'openconfig-access-points': '0.2.0',
+        'openconfig-ap-manager': '0.1.1',
+        'openconfig-wifi-mac': '0.3.0',
+        'openconfig-wifi-phy': '0.2.0',
+        'openconfig-wifi-types': '0.1.0'
+    },
+    'mist': {
+        'openconfig-access-points': '0.2.0',
+        'openconfig-ap-manager': '0.1.1',
+        'openconfig-wifi-mac': '0.3.0',
+        'openconfig-wifi-phy': '0.2.0',
+        'openconfig-wifi-types': '0.1.0'
+    }
+}
 ARISTA_CA_CERT = b"""
 -----BEGIN CERTIFICATE-----
 MIIFZDCCA0wCCQDJgoRi4SucQjANBgkqhkiG9w0BAQsFADBzMQswCQYDVQQGEwJV
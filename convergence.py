@@ -0,0 +1,255 @@
+"""Schedules state polls from the convergence times measured on earlier runs.
+
+An AP applies config asynchronously, so chido polls its state until it matches.
+How long that takes depends on the vendor, the container and the leaf (a Mist
+channel change takes seconds, an Arista DFS channel change over a minute).  The
+Scheduler keeps a moving average and deviation of the convergence time per
+(vendor, container, leaf), persisted between runs, and derives the delays
+between polls from it: the first poll waits until convergence is likely, later
+ones back off geometrically.  Every delay is jittered so many APs sharing an
+endpoint do not poll in lockstep.
+
+The Recorder keeps histograms of the time until config and state matched and
+of the number of state polls, per (vendor, model, firmware, container, leaf,
+value), so slow vendors, containers and values stand out.
+"""
+import atexit
+import json
+import os
+import random
+import tempfile
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Text, Tuple
+import gnmi_metrics
+
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.chido',
+                            'convergence.json')
+_VERSION = 1
+_ALPHA = 0.3  # Weight of a new measurement in the moving averages.
+_LABEL_NAMES = ('vendor', 'model', 'firmware', 'container', 'leaf', 'value')
+POLL_BOUNDS = (1, 2, 3, 5, 8, 13, 21, 30)
+
+
+class _Stats(object):
+  """Moving average and mean deviation of one key's convergence time."""
+
+  def __init__(self, count: int = 0, mean: float = 0.0, dev: float = 0.0):
+    self.count = count
+    self.mean = mean
+    self.dev = dev
+
+  def Add(self, seconds: float) -> None:
+    if not self.count:
+      self.mean, self.dev = seconds, seconds / 2
+    else:
+      self.dev += _ALPHA * (abs(seconds - self.mean) - self.dev)
+      self.mean += _ALPHA * (seconds - self.mean)
+    self.count += 1
+
+
+class Scheduler(object):
+  """Learns convergence times and yields the delays between state polls."""
+
+  def __init__(self, path: Optional[Text] = None, min_delay: float = 0.5,
+               max_delay: float = 300.0, growth: float = 1.6,
+               jitter: float = 0.25, rng: Optional[random.Random] = None):
+    """Initializes a Scheduler.
+
+    Args:
+      path: (str) JSON file the statistics are loaded from and saved to, None
+        to keep them in memory only.
+      min_delay: (float) shortest delay between polls, in seconds.
+      max_delay: (float) longest delay between polls, in seconds.
+      growth: (float) factor each delay grows by after the first one.
+      jitter: (float) delays are scaled by a random factor in 1 +/- jitter.
+      rng: (random.Random) source of the jitter.
+    """
+    self.path = path
+    self.min_delay = min_delay
+    self.max_delay = max_delay
+    self.growth = growth
+    self.jitter = jitter
+    self._rng = rng or random.Random()
+    self._lock = threading.Lock()
+    self._stats = None  # Loaded on first use.
+    self._dirty = False
+
+  def _Loaded(self) -> Dict[Tuple[Text, ...], _Stats]:
+    """Returns the statistics, loading them from path the first time."""
+    if self._stats is None:
+      self._stats = {}
+      try:
+        with open(self.path, 'rt') as f:
+          data = json.load(f)
+      except (TypeError, OSError, ValueError):  # No path, no file or corrupt.
+        data = {}
+      if data.get('version') == _VERSION:
+        for key, stats in data.get('stats', {}).items():
+          self._stats[tuple(key.split('|'))] = _Stats(**stats)
+    return self._stats
+
+  def Expected(self, key: Tuple[Text, ...]) -> Optional[Tuple[float, float]]:
+    """Returns the (mean, deviation) convergence time of key, if measured."""
+    with self._lock:
+      stats = self._Loaded().get(key)
+      if stats is None:
+        return None
+      return stats.mean, stats.dev
+
+  def Record(self, key: Tuple[Text, ...], seconds: float) -> None:
+    """Records how long key took to converge.
+
+    Args:
+      key: (tuple) vendor, container and leaf that converged.
+      seconds: (float) time from the Set until state matched.
+    """
+    with self._lock:
+      self._Loaded().setdefault(key, _Stats()).Add(seconds)
+      self._dirty = True
+
+  def Delays(self, key: Tuple[Text, ...]) -> Iterator[float]:
+    """Yields the delays (seconds) between consecutive polls of key.
+
+    Without history the delays start at twice min_delay.  With history the
+    first delay lasts until one deviation before the mean convergence time,
+    and later ones start at half a deviation.  All grow by growth up to
+    max_delay.
+
+    Args:
+      key: (tuple) vendor, container and leaf being polled.
+    """
+    expected = self.Expected(key)
+    if expected is None:
+      first = delay = 2 * self.min_delay
+    else:
+      mean, dev = expected
+      first = mean - dev
+      delay = dev / 2
+    delay = max(delay, self.min_delay)
+    yield self._Jittered(max(first, self.min_delay))
+    while True:
+      yield self._Jittered(delay)
+      delay = min(delay * self.growth, self.max_delay)
+
+  def _Jittered(self, delay: float) -> float:
+    delay *= self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+    return min(max(delay, self.min_delay), self.max_delay)
+
+  def Save(self) -> None:
+    """Atomically writes the statistics to path if they changed."""
+    with self._lock:
+      if not self.path or not self._dirty:
+        return
+      data = {'version': _VERSION,
+              'stats': {'|'.join(key): vars(stats)
+                        for key, stats in sorted(self._stats.items())}}
+      directory = os.path.dirname(os.path.abspath(self.path))
+      os.makedirs(directory, exist_ok=True)
+      with tempfile.NamedTemporaryFile('wt', dir=directory,
+                                       delete=False) as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+      os.replace(f.name, self.path)
+      self._dirty = False
+
+
+# In memory only, unless an entry point calls Persist.
+SCHEDULER = Scheduler(os.environ.get('CHIDO_CONVERGENCE_FILE') or None)
+
+
+def Persist() -> None:
+  """Loads SCHEDULER's statistics from a file, and saves them there at exit.
+
+  The file is CHIDO_CONVERGENCE_FILE, DEFAULT_PATH if it is not set; set it to
+  '' to keep the statistics in memory only.  Only entry points running tests
+  against APs (chido_test) call it, so unit tests never write to the home
+  directory.
+  """
+  global SCHEDULER
+  path = os.environ.get('CHIDO_CONVERGENCE_FILE', DEFAULT_PATH)
+  if not path:
+    return
+  if SCHEDULER.path != path:
+    SCHEDULER = Scheduler(path)
+  atexit.unregister(SCHEDULER.Save)
+  atexit.register(SCHEDULER.Save)
+
+
+class _CycleStats(object):
+  """Convergence of one (vendor, model, firmware, container, leaf, value)."""
+
+  def __init__(self):
+    self.config_seconds = gnmi_metrics.Histogram()
+    self.state_seconds = gnmi_metrics.Histogram()
+    self.polls = gnmi_metrics.Histogram(POLL_BOUNDS)
+    self.failures = 0
+
+
+class Recorder(object):
+  """Thread-safe store of Set-then-verify convergence measurements."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._stats = {}  # label tuple -> _CycleStats.
+
+  def Observe(self, labels: Tuple[Text, ...], polls: int,
+              state_seconds: Optional[float] = None,
+              config_seconds: Optional[float] = None) -> None:
+    """Records one Set-then-verify cycle.
+
+    Args:
+      labels: (tuple) vendor, model, firmware, container, leaf and value.
+      polls: (int) number of state polls made.
+      state_seconds: (float) time from the Set until state matched, None if
+        it never did.
+      config_seconds: (float) time from the Set until config matched, None if
+        not measured.
+    """
+    with self._lock:
+      stats = self._stats.get(labels)
+      if stats is None:
+        stats = self._stats[labels] = _CycleStats()
+      stats.polls.Observe(polls)
+      if config_seconds is not None:
+        stats.config_seconds.Observe(config_seconds)
+      if state_seconds is None:
+        stats.failures += 1
+      else:
+        stats.state_seconds.Observe(state_seconds)
+
+  def Reset(self) -> None:
+    """Drops every recorded measurement."""
+    with self._lock:
+      self._stats.clear()
+
+  def Snapshot(self) -> List[Dict[Text, Any]]:
+    """Returns the measurements, one dict per label combination."""
+    with self._lock:
+      return [dict(zip(_LABEL_NAMES, labels),
+                   config_seconds=stats.config_seconds.Summary(),
+                   state_seconds=stats.state_seconds.Summary(),
+                   polls=stats.polls.Summary(), failures=stats.failures)
+              for labels, stats in sorted(self._stats.items())]
+
+  def Table(self) -> Text:
+    """Returns the state convergence percentiles as a text table."""
+    lines = ['%-8s %-10s %-10s %-14s %-16s %-8s %5s %7s %7s %7s %5s' % (
+        _LABEL_NAMES + ('count', 'p50', 'p90', 'p99', 'fail'))]
+    for entry in self.Snapshot():
+      state = entry['state_seconds']
+      lines.append('%-8s %-10s %-10s %-14s %-16s %-8s %5d %7s %7s %7s %5d' % (
+          tuple(entry[name] for name in _LABEL_NAMES) + (
+              state['count'],) + tuple(
+                  '-' if state[p] is None else '%.1f' % state[p]
+                  for p in ('p50', 'p90', 'p99')) + (entry['failures'],)))
+    return '\n'.join(lines) + '\n'
+
+  def WriteJson(self, path: Text) -> None:
+    """Atomically writes the snapshot to a JSON file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('wt', dir=directory, delete=False) as f:
+      json.dump(self.Snapshot(), f, indent=2)
+    os.replace(f.name, path)
+
+
+RECORDER = Recorder()
@@ -0,0 +1,95 @@
+"""Unit tests for the convergence poll scheduler."""
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import convergence
+
+
+_KEY = ('arista', 'radios', 'channel')
+
+
+class SchedulerTest(unittest.TestCase):
+
+  def setUp(self):
+    super(SchedulerTest, self).setUp()
+    self.path = os.path.join(tempfile.mkdtemp(), 'convergence.json')
+
+  def _Scheduler(self, jitter=0.0):
+    return convergence.Scheduler(self.path, jitter=jitter,
+                                 rng=random.Random(1))
+
+  def _Delays(self, scheduler, count):
+    delays = scheduler.Delays(_KEY)
+    return [next(delays) for _ in range(count)]
+
+  def testDelaysWithoutHistoryGrow(self):
+    delays = self._Delays(self._Scheduler(), 4)
+    self.assertEqual(delays[:2], [1.0, 1.0])
+    self.assertAlmostEqual(delays[3], 1.6 ** 2)
+
+  def testFirstDelayWaitsForExpectedConvergence(self):
+    scheduler = self._Scheduler()
+    for _ in range(5):
+      scheduler.Record(_KEY, 60.0)
+    delays = self._Delays(scheduler, 2)
+    self.assertGreater(delays[0], 40.0)
+    self.assertLess(delays[1], delays[0])
+
+  def testDelaysAreCapped(self):
+    scheduler = self._Scheduler()
+    scheduler.Record(_KEY, 10000.0)
+    self.assertEqual(max(self._Delays(scheduler, 30)), 300.0)
+
+  def testJitter(self):
+    delays = self._Delays(self._Scheduler(jitter=0.25), 10)
+    self.assertNotEqual(delays[0], delays[1])
+    self.assertTrue(all(0.5 <= d <= 300.0 for d in delays))
+
+  def testStatisticsPersist(self):
+    scheduler = self._Scheduler()
+    scheduler.Record(_KEY, 12.0)
+    scheduler.Save()
+    self.assertEqual(self._Scheduler().Expected(_KEY), (12.0, 6.0))
+    self.assertIsNone(self._Scheduler().Expected(('mist', 'radios', '*')))
+
+  def testCorruptFileIsIgnored(self):
+    with open(self.path, 'wt') as f:
+      f.write('{not json')
+    self.assertIsNone(self._Scheduler().Expected(_KEY))
+
+  def testInMemoryUnlessPersisted(self):
+    with mock.patch.object(convergence, 'SCHEDULER',
+                           convergence.Scheduler(None)), \
+        mock.patch.object(convergence.atexit, 'register') as register:
+      with mock.patch.dict(os.environ, {'CHIDO_CONVERGENCE_FILE': ''}):
+        convergence.Persist()
+      self.assertIsNone(convergence.SCHEDULER.path)
+      with mock.patch.dict(os.environ, {'CHIDO_CONVERGENCE_FILE': self.path}):
+        convergence.Persist()
+      self.assertEqual(convergence.SCHEDULER.path, self.path)
+      register.assert_called_once_with(convergence.SCHEDULER.Save)
+
+
+class RecorderTest(unittest.TestCase):
+
+  def testObserve(self):
+    recorder = convergence.Recorder()
+    labels = ('arista', 'C-130', '8.8', 'radios', 'channel', '52')
+    recorder.Observe(labels, 1, state_seconds=2.0, config_seconds=1.0)
+    recorder.Observe(labels, 4, state_seconds=70.0, config_seconds=1.5)
+    recorder.Observe(labels, 30)
+    entry = recorder.Snapshot()[0]
+    self.assertEqual(entry['value'], '52')
+    self.assertEqual(entry['state_seconds']['count'], 2)
+    self.assertEqual(entry['state_seconds']['max'], 70.0)
+    self.assertEqual(entry['config_seconds']['count'], 2)
+    self.assertEqual(entry['polls']['count'], 3)
+    self.assertEqual(entry['failures'], 1)
+    self.assertIn('arista', recorder.Table())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,1313 @@
+"""A fake gNMI target emulating OpenConfig access points.
+
+FakeTarget implements Get, Set, Subscribe and Capabilities for one or more
+FakeAps, so chido_test and the performance features can run on one machine
+without real APs.  ServeFleet serves thousands of them from one asyncio
+process, selected by their path keys or by port; their leaves are stored as
+one list of values per AP, indexed by paths shared by the whole fleet (see
+Layout).  Every Set is validated by the same PyangBind bindings chido
+uses and rejected with INVALID_ARGUMENT if it does not adhere to the schema.
+Each config leaf is mirrored to its state leaf (.../config/x -> .../state/x)
+once the AP's convergence delay has passed, like an AP applying config.
+
+Vendor quirks are emulated by Profiles: Arista keys radios by id and
+operating-frequency, Mist qualifies every JSON member with its module name and
+each vendor answers UNIMPLEMENTED to a Set below the containers it does not
+support.
+
+Faults injects network and device faults per AP or per target: RTT, jitter
+and bandwidth limits, gRPC errors, dropped streams and delayed or flapping
+state convergence, to measure chido's retries and tail latency.
+
+Usage:
+  python3 fake_ap.py --port=50051 --vendor=mist \
+      --hostname=ap-02-100.example.com --mac=5C:5B:35:01:02:03
+  CHIDO_FAKE_TARGET=localhost:50051 python3 chido_test.py MistTest
+  python3 fake_ap.py --port=50051 --vendor=mist --count=5000 \
+      --hostname=ap-%05d.example.com
+  python3 fake_ap.py --rtt=0.08 --jitter=0.02 --error_rate=0.05 \
+      --error_codes=UNAVAILABLE,DEADLINE_EXCEEDED --flap=channel=11:5:2
+"""
+import argparse
+import asyncio
+import collections
+import functools
+import heapq
+import itertools
+import json
+import random
+import re
+import sys
+import threading
+import time
+from concurrent import futures
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, Optional,
+                    Text, Tuple)
+
+from absl import logging  # pip install absl-py
+import constants
+import gnmi_lib
+import gnmi_pb2
+import gnmi_pb2_grpc
+import grpc
+from pyangbind.lib.serialise import pybindJSONDecoder
+
+from bindings.v0_2_0 import binding as v020binding
+from bindings.arista import access_points as arista_aps
+from bindings.ap_manager import ap_manager
+
+_GNMI_VERSION = '0.7.0'
+_ENCODINGS = ('JSON', 'JSON_IETF', 'PROTO')
+# Module of each OpenConfig root container, used to qualify JSON members.
+_MODULES = {
+    'access-points': 'openconfig-access-points',
+    'provision-aps': 'openconfig-ap-manager',
+    'joined-aps': 'openconfig-ap-manager',
+}
+# Lists keyed by AP hostname, a Get of the whole list reads every AP.
+_AP_LISTS = ('access-points', 'joined-aps')
+# Module name of a qualified member or identity, not the octets of a MAC.
+_RE_MODULE_PREFIX = re.compile(r'^[A-Za-z][\w.-]*:(?=[^:]*$)')
+_DEFAULT_SAMPLE_INTERVAL = 1.0  # Seconds, for SAMPLE subscriptions without one.
+_CHANGE_POLL_INTERVAL = 0.1  # Seconds between ON_CHANGE checks.
+_SCHEMA_CACHE_SIZE = 4096
+_HANG = 30.0  # Seconds an injected DEADLINE_EXCEEDED waits without deadline.
+
+# A path is a tuple of (name, keys) elements, keys a sorted tuple of
+# (key name, key value) pairs, eg. (('radio', (('id', '0'),)),).
+Elem = Tuple[Text, Tuple[Tuple[Text, Text], ...]]
+Path = Tuple[Elem, ...]
+
+
+class Error(Exception):
+  """Module-level Exception class."""
+
+
+class StatusError(Error):
+  """A request failed, the RPC is aborted with the given gRPC status code."""
+
+  def __init__(self, code: grpc.StatusCode, message: Text):
+    super(StatusError, self).__init__(message)
+    self.code = code
+
+
+class Profile(object):
+  """Quirks of one vendor's gNMI implementation."""
+
+  def __init__(self, vendor: Text, binding: Callable[[], Any],
+               qualify_all: bool = False,
+               unsupported: Iterable[Text] = (),
+               encodings: Iterable[Text] = _ENCODINGS):
+    """Initializes a Profile.
+
+    Args:
+      vendor: (str) vendor name, as in constants.OC_MODEL_VERSIONS.
+      binding: (callable) returns a fresh access-points binding root.
+      qualify_all: (bool) Whether every JSON member is qualified with its
+        module name, not only the top-level ones.
+      unsupported: (list) containers a Set may not target or go below.
+      encodings: (list) gNMI encodings accepted in requests.
+    """
+    self.vendor = vendor
+    self.binding = binding
+    self.qualify_all = qualify_all
+    self.unsupported = frozenset(unsupported)
+    self.encodings = frozenset(encodings)
+    self._errors = {}  # (relative path, JSON value) -> schema error or None.
+
+  def Root(self, root_name: Text) -> Any:
+    """Returns a fresh binding root for a root container name."""
+    if root_name == 'access-points':
+      return self.binding()
+    return ap_manager.openconfig_ap_manager()
+
+  def ListKeys(self) -> Dict[Text, Tuple[Text, ...]]:
+    """Returns the key names of every list in the vendor's models."""
+    return _ListKeys(self.binding)
+
+  def SchemaError(self, path: Path, value: Any) -> Optional[Text]:
+    """Returns why value can not be set at path, None if it adheres to schema.
+
+    Results are cached per path (without the AP's list entry) and value, so a
+    config rolled out to a whole fleet is only loaded into a binding once.
+    The members of a whole AP entry are checked one by one, so the ones
+    holding the AP's hostname do not defeat the cache for the others.
+    """
+    if len(path) == 2 and isinstance(value, dict):
+      for member, child in value.items():
+        error = self.SchemaError(path + ((_Unqualified(member), ()),), child)
+        if error:
+          return error
+      return None
+    key = (_Relative(path), json.dumps(value, sort_keys=True))
+    if key in self._errors:
+      return self._errors[key]
+    try:
+      pybindJSONDecoder.load_ietf_json(Nest(path, value), None, None,
+                                       obj=self.Root(path[0][0]))
+      error = None
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+      error = str(e)
+    if len(self._errors) >= _SCHEMA_CACHE_SIZE:
+      self._errors.clear()
+    self._errors[key] = error
+    return error
+
+
+# The unsupported containers are the ones chido_test has to skip per vendor.
+PROFILES = {
+    'arista': Profile('arista', arista_aps.openconfig_access_points,
+                      unsupported=('dot11r', 'wmm')),
+    'aruba': Profile('aruba', v020binding.openconfig_access_points,
+                     unsupported=('radios', 'ssids', 'system',
+                                  'provision-aps')),
+    'mist': Profile('mist', v020binding.openconfig_access_points,
+                    qualify_all=True, unsupported=('band-steering', 'wmm')),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _ListKeys(binding: Callable[[], Any]) -> Dict[Text, Tuple[Text, ...]]:
+  """Returns {list name: key names} of a binding and of the ap-manager model."""
+  keys = {}
+  for root in (binding(), ap_manager.openconfig_ap_manager()):
+    _WalkLists(root, keys)
+  return keys
+
+
+def _WalkLists(obj: Any, keys: Dict[Text, Tuple[Text, ...]]) -> None:
+  # pylint: disable=protected-access
+  for attr in obj._pyangbind_elements:
+    child = getattr(obj, attr)
+    keyval = getattr(child, '_keyval', False)
+    if keyval is not False and hasattr(child, '_contained_class'):
+      keys[child._yang_name] = tuple(
+          name.replace('_', '-') for name in (keyval or '').split())
+      _WalkLists(child._contained_class(), keys)
+    elif hasattr(child, '_pyangbind_elements'):
+      _WalkLists(child, keys)
+
+
+def _Unqualified(name: Text) -> Text:
+  """Returns a member name or identity without its module name."""
+  return _RE_MODULE_PREFIX.sub('', name)
+
+
+def _KeyText(value: Any) -> Text:
+  """Returns a list key value as it appears in a path."""
+  if isinstance(value, bool):
+    return 'true' if value else 'false'
+  return _Unqualified(str(value))
+
+
+def _KeyValue(text: Text) -> Any:
+  """Returns a path key value as a JSON value."""
+  return int(text) if text.isdigit() else text
+
+
+def PathElems(path: gnmi_pb2.Path) -> Path:
+  """Converts a gNMI Path into a store path."""
+  return tuple((_Unqualified(elem.name),
+                tuple(sorted((k, _KeyText(v)) for k, v in elem.key.items())))
+               for elem in path.elem)
+
+
+def ElemsPath(elems: Path) -> gnmi_pb2.Path:
+  """Converts a store path into a gNMI Path."""
+  return gnmi_pb2.Path(elem=[gnmi_pb2.PathElem(name=name, key=dict(keys))
+                             for name, keys in elems])
+
+
+def Flatten(value: Any, path: Path,
+            list_keys: Dict[Text, Tuple[Text, ...]]
+           ) -> Iterator[Tuple[Path, Any]]:
+  """Yields (leaf path, value) of every leaf in a JSON_IETF value.
+
+  Args:
+    value: JSON value found at path.
+    path: (tuple) store path of value.
+    list_keys: (dict) key names of every list, see Profile.ListKeys.
+
+  Raises:
+    StatusError: A list entry lacks one of its keys.
+  """
+  if isinstance(value, dict):
+    for member, child in value.items():
+      name = _Unqualified(member)
+      if name in list_keys and isinstance(child, list):
+        for entry in child:
+          entry = {_Unqualified(k): v for k, v in entry.items()}
+          try:
+            keys = tuple(sorted((k, _KeyText(entry[k]))
+                                for k in list_keys[name]))
+          except KeyError as e:
+            raise StatusError(grpc.StatusCode.INVALID_ARGUMENT,
+                              'Entry of list %s lacks key %s' % (name, e))
+          yield from Flatten(entry, path + ((name, keys),), list_keys)
+      else:
+        yield from Flatten(child, path + ((name, ()),), list_keys)
+  elif isinstance(value, list):
+    yield path, tuple(value)
+  else:
+    yield path, value
+
+
+def Nest(path: Path, value: Any) -> Dict[Text, Any]:
+  """Returns a JSON_IETF document holding value at path (the inverse of
+  Flatten), so it can be loaded into a binding root."""
+  for name, keys in reversed(path):
+    if keys:
+      entry = {k: _KeyValue(v) for k, v in keys}
+      entry.update(value)
+      value = {name: [entry]}
+    else:
+      value = {name: value}
+  return value
+
+
+def Build(leaves: Iterable[Tuple[Path, Any]], depth: int) -> Dict[Text, Any]:
+  """Builds a JSON_IETF object from leaves, dropping the first depth elements
+  of their paths.  List entries get their key members from the path."""
+  root = {}
+  entries = {}  # (id of parent object, list name, keys) -> entry object.
+  for path, value in leaves:
+    node = root
+    elems = path[depth:]
+    for i, (name, keys) in enumerate(elems):
+      if i == len(elems) - 1:
+        node[name] = list(value) if isinstance(value, tuple) else value
+      elif keys:
+        entry_id = (id(node), name, keys)
+        entry = entries.get(entry_id)
+        if entry is None:
+          entry = entries[entry_id] = {k: _KeyValue(v) for k, v in keys}
+          node.setdefault(name, []).append(entry)
+        node = entry
+      else:
+        node = node.setdefault(name, {})
+  return root
+
+
+def Qualify(value: Any, module: Optional[Text],
+            recursive: bool = False) -> Any:
+  """Qualifies the members of a JSON object with their module name.
+
+  Args:
+    value: JSON value.
+    module: (str) module of the members, None to use the module of each
+      root container (see _MODULES).
+    recursive: (bool) Whether nested members are qualified too.
+
+  Returns:
+    the qualified JSON value.
+  """
+  if isinstance(value, list):
+    if recursive:  # Entry members stay plain, pyangbind looks keys up so.
+      return [{k: Qualify(v, module, recursive) for k, v in entry.items()}
+              if isinstance(entry, dict) else entry for entry in value]
+    return value
+  if not isinstance(value, dict):
+    return value
+  qualified = {}
+  for name, child in value.items():
+    member_module = module or _MODULES.get(name)
+    if recursive:
+      child = Qualify(child, member_module, recursive)
+    qualified['%s:%s' % (member_module, name) if member_module else
+              name] = child
+  return qualified
+
+
+def _StatePath(path: Path) -> Optional[Path]:
+  """Returns the state leaf mirroring a config leaf, None if not a config leaf.
+  """
+  for i in range(len(path) - 2, -1, -1):
+    if path[i] == ('config', ()):
+      return path[:i] + (('state', ()),) + path[i + 1:]
+  return None
+
+
+def _Relative(path: Path) -> Tuple[Any, ...]:
+  """Returns a path without the AP's list entry, eg. ('access-points',
+  ('radios', ()), ...) for /access-points/access-point[hostname=x]/radios/...
+  """
+  if not path:
+    return ()
+  return (path[0][0],) + path[2:]
+
+
+class Layout(object):
+  """Leaf paths shared by every AP of a fleet.
+
+  Paths are stored once, relative to the AP's list entry (see _Relative), and
+  numbered; an AP only holds a list of values indexed by these slots.  So
+  thousands of APs with the same config cost one list of values each.
+  """
+
+  def __init__(self):
+    self.paths = []  # Slot -> relative path.
+    self.is_state = []  # Slot -> whether the leaf is below a state container.
+    self.mirror = []  # Slot -> slot of the state leaf mirroring it, or None.
+    self._slots = {}  # Relative path -> slot.
+    self._under = {}  # Relative path prefix -> slots below it.
+    self._lock = threading.Lock()
+
+  def Slot(self, path: Tuple[Any, ...]) -> int:
+    """Returns the slot of a relative leaf path, adding it if new."""
+    slot = self._slots.get(path)
+    if slot is None:
+      with self._lock:
+        slot = self._slots.get(path)
+        if slot is None:
+          slot = self._Add(path)
+    return slot
+
+  def _Add(self, path: Tuple[Any, ...]) -> int:
+    path = tuple(_Interned(elem) for elem in path)
+    slot = self._slots[path] = len(self.paths)
+    self.paths.append(path)
+    self.is_state.append(('state', ()) in path)
+    self.mirror.append(None)
+    state_path = _StatePath(path)
+    if state_path is not None:
+      self.mirror[slot] = self._slots.get(state_path)
+      if self.mirror[slot] is None:
+        self.mirror[slot] = self._Add(state_path)
+    self._under.clear()
+    return slot
+
+  def Under(self, prefix: Tuple[Any, ...]) -> List[int]:
+    """Returns the slots of the relative paths at or below prefix."""
+    slots = self._under.get(prefix)
+    if slots is None:
+      with self._lock:
+        depth = len(prefix)
+        slots = [slot for slot, path in enumerate(self.paths)
+                 if path[:depth] == prefix]
+        self._under[prefix] = slots
+    return slots
+
+
+def _Interned(value: Any) -> Any:
+  """Returns value with its strings interned, so equal ones are shared."""
+  if isinstance(value, str):
+    return sys.intern(value)
+  if isinstance(value, tuple):
+    return tuple(_Interned(v) for v in value)
+  return value
+
+
+LAYOUT = Layout()  # Shared by the FakeAps not given one.
+_UNSET = object()  # Value of a slot the AP has no leaf for.
+
+
+def _Matches(is_state: bool, data_type: int) -> bool:
+  """Returns whether a leaf belongs to a GetRequest data type."""
+  if data_type == gnmi_pb2.GetRequest.ALL:
+    return True
+  return is_state if data_type != gnmi_pb2.GetRequest.CONFIG else not is_state
+
+
+class Faults(object):
+  """Network and device faults injected into a target's RPCs.
+
+  Every RPC is delayed by the RTT (+/- jitter) and by its request and response
+  bytes over the bandwidth.  It may fail with a gRPC status: the ones queued
+  by FailNext first, then one of error_codes with probability error_rate.
+  DEADLINE_EXCEEDED is emulated by not answering before the client deadline.
+  Subscribe streams are dropped (UNAVAILABLE) after a response with
+  probability drop_rate.
+
+  State convergence is delayed by convergence_jitter on top of the AP's
+  convergence delay, and leaves in flaps revert to a wrong value after they
+  converged, eg. {'channel': (11, 5.0, 2)} shows channel 11 for 5 seconds,
+  twice, before it settles on the configured channel.
+  """
+
+  def __init__(self, rtt: float = 0.0, jitter: float = 0.0,
+               bandwidth: Optional[float] = None,
+               error_codes: Iterable[grpc.StatusCode] = (),
+               error_rate: float = 0.0, drop_rate: float = 0.0,
+               convergence_jitter: float = 0.0,
+               flaps: Optional[Dict[Text, Tuple[Any, float, int]]] = None,
+               rng: Optional[random.Random] = None):
+    """Initializes Faults.
+
+    Args:
+      rtt: (float) seconds added to every RPC.
+      jitter: (float) the RTT varies uniformly by +/- jitter seconds.
+      bandwidth: (float) bytes per second, None for unlimited.
+      error_codes: (list) grpc.StatusCodes random errors are picked from.
+      error_rate: (float) probability an RPC fails with one of error_codes.
+      drop_rate: (float) probability a stream is dropped after a response.
+      convergence_jitter: (float) state converges up to this many seconds
+        later than the AP's convergence delay.
+      flaps: (dict) leaf name -> (wrong value, seconds, count).
+      rng: (random.Random) source of the random faults.
+    """
+    self.rtt = rtt
+    self.jitter = jitter
+    self.bandwidth = bandwidth
+    self.error_codes = tuple(error_codes)
+    self.error_rate = error_rate
+    self.drop_rate = drop_rate
+    self.convergence_jitter = convergence_jitter
+    self.flaps = flaps or {}
+    self._rng = rng or random.Random()
+    self._next_errors = collections.deque()
+    self._lock = threading.Lock()
+
+  def FailNext(self, *codes: grpc.StatusCode) -> None:
+    """Fails the next RPCs with codes, one each."""
+    with self._lock:
+      self._next_errors.extend(codes)
+
+  def Error(self) -> Optional[StatusError]:
+    """Returns the error the next RPC fails with, None if it succeeds."""
+    with self._lock:
+      if self._next_errors:
+        code = self._next_errors.popleft()
+      elif self.error_codes and self._rng.random() < self.error_rate:
+        code = self._rng.choice(self.error_codes)
+      else:
+        return None
+    return StatusError(code, 'Injected %s' % code.name)
+
+  def Delay(self, size: int, rtt: bool = True) -> float:
+    """Returns the seconds transferring size bytes (after one RTT) takes."""
+    delay = 0.0
+    if rtt and (self.rtt or self.jitter):
+      delay = max(0.0, self.rtt + self._rng.uniform(-self.jitter, self.jitter))
+    if self.bandwidth:
+      delay += size / self.bandwidth
+    return delay
+
+  def Dropped(self) -> bool:
+    """Returns whether to drop a stream after a response."""
+    return bool(self.drop_rate) and self._rng.random() < self.drop_rate
+
+  def ConvergenceDelay(self, delay: float) -> float:
+    """Returns the convergence delay of one leaf."""
+    return delay + self._rng.uniform(0, self.convergence_jitter)
+
+
+class FakeAp(object):
+  """One emulated access point: its config and state leaves."""
+
+  def __init__(self, hostname: Text, vendor: Text, mac: Text = '',
+               model: Text = '', serial: Text = '', ipv4: Text = '',
+               ipv6: Text = '', firmware: Text = '',
+               convergence_delay: float = 2.0,
+               layout: Optional[Layout] = None,
+               faults: Optional[Faults] = None):
+    """Initializes a FakeAp.
+
+    Args:
+      hostname: (str) AP hostname, the access-point list key.
+      vendor: (str) key of the vendor Profile in PROFILES.
+      mac: (str) AP MAC address, the provision-ap list key.
+      model: (str) AP model reported in joined-aps.
+      serial: (str) AP serial number reported in joined-aps.
+      ipv4: (str) AP IPv4 address reported in joined-aps.
+      ipv6: (str) AP IPv6 address reported in joined-aps.
+      firmware: (str) software version reported in joined-aps.
+      convergence_delay: (float) seconds between a Set and the state
+        reflecting it.
+      layout: (Layout) leaf paths shared with other APs, defaults to LAYOUT.
+      faults: (Faults) faults injected into the AP's RPCs and state.
+    """
+    self.hostname = hostname
+    self.faults = faults
+    self.profile = PROFILES[vendor]
+    self.mac = mac.upper()
+    self.convergence_delay = convergence_delay
+    self.layout = layout or LAYOUT
+    self.values = []  # Slot -> value, _UNSET if the AP has no such leaf.
+    self.boot_time = time.time()
+    self._pending = []  # Heap of (due, sequence, slot, value or _UNSET).
+    self._sequence = itertools.count()  # Orders changes due at once.
+    self._lock = threading.RLock()
+    self._entries = {  # Root container -> path of the AP's list entry.
+        'access-points': (('access-points', ()),
+                          ('access-point', (('hostname', hostname),))),
+        'joined-aps': (('joined-aps', ()),
+                       ('joined-ap', (('hostname', hostname),))),
+        'provision-aps': (('provision-aps', ()),
+                          ('provision-ap', (('mac', self.mac),))),
+    }
+    self.host_path = self._entries['access-points']
+    self._Store(self.host_path + (('hostname', ()),), hostname)
+    joined = self._entries['joined-aps'] + (('state', ()),)
+    self._uptime_slot = self.layout.Slot(_Relative(joined + (('uptime', ()),)))
+    for leaf, value in (('hostname', hostname), ('mac', mac), ('model', model),
+                        ('serial', serial), ('ipv4', ipv4), ('ipv6', ipv6),
+                        ('software-version', firmware),
+                        ('opstate', 'openconfig-wifi-types:UP'),
+                        ('power-source', 'AT'), ('enabled', True)):
+      if value != '':  # Empty values do not adhere to the schema.
+        self._Store(joined + ((leaf, ()),), value)
+
+  @classmethod
+  def FromApObject(cls, ap: Any, **kwargs: Any) -> 'FakeAp':
+    """Returns a FakeAp emulating a chido_test.ApObject."""
+    return cls(ap.ap_name, ap.vendor, mac=ap.mac or '', model=ap.model or '',
+               serial=ap.serial or '', ipv4=ap.targetip or '',
+               ipv6=ap.targetipv6 or '', firmware=ap.firmware or '', **kwargs)
+
+  def _Put(self, slot: int, value: Any) -> None:
+    if slot >= len(self.values):
+      self.values.extend([_UNSET] * (len(self.layout.paths) - len(self.values)))
+    self.values[slot] = value
+
+  def _Store(self, path: Path, value: Any) -> int:
+    """Stores a leaf value, returns its slot."""
+    slot = self.layout.Slot(_Relative(path))
+    self._Put(slot, _Interned(value))
+    return slot
+
+  def _Settle(self) -> None:
+    """Applies the state changes whose convergence delay has passed."""
+    now = time.time()
+    while self._pending and self._pending[0][0] <= now:
+      _, _, slot, value = heapq.heappop(self._pending)
+      self._Put(slot, value)
+    self._Put(self._uptime_slot, int(now - self.boot_time) + 1)
+
+  def _Schedule(self, slot: int, value: Any) -> None:
+    """Schedules the state leaf mirroring a config leaf to take value."""
+    state_slot = self.layout.mirror[slot]
+    if state_slot is None:
+      return
+    due = time.time() + self.convergence_delay
+    changes = [(0.0, value)]
+    if self.faults:
+      due = time.time() + self.faults.ConvergenceDelay(self.convergence_delay)
+      flap = self.faults.flaps.get(self.layout.paths[slot][-1][0])
+      if flap and value is not _UNSET:
+        wrong, seconds, count = flap
+        changes = [(0.0, value)]
+        for i in range(count):
+          changes.append(((2 * i + 1) * seconds, wrong))
+          changes.append(((2 * i + 2) * seconds, value))
+    for offset, change in changes:
+      heapq.heappush(self._pending, (due + offset, next(self._sequence),
+                                     state_slot, change))
+
+  def _Slots(self, path: Path) -> List[int]:
+    """Returns the slots at or below path the AP has a leaf for."""
+    values = self.values
+    return [slot for slot in self.layout.Under(_Relative(path))
+            if slot < len(values) and values[slot] is not _UNSET]
+
+  def _Full(self, slot: int) -> Path:
+    relative = self.layout.paths[slot]
+    return self._entries[relative[0]] + relative[1:]
+
+  def Subtree(self, path: Path, data_type: int = gnmi_pb2.GetRequest.ALL
+             ) -> List[Tuple[Path, Any]]:
+    """Returns the (path, value) of every leaf at or below path."""
+    with self._lock:
+      self._Settle()
+      return [(self._Full(slot), self.values[slot])
+              for slot in self._Slots(path)
+              if _Matches(self.layout.is_state[slot], data_type)]
+
+  def Validate(self, path: Path, value: Any = None) -> None:
+    """Checks that value may be set at path, or path deleted if None.
+
+    Raises:
+      StatusError: path is below an unsupported container (UNIMPLEMENTED), or
+        value does not adhere to the schema (INVALID_ARGUMENT).
+    """
+    for name, _ in path:
+      if name in self.profile.unsupported:
+        raise StatusError(grpc.StatusCode.UNIMPLEMENTED,
+                          '%s does not support setting %s' % (
+                              self.profile.vendor, name))
+    if len(path) < 2:
+      raise StatusError(grpc.StatusCode.INVALID_ARGUMENT,
+                        'Only paths below an AP list entry can be set')
+    if value is None:
+      return
+    error = self.profile.SchemaError(path, value)
+    if error:
+      raise StatusError(grpc.StatusCode.INVALID_ARGUMENT,
+                        'Value at %s does not adhere to schema: %s' % (
+                            gnmi_lib.PathToXpath(ElemsPath(path)), error))
+
+  def Delete(self, path: Path) -> None:
+    """Deletes every leaf at or below path, its state follows later."""
+    with self._lock:
+      for slot in self._Slots(path):
+        self.values[slot] = _UNSET
+        self._Schedule(slot, _UNSET)
+
+  def Update(self, path: Path, value: Any) -> None:
+    """Merges value at path, its state follows after the convergence delay."""
+    with self._lock:
+      for i, (_, keys) in enumerate(path):  # Entries created by the path.
+        for key, key_value in keys:
+          key_path = path[:i + 1] + ((key, ()),)
+          if not self._Slots(key_path):
+            self._Store(key_path, _KeyValue(key_value))
+      for leaf, leaf_value in Flatten(value, path, self.profile.ListKeys()):
+        slot = self._Store(leaf, leaf_value)
+        self._Schedule(slot, self.values[slot])
+
+  def Json(self, path: Path, leaves: List[Tuple[Path, Any]]) -> Any:
+    """Returns the JSON_IETF value at path built from its leaves."""
+    if len(leaves) == 1 and leaves[0][0] == path:
+      value = leaves[0][1]
+      return list(value) if isinstance(value, tuple) else value
+    if not path:
+      return Qualify(Build(leaves, 0), None, self.profile.qualify_all)
+    name, keys = path[-1]
+    value = Build(leaves, len(path) - 1)[name]
+    if keys:
+      value = value[0]
+    return Qualify(value, _MODULES[path[0][0]], self.profile.qualify_all)
+
+
+class FakeTarget(gnmi_pb2_grpc.gNMIServicer):
+  """gNMI servicer routing requests to the FakeAps they address.
+
+  The *Response methods answer a request independently of how it is served;
+  FakeTarget serves them on a thread pool server (see Serve) and AsyncTarget
+  on an asyncio one (see ServeFleet).
+  """
+
+  def __init__(self, aps: Iterable[FakeAp] = (),
+               credentials: Optional[Tuple[Text, Text]] = None,
+               faults: Optional[Faults] = None):
+    """Initializes a FakeTarget.
+
+    Args:
+      aps: (list) FakeAps served by the target.
+      credentials: (tuple) username and password every request must carry,
+        None to accept any.
+      faults: (Faults) faults injected into RPCs to APs without their own.
+    """
+    self.credentials = credentials
+    self.faults = faults
+    self.aps = {}  # hostname -> FakeAp.
+    self._by_mac = {}  # MAC -> FakeAp.
+    for ap in aps:
+      self.Add(ap)
+
+  def Add(self, ap: FakeAp) -> None:
+    """Serves an additional FakeAp."""
+    self.aps[ap.hostname] = ap
+    if ap.mac:
+      self._by_mac[ap.mac] = ap
+
+  def View(self, ap: FakeAp) -> 'FakeTarget':
+    """Returns a target serving only ap, eg. to serve each AP on its own port.
+    """
+    return FakeTarget([ap], self.credentials, self.faults)
+
+  def Ap(self, path: Path) -> FakeAp:
+    """Returns the FakeAp a path addresses.
+
+    Raises:
+      StatusError: No served AP matches the path keys.
+    """
+    if len(path) > 1:
+      keys = dict(path[1][1])
+      if path[0][0] in _AP_LISTS and 'hostname' in keys:
+        ap = self.aps.get(keys['hostname'])
+      elif path[0][0] == 'provision-aps' and 'mac' in keys:
+        ap = self._by_mac.get(keys['mac'].upper())
+      else:
+        ap = None
+      if ap is not None:
+        return ap
+    if len(self.aps) == 1 and not (len(path) > 1 and path[1][1]):
+      return next(iter(self.aps.values()))
+    raise StatusError(grpc.StatusCode.NOT_FOUND, 'No AP at %s' %
+                      gnmi_lib.PathToXpath(ElemsPath(path)))
+
+  def Aps(self, path: Path) -> List[FakeAp]:
+    """Returns the FakeAps a Get of path reads: every served AP for a whole
+    list of APs (eg. /joined-aps), else the one Ap returns."""
+    if (len(self.aps) > 1 and path and path[0][0] in _AP_LISTS and
+        len(path) <= 2 and not (len(path) > 1 and path[1][1])):
+      return list(self.aps.values())
+    return [self.Ap(path)]
+
+  def Faults(self, path: Path) -> Optional[Faults]:
+    """Returns the faults injected into RPCs to the AP at path."""
+    try:
+      return self.Ap(path).faults or self.faults
+    except StatusError:
+      return self.faults
+
+  def Answer(self, method: Text, request: Any,
+             metadata: Iterable[Tuple[Text, Any]],
+             time_remaining: Optional[float] = None
+            ) -> Tuple[float, Any, Optional[StatusError]]:
+    """Answers a unary RPC, with the faults injected into it.
+
+    Args:
+      method: (str) RPC name, Capabilities, Get or Set.
+      request: the request message.
+      metadata: (list) (key, value) invocation metadata of the RPC.
+      time_remaining: (float) seconds until the client deadline, if any.
+
+    Returns:
+      (seconds to wait before answering, response, error to abort with
+      instead of answering) tuple.
+    """
+    if method == 'Get':
+      paths, handler = request.path, self.GetResponse
+    elif method == 'Set':
+      paths = ([u.path for u in request.update] +
+               [u.path for u in request.replace] + list(request.delete))
+      handler = self.SetResponse
+    else:
+      paths, handler = [], self.CapabilityResponse
+    prefix = PathElems(request.prefix) if method != 'Capabilities' else ()
+    faults = self.Faults(prefix + PathElems(paths[0]) if paths else prefix)
+    error = faults.Error() if faults else None
+    response = None
+    if error is None:
+      try:
+        response = handler(request, metadata)
+      except StatusError as e:
+        error = e
+    if faults is None:
+      return 0.0, response, error
+    delay = faults.Delay(request.ByteSize() +
+                         (response.ByteSize() if response else 0))
+    if error and error.code == grpc.StatusCode.DEADLINE_EXCEEDED:
+      delay = max(delay, min(_HANG, time_remaining or _HANG))
+    return delay, response, error
+
+  def _Authenticate(self, metadata: Iterable[Tuple[Text, Any]]) -> None:
+    if self.credentials is None:
+      return
+    metadata = dict(metadata or ())
+    if (metadata.get('username'), metadata.get('password')) != tuple(
+        self.credentials):
+      raise StatusError(grpc.StatusCode.UNAUTHENTICATED,
+                        'Invalid username or password')
+
+  def _Encoding(self, ap: FakeAp, encoding: int) -> Text:
+    name = gnmi_pb2.Encoding.Name(encoding)
+    if name not in ap.profile.encodings:
+      raise StatusError(grpc.StatusCode.INVALID_ARGUMENT,
+                        'Unsupported encoding %s' % name)
+    return name
+
+  def _Notification(self, prefix: Path, path: Path, encoding: Text,
+                    data_type: int = gnmi_pb2.GetRequest.ALL,
+                    ) -> gnmi_pb2.Notification:
+    """Returns the notification holding the value of prefix + path.
+
+    PROTO encoding returns one update per leaf, JSON encodings one update
+    holding the whole value.
+    """
+    full = prefix + path
+    aps = self.Aps(full)
+    ap = aps[0]
+    encoding = self._Encoding(ap, encoding)
+    leaves = [leaf for each in aps for leaf in each.Subtree(full, data_type)]
+    if not leaves:
+      raise StatusError(grpc.StatusCode.NOT_FOUND, 'No data at %s' %
+                        gnmi_lib.PathToXpath(ElemsPath(full)))
+    if encoding == 'PROTO':
+      updates = [gnmi_pb2.Update(path=ElemsPath(leaf[len(prefix):]),
+                                 val=gnmi_lib.TypedValueFromPython(value))
+                 for leaf, value in leaves]
+    else:
+      value = json.dumps(ap.Json(full, leaves)).encode('utf8')
+      if encoding == 'JSON_IETF':
+        val = gnmi_pb2.TypedValue(json_ietf_val=value)
+      else:
+        val = gnmi_pb2.TypedValue(json_val=value)
+      updates = [gnmi_pb2.Update(path=ElemsPath(path), val=val)]
+    return gnmi_pb2.Notification(timestamp=time.time_ns(),
+                                 prefix=ElemsPath(prefix), update=updates)
+
+  def _Abort(self, context: grpc.ServicerContext, e: StatusError) -> None:
+    logging.info('Aborting %s: %s', e.code, e)
+    context.abort(e.code, str(e))
+
+  def CapabilityResponse(self, request: gnmi_pb2.CapabilityRequest,
+                         metadata: Iterable[Tuple[Text, Any]]
+                        ) -> gnmi_pb2.CapabilityResponse:
+    """Answers a CapabilityRequest, see GetResponse."""
+    del request  # Unused.
+    self._Authenticate(metadata)
+    profile = next(iter(self.aps.values())).profile if self.aps else None
+    return gnmi_pb2.CapabilityResponse(
+        supported_models=gnmi_lib.ModelDataList(
+            constants.OC_MODEL_VERSIONS.get(profile.vendor if profile else '',
+                                            {})),
+        supported_encodings=[
+            gnmi_pb2.Encoding.Value(e) for e in _ENCODINGS
+            if profile is None or e in profile.encodings],
+        gNMI_version=_GNMI_VERSION)
+
+  def GetResponse(self, request: gnmi_pb2.GetRequest,
+                  metadata: Iterable[Tuple[Text, Any]]
+                 ) -> gnmi_pb2.GetResponse:
+    """Answers a GetRequest.
+
+    Args:
+      request: (gnmi_pb2.GetRequest) the request.
+      metadata: (list) (key, value) invocation metadata of the RPC.
+
+    Raises:
+      StatusError: The RPC is to be aborted with the error's status code.
+    Returns:
+      gnmi_pb2.GetResponse holding one notification per requested path.
+    """
+    self._Authenticate(metadata)
+    prefix = PathElems(request.prefix)
+    return gnmi_pb2.GetResponse(notification=[
+        self._Notification(prefix, PathElems(path), request.encoding,
+                           request.type) for path in request.path])
+
+  def SetResponse(self, request: gnmi_pb2.SetRequest,
+                  metadata: Iterable[Tuple[Text, Any]]
+                 ) -> gnmi_pb2.SetResponse:
+    """Answers a SetRequest, nothing is applied unless every operation is
+    valid.  See GetResponse."""
+    self._Authenticate(metadata)
+    prefix = PathElems(request.prefix)
+    operations = [(gnmi_pb2.UpdateResult.DELETE, prefix + PathElems(path),
+                   None) for path in request.delete]
+    for op, updates in ((gnmi_pb2.UpdateResult.REPLACE, request.replace),
+                        (gnmi_pb2.UpdateResult.UPDATE, request.update)):
+      for update in updates:
+        operations.append((op, prefix + PathElems(update.path),
+                           gnmi_lib.DecodeTypedValue(update.val)))
+    for _, path, value in operations:
+      self.Ap(path).Validate(path, value)
+    results = []
+    for op, path, value in operations:
+      ap = self.Ap(path)
+      if op != gnmi_pb2.UpdateResult.UPDATE:
+        ap.Delete(path)
+      if op != gnmi_pb2.UpdateResult.DELETE:
+        ap.Update(path, value)
+      results.append(gnmi_pb2.UpdateResult(
+          path=ElemsPath(path[len(prefix):]), op=op))
+    return gnmi_pb2.SetResponse(prefix=request.prefix, response=results,
+                                timestamp=time.time_ns())
+
+  def Subscription(self, request: gnmi_pb2.SubscribeRequest,
+                   metadata: Iterable[Tuple[Text, Any]]) -> 'Subscription':
+    """Opens a subscription for the first request of a Subscribe stream.
+
+    See GetResponse.
+    """
+    self._Authenticate(metadata)
+    if not request.HasField('subscribe'):
+      raise StatusError(grpc.StatusCode.INVALID_ARGUMENT,
+                        'The first request must be a SubscriptionList')
+    return Subscription(self, request.subscribe)
+
+  def _Serve(self, method: Text, request: Any,
+             context: grpc.ServicerContext) -> Any:
+    delay, response, error = self.Answer(
+        method, request, context.invocation_metadata(),
+        context.time_remaining())
+    if delay:
+      time.sleep(delay)
+    if error:
+      self._Abort(context, error)
+    return response
+
+  def Capabilities(self, request, context):
+    return self._Serve('Capabilities', request, context)
+
+  def Get(self, request, context):
+    return self._Serve('Get', request, context)
+
+  def Set(self, request, context):
+    return self._Serve('Set', request, context)
+
+  def Subscribe(self, request_iterator, context):
+    try:
+      subscription = self.Subscription(next(request_iterator),
+                                       context.invocation_metadata())
+      time.sleep(subscription.Delay())
+      for response in subscription.Initial():
+        yield subscription.Sent(response)
+        time.sleep(subscription.Delay(response))
+      if subscription.mode == gnmi_pb2.SubscriptionList.POLL:
+        for request in request_iterator:
+          if request.HasField('poll'):
+            for response in subscription.Poll():
+              yield subscription.Sent(response)
+              time.sleep(subscription.Delay(response))
+      elif subscription.mode == gnmi_pb2.SubscriptionList.STREAM:
+        while context.is_active():
+          time.sleep(_CHANGE_POLL_INTERVAL)
+          for response in subscription.Tick():
+            yield subscription.Sent(response)
+            time.sleep(subscription.Delay(response))
+    except StatusError as e:
+      self._Abort(context, e)
+
+  def Leaves(self, prefix: Path, paths: Iterable[Path]) -> Dict[Path, Any]:
+    """Returns {leaf path: value} of every leaf at or below prefix + paths."""
+    leaves = {}
+    for path in paths:
+      leaves.update(self.Ap(prefix + path).Subtree(prefix + path))
+    return leaves
+
+
+class Subscription(object):
+  """One Subscribe stream, independent of how it is served.
+
+  Initial() returns the responses sent right away; POLL subscriptions answer
+  every poll request with Poll() and STREAM subscriptions send what Tick()
+  returns, calling it every _CHANGE_POLL_INTERVAL.
+  """
+
+  def __init__(self, target: FakeTarget,
+               sub_list: gnmi_pb2.SubscriptionList):
+    self.target = target
+    self.mode = sub_list.mode
+    self.prefix = PathElems(sub_list.prefix)
+    self.paths = [PathElems(sub.path) for sub in sub_list.subscription]
+    target.Ap(self.prefix + self.paths[0] if self.paths else self.prefix)
+    self.encoding = gnmi_pb2.Encoding.Name(sub_list.encoding)
+    self.updates_only = sub_list.updates_only
+    self.faults = target.Faults(
+        self.prefix + self.paths[0] if self.paths else self.prefix)
+    error = self.faults.Error() if self.faults else None
+    if error:
+      raise error
+    self._samples = {}  # Index of a SAMPLE subscription -> (interval, due).
+    for i, sub in enumerate(sub_list.subscription):
+      if sub.mode == gnmi_pb2.SAMPLE:
+        interval = sub.sample_interval / 1e9 or _DEFAULT_SAMPLE_INTERVAL
+        self._samples[i] = (interval, time.time() + interval)
+    self._on_change = [path for i, path in enumerate(self.paths)
+                       if i not in self._samples]
+    self._last = {}
+
+  def _Updates(self, leaves: Dict[Path, Any]
+              ) -> List[gnmi_pb2.SubscribeResponse]:
+    """Returns a response holding one update per leaf, if there are any."""
+    if not leaves:
+      return []
+    updates = []
+    for leaf, value in sorted(leaves.items()):
+      if self.encoding == 'PROTO':
+        val = gnmi_lib.TypedValueFromPython(value)
+      else:
+        val = gnmi_lib.TypedValueFromPython(
+            list(value) if isinstance(value, tuple) else value, 'JSON_IETF')
+      updates.append(gnmi_pb2.Update(path=ElemsPath(leaf[len(self.prefix):]),
+                                     val=val))
+    return [gnmi_pb2.SubscribeResponse(update=gnmi_pb2.Notification(
+        timestamp=time.time_ns(), prefix=ElemsPath(self.prefix),
+        update=updates))]
+
+  def Delay(self, response: Optional[gnmi_pb2.SubscribeResponse] = None
+           ) -> float:
+    """Returns the seconds to wait before the stream opens (no response) or
+    after a response, the RTT only applies to the former."""
+    if not self.faults:
+      return 0.0
+    if response is None:
+      return self.faults.Delay(0)
+    return self.faults.Delay(response.ByteSize(), rtt=False)
+
+  def Sent(self, response: gnmi_pb2.SubscribeResponse
+          ) -> gnmi_pb2.SubscribeResponse:
+    """Returns response, or drops the stream before it is sent.
+
+    Raises:
+      StatusError: UNAVAILABLE, the stream is dropped.
+    """
+    if self.faults and self.faults.Dropped():
+      raise StatusError(grpc.StatusCode.UNAVAILABLE, 'Injected stream drop')
+    return response
+
+  def Initial(self) -> List[gnmi_pb2.SubscribeResponse]:
+    """Returns the current values (unless updates_only) and sync_response."""
+    self._last = self.target.Leaves(self.prefix, self.paths)
+    responses = [] if self.updates_only else self._Updates(self._last)
+    return responses + [gnmi_pb2.SubscribeResponse(sync_response=True)]
+
+  def Poll(self) -> List[gnmi_pb2.SubscribeResponse]:
+    """Returns the current values and sync_response."""
+    return self._Updates(self.target.Leaves(self.prefix, self.paths)) + [
+        gnmi_pb2.SubscribeResponse(sync_response=True)]
+
+  def Tick(self) -> List[gnmi_pb2.SubscribeResponse]:
+    """Returns the samples due and the leaves changed or deleted since the
+    previous call."""
+    responses = []
+    now = time.time()
+    for i, (interval, due) in list(self._samples.items()):
+      if now >= due:
+        self._samples[i] = (interval, due + interval)
+        responses.extend(self._Updates(
+            self.target.Leaves(self.prefix, [self.paths[i]])))
+    current = self.target.Leaves(self.prefix, self._on_change)
+    responses.extend(self._Updates({
+        leaf: value for leaf, value in current.items()
+        if self._last.get(leaf) != value}))
+    deleted = [leaf for leaf in self._last if leaf not in current]
+    if deleted:
+      responses.append(gnmi_pb2.SubscribeResponse(update=gnmi_pb2.Notification(
+          timestamp=time.time_ns(), prefix=ElemsPath(self.prefix),
+          delete=[ElemsPath(leaf[len(self.prefix):]) for leaf in deleted])))
+    self._last = current
+    return responses
+
+
+class AsyncTarget(gnmi_pb2_grpc.gNMIServicer):
+  """Serves a FakeTarget on an asyncio (grpc.aio) server.
+
+  Requests are answered on the event loop, so one process serves thousands of
+  APs and streams without a thread each.
+  """
+
+  def __init__(self, target: FakeTarget):
+    self.target = target
+
+  async def _Abort(self, context: grpc.aio.ServicerContext,
+                   e: StatusError) -> None:
+    logging.info('Aborting %s: %s', e.code, e)
+    await context.abort(e.code, str(e))
+
+  async def _Serve(self, method: Text, request: Any,
+                   context: grpc.aio.ServicerContext) -> Any:
+    delay, response, error = self.target.Answer(
+        method, request, context.invocation_metadata(),
+        context.time_remaining())
+    if delay:
+      await asyncio.sleep(delay)
+    if error:
+      await self._Abort(context, error)
+    return response
+
+  async def Capabilities(self, request, context):
+    return await self._Serve('Capabilities', request, context)
+
+  async def Get(self, request, context):
+    return await self._Serve('Get', request, context)
+
+  async def Set(self, request, context):
+    return await self._Serve('Set', request, context)
+
+  async def Subscribe(self, request_iterator, context):
+    try:
+      subscription = self.target.Subscription(
+          await request_iterator.__anext__(), context.invocation_metadata())
+      await asyncio.sleep(subscription.Delay())
+      for response in subscription.Initial():
+        yield subscription.Sent(response)
+        await asyncio.sleep(subscription.Delay(response))
+      if subscription.mode == gnmi_pb2.SubscriptionList.POLL:
+        async for request in request_iterator:
+          if request.HasField('poll'):
+            for response in subscription.Poll():
+              yield subscription.Sent(response)
+              await asyncio.sleep(subscription.Delay(response))
+      elif subscription.mode == gnmi_pb2.SubscriptionList.STREAM:
+        while True:  # Until the client cancels the stream.
+          await asyncio.sleep(_CHANGE_POLL_INTERVAL)
+          for response in subscription.Tick():
+            yield subscription.Sent(response)
+            await asyncio.sleep(subscription.Delay(response))
+    except StatusError as e:
+      await self._Abort(context, e)
+
+
+def Serve(target: FakeTarget, port: int = 0, address: Text = 'localhost',
+          max_workers: int = 32) -> Tuple[grpc.Server, int]:
+  """Starts an insecure gRPC server for a FakeTarget.
+
+  Args:
+    target: (FakeTarget) servicer answering the requests.
+    port: (int) TCP port to listen on, 0 picks a free one.
+    address: (str) address to listen on.
+    max_workers: (int) number of concurrent RPCs served.
+
+  Returns:
+    (started grpc.Server, port it listens on) tuple.
+  """
+  server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
+  gnmi_pb2_grpc.add_gNMIServicer_to_server(target, server)
+  port = server.add_insecure_port('%s:%d' % (address, port))
+  server.start()
+  return server, port
+
+
+async def ServeFleet(target: FakeTarget, address: Text = 'localhost',
+                     port: int = 0, per_ap_ports: bool = False
+                    ) -> Tuple[List[grpc.aio.Server], Dict[Text, int]]:
+  """Starts insecure asyncio gRPC servers for a fleet of FakeAps.
+
+  By default one server serves every AP and requests select the AP by their
+  path keys, eg. /access-points/access-point[hostname=...], like a cloud
+  controller.  With per_ap_ports every AP gets its own server and port, like
+  APs serving gNMI themselves.
+
+  Args:
+    target: (FakeTarget) holding the APs.
+    address: (str) address to listen on.
+    port: (int) TCP port of the (first) server, 0 picks free ones.  With
+      per_ap_ports the APs get consecutive ports, in the order added.
+    per_ap_ports: (bool) Whether to serve each AP on its own port.
+
+  Returns:
+    (started grpc.aio.Servers, {hostname: port}) tuple.
+  """
+  views = [target]
+  if per_ap_ports:
+    views = [target.View(ap) for ap in target.aps.values()]
+  servers, ports = [], {}
+  for i, view in enumerate(views):
+    server = grpc.aio.server()
+    gnmi_pb2_grpc.add_gNMIServicer_to_server(AsyncTarget(view), server)
+    bound = server.add_insecure_port(
+        '%s:%d' % (address, port + i if port else 0))
+    await server.start()
+    servers.append(server)
+    for hostname in view.aps:
+      ports[hostname] = bound
+  return servers, ports
+
+
+class FleetServer(object):
+  """Runs ServeFleet on an event loop in a background thread.
+
+  Lets synchronous code, eg. tests and benchmarks using chido, talk to a
+  fleet served by one asyncio process.
+  """
+
+  def __init__(self, target: FakeTarget, address: Text = 'localhost',
+               port: int = 0, per_ap_ports: bool = False):
+    self.target = target
+    self.ports = {}  # hostname -> port.
+    self._args = (target, address, port, per_ap_ports)
+    self._loop = asyncio.new_event_loop()
+    self._thread = threading.Thread(target=self._loop.run_forever,
+                                    daemon=True)
+    self._servers = []
+
+  def Start(self) -> 'FleetServer':
+    """Starts the servers, returns self once they listen."""
+    self._thread.start()
+    self._servers, self.ports = asyncio.run_coroutine_threadsafe(
+        ServeFleet(*self._args), self._loop).result()
+    return self
+
+  def Stop(self) -> None:
+    """Stops the servers and the event loop."""
+
+    async def _Stop():
+      await asyncio.gather(*(server.stop(None) for server in self._servers))
+
+    asyncio.run_coroutine_threadsafe(_Stop(), self._loop).result()
+    self._loop.call_soon_threadsafe(self._loop.stop)
+    self._thread.join()
+
+
+def Fleet(count: int, vendor: Text,
+          hostname: Text = 'ap-%05d.example.com',
+          convergence_delay: float = 2.0,
+          layout: Optional[Layout] = None,
+          faults: Optional[Faults] = None) -> List[FakeAp]:
+  """Returns count FakeAps of a vendor with generated hostnames and MACs.
+
+  Args:
+    count: (int) number of APs.
+    vendor: (str) key of the vendor Profile in PROFILES.
+    hostname: (str) hostname format, formatted with the AP's index.
+    convergence_delay: (float) seconds until state reflects a Set.
+    layout: (Layout) leaf paths shared by the APs, defaults to LAYOUT.
+    faults: (Faults) faults injected into every AP.
+  """
+  return [FakeAp(hostname % i, vendor,
+                 mac='02:00:%02X:%02X:%02X:%02X' % tuple(
+                     i.to_bytes(4, 'big')),
+                 model='AP%d' % i, serial='FAKE%08d' % i,
+                 convergence_delay=convergence_delay, layout=layout,
+                 faults=faults)
+          for i in range(count)]
+
+
+def ParseFlap(text: Text) -> Tuple[Text, Tuple[Any, float, int]]:
+  """Parses a leaf=value:seconds:count flap, eg. channel=11:5:2.
+
+  Raises:
+    ValueError: When text is not a valid flap.
+  """
+  leaf, _, spec = text.partition('=')
+  value, seconds, count = spec.rsplit(':', 2)
+  try:
+    value = json.loads(value)
+  except ValueError:
+    pass  # A string, eg. an enum.
+  return leaf, (value, float(seconds), int(count))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--port', type=int, default=50051,
+                      help='TCP port to listen on (of the first AP).')
+  parser.add_argument('--vendor', choices=sorted(PROFILES), default='mist',
+                      help='Vendor to emulate.')
+  parser.add_argument('--hostname', default='ap-02-100.example.com',
+                      help='AP hostname, a format (eg. ap-%%05d) with --count.')
+  parser.add_argument('--mac', default='5C:5B:35:01:02:03',
+                      help='AP MAC address, without --count.')
+  parser.add_argument('--count', type=int, default=0,
+                      help='Number of APs of a generated fleet.')
+  parser.add_argument('--per_ap_ports', action='store_true',
+                      help='Serve each AP on its own consecutive port.')
+  parser.add_argument('--convergence_delay', type=float, default=2.0,
+                      help='Seconds until state reflects a Set.')
+  parser.add_argument('--rtt', type=float, default=0.0,
+                      help='Seconds added to every RPC.')
+  parser.add_argument('--jitter', type=float, default=0.0,
+                      help='Seconds the RTT varies by.')
+  parser.add_argument('--bandwidth', type=float, default=None,
+                      help='Bytes per second, unlimited by default.')
+  parser.add_argument('--error_codes', default='UNAVAILABLE',
+                      help='Comma separated gRPC codes of random errors.')
+  parser.add_argument('--error_rate', type=float, default=0.0,
+                      help='Probability an RPC fails.')
+  parser.add_argument('--drop_rate', type=float, default=0.0,
+                      help='Probability a stream drops after a response.')
+  parser.add_argument('--convergence_jitter', type=float, default=0.0,
+                      help='Seconds state convergence varies by.')
+  parser.add_argument('--flap', action='append', type=ParseFlap, default=[],
+                      help='leaf=value:seconds:count state reverting to value '
+                      'after converging, eg. channel=11:5:2.')
+  args = parser.parse_args()
+  logging.set_verbosity(logging.INFO)
+  faults = Faults(
+      rtt=args.rtt, jitter=args.jitter, bandwidth=args.bandwidth,
+      error_codes=[grpc.StatusCode[c] for c in args.error_codes.split(',')],
+      error_rate=args.error_rate, drop_rate=args.drop_rate,
+      convergence_jitter=args.convergence_jitter, flaps=dict(args.flap))
+  if args.count:
+    aps = Fleet(args.count, args.vendor, args.hostname, args.convergence_delay,
+                faults=faults)
+  else:
+    aps = [FakeAp(args.hostname, args.vendor, mac=args.mac,
+                  convergence_delay=args.convergence_delay, faults=faults)]
+
+  async def _Serve():
+    servers, ports = await ServeFleet(FakeTarget(aps, faults=faults), '[::]',
+                                      args.port, args.per_ap_ports)
+    logging.info('Serving %d %s APs on ports %d-%d', len(aps), args.vendor,
+                 min(ports.values()), max(ports.values()))
+    await asyncio.gather(*(s.wait_for_termination() for s in servers))
+
+  asyncio.run(_Serve())
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,305 @@
+"""Unit tests for fake_ap, talking to an in-process fake target."""
+import json
+import random
+import time
+import unittest
+
+import fake_ap
+import gnmi_lib
+import gnmi_metrics
+import gnmi_pb2
+import grpc
+
+
+_FILES = 'testdata/'
+_DELAY = 0.2
+_MIST = 'ap-02-100.example.com'
+_ARISTA = 'ap-02-102.example.com'
+_JOINED = '/joined-aps/joined-ap[hostname=%s]/state'
+_RADIO = '/access-points/access-point[hostname=%s]/radios/radio[id=0]/%s'
+
+
+def _Path(xpath):
+  return gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath))
+
+
+class FakeApTest(unittest.TestCase):
+
+  def setUp(self):
+    super(FakeApTest, self).setUp()
+    self.target = fake_ap.FakeTarget([
+        fake_ap.FakeAp(_MIST, 'mist', mac='5C:5B:35:01:02:03', model='AP41',
+                       convergence_delay=_DELAY),
+        fake_ap.FakeAp(_ARISTA, 'arista', mac='30:86:2D:25:26:27',
+                       convergence_delay=_DELAY)])
+    self.server, port = fake_ap.Serve(self.target)
+    self.stub = gnmi_lib.CreateStub(None, 'localhost', str(port),
+                                    interceptors=[])
+
+  def tearDown(self):
+    self.server.stop(None)
+    super(FakeApTest, self).tearDown()
+
+  def _SetRadio(self, json_file=_FILES + 'mist_radio_base.json'):
+    with open(json_file, 'rt') as f:
+      return gnmi_lib.Set(self.stub, _Path(_RADIO % (_MIST, 'config')), '', '',
+                          json.load(f), 'update')
+
+  def _GetJson(self, xpath, data_type='ALL'):
+    response = gnmi_lib.Get(self.stub, _Path(xpath), '', '',
+                            data_type=data_type)
+    return json.loads(response.notification[0].update[0].val.json_ietf_val)
+
+  def testStateFollowsConfigAfterDelay(self):
+    response = self._SetRadio()
+    self.assertGreater(response.timestamp, 0)
+    config = self._GetJson(_RADIO % (_MIST, 'config'), 'CONFIG')
+    self.assertEqual(config['openconfig-access-points:channel'], 36)
+    with self.assertRaises(grpc.RpcError) as e:
+      gnmi_lib.Get(self.stub, _Path(_RADIO % (_MIST, 'state')), '', '')
+    self.assertEqual(e.exception.code(), grpc.StatusCode.NOT_FOUND)
+    time.sleep(_DELAY * 2)
+    state = self._GetJson(_RADIO % (_MIST, 'state'))
+    self.assertEqual(state['openconfig-access-points:channel'], 36)
+
+  def testInvalidConfigIsRejected(self):
+    with self.assertRaises(grpc.RpcError) as e:
+      gnmi_lib.SetLeaves(self.stub, [
+          (_Path(_RADIO % (_MIST, 'config/transmit-power')), 'high')], '', '')
+    self.assertEqual(e.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+    with self.assertRaises(grpc.RpcError) as e:
+      gnmi_lib.Set(self.stub, _Path(_RADIO % (_MIST, 'config')), '', '',
+                   {'no-such-leaf': 1}, 'update')
+    self.assertEqual(e.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+
+  def testUnsupportedContainer(self):
+    path = ('/access-points/access-point[hostname=%s]/ssids/ssid[name=x]/'
+            'band-steering/config' % _MIST)
+    with self.assertRaises(grpc.RpcError) as e:
+      gnmi_lib.Set(self.stub, _Path(path), '', '', {'rssi': -70}, 'update')
+    self.assertEqual(e.exception.code(), grpc.StatusCode.UNIMPLEMENTED)
+
+  def testAristaRadioKeys(self):
+    with open(_FILES + 'arista_office_base_full.json', 'rt') as f:
+      gnmi_lib.Set(self.stub, _Path('/access-points/access-point[hostname=%s]'
+                                    % _ARISTA), '', '', json.load(f), 'update')
+    radio = self._GetJson(
+        '/access-points/access-point[hostname=%s]/radios/radio[id=0]'
+        '[operating-frequency=FREQ_5GHZ]' % _ARISTA)
+    # Unlike Mist, Arista only qualifies the top-level members.
+    self.assertEqual(
+        radio['openconfig-access-points:config']['transmit-power'], 9)
+
+  def testProtoLeaves(self):
+    self._SetRadio()
+    gnmi_lib.SetLeaves(self.stub, [
+        (_Path(_RADIO % (_MIST, 'config/channel')), 40)], '', '')
+    response = gnmi_lib.Get(self.stub, [_Path(_RADIO % (_MIST, 'config'))],
+                            '', '', encoding='PROTO')
+    values = {gnmi_lib.PathToXpath(u.path): gnmi_lib.DecodeTypedValue(u.val)
+              for u in response.notification[0].update}
+    self.assertEqual(values[_RADIO % (_MIST, 'config/channel')], 40)
+    self.assertIs(values[_RADIO % (_MIST, 'config/enabled')], True)
+
+  def testJoinedAp(self):
+    state = self._GetJson(_JOINED % _MIST)
+    self.assertEqual(state['openconfig-ap-manager:model'], 'AP41')
+    self.assertGreaterEqual(state['openconfig-ap-manager:uptime'], 1)
+
+  def testJoinedApsOfEveryAp(self):
+    joined = self._GetJson('/joined-aps', data_type='STATE')
+    self.assertEqual(
+        sorted(ap['hostname']
+               for ap in joined['openconfig-ap-manager:joined-ap']),
+        sorted([_ARISTA, _MIST]))
+
+  def testUnknownAp(self):
+    with self.assertRaises(grpc.RpcError) as e:
+      gnmi_lib.Get(self.stub, _Path(_RADIO % ('nope', 'config')), '', '')
+    self.assertEqual(e.exception.code(), grpc.StatusCode.NOT_FOUND)
+
+  def testSubscribeOnce(self):
+    self._SetRadio()
+    responses = list(gnmi_lib.Subscribe(
+        self.stub, [_Path(_RADIO % (_MIST, 'config'))], '', '', mode='ONCE',
+        encoding='PROTO'))
+    self.assertEqual(len(responses[0].update.update), 7)
+    self.assertTrue(responses[-1].sync_response)
+
+  def testSubscribeStreamSendsChanges(self):
+    self._SetRadio()
+    stream = gnmi_lib.Subscribe(
+        self.stub, [_Path(_RADIO % (_MIST, 'state/channel'))], '', '',
+        sub_mode='ON_CHANGE', encoding='PROTO', timeout=5)
+    self.assertTrue(next(stream).sync_response)  # State has not converged.
+    update = next(stream).update.update[0]
+    self.assertEqual(gnmi_lib.DecodeTypedValue(update.val), 36)
+    stream.cancel()
+
+  def testCapabilities(self):
+    response = self.stub.Capabilities(gnmi_pb2.CapabilityRequest())
+    self.assertIn('openconfig-access-points',
+                  [m.name for m in response.supported_models])
+    self.assertIn(gnmi_pb2.PROTO, response.supported_encodings)
+
+  def testCredentials(self):
+    self.target.credentials = ('user', 'secret')
+    with self.assertRaises(grpc.RpcError) as e:
+      gnmi_lib.Get(self.stub, _Path(_RADIO % (_MIST, 'config')), 'user', 'bad')
+    self.assertEqual(e.exception.code(), grpc.StatusCode.UNAUTHENTICATED)
+
+
+class FaultsTest(unittest.TestCase):
+
+  def setUp(self):
+    super(FaultsTest, self).setUp()
+    self.faults = fake_ap.Faults(rng=random.Random(1))
+    self.ap = fake_ap.FakeAp(_MIST, 'mist', convergence_delay=_DELAY,
+                             faults=self.faults)
+    self.server, port = fake_ap.Serve(fake_ap.FakeTarget([self.ap]))
+    self.stub = gnmi_lib.CreateStub(None, 'localhost', str(port),
+                                    interceptors=[])
+
+  def tearDown(self):
+    self.server.stop(None)
+    super(FaultsTest, self).tearDown()
+
+  def _Get(self, xpath=_JOINED % _MIST, timeout=None):
+    return gnmi_lib.Get(self.stub, _Path(xpath), '', '', timeout=timeout)
+
+  def _Timed(self, *args, **kwargs):
+    start = time.time()
+    self._Get(*args, **kwargs)
+    return time.time() - start
+
+  def testRttAndJitter(self):
+    self.faults.rtt, self.faults.jitter = 0.2, 0.05
+    for _ in range(3):
+      self.assertGreaterEqual(self._Timed(), 0.15)
+    self.assertEqual(self.faults.Delay(0, rtt=False), 0.0)
+
+  def testBandwidth(self):
+    self.faults.bandwidth = 1000.0  # A full Get is a few hundred bytes.
+    self.assertGreater(self._Timed(), 0.1)
+
+  def testScriptedErrors(self):
+    codes = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.UNAUTHENTICATED)
+    self.faults.FailNext(*codes)
+    for code in codes:
+      with self.assertRaises(grpc.RpcError) as e:
+        self._Get()
+      self.assertEqual(e.exception.code(), code)
+    self._Get()
+
+  def testDeadlineExceeded(self):
+    self.faults.FailNext(grpc.StatusCode.DEADLINE_EXCEEDED)
+    start = time.time()
+    with self.assertRaises(grpc.RpcError) as e:
+      self._Get(timeout=0.5)
+    self.assertEqual(e.exception.code(), grpc.StatusCode.DEADLINE_EXCEEDED)
+    self.assertGreaterEqual(time.time() - start, 0.45)
+
+  def testDroppedStream(self):
+    self.faults.drop_rate = 1.0
+    with self.assertRaises(grpc.RpcError) as e:
+      list(gnmi_lib.Subscribe(
+          self.stub, [_Path(_JOINED % _MIST)], '', '', mode='ONCE',
+          timeout=5))
+    self.assertEqual(e.exception.code(), grpc.StatusCode.UNAVAILABLE)
+
+  def testFlappingChannel(self):
+    self.faults.flaps = {'channel': (11, _DELAY, 1)}
+    gnmi_lib.SetLeaves(self.stub, [
+        (_Path(_RADIO % (_MIST, 'config/channel')), 1)], '', '')
+    xpath = _RADIO % (_MIST, 'state/channel')
+    channels = []
+    for _ in range(4):
+      time.sleep(_DELAY)
+      try:
+        channels.append(json.loads(
+            self._Get(xpath).notification[0].update[0].val.json_ietf_val))
+      except grpc.RpcError:
+        channels.append(None)
+    # Converges, reverts to 11 as seen on real APs, then settles.
+    self.assertIn(11, channels)
+    self.assertLess(channels.index(1), channels.index(11))
+    self.assertEqual(channels[-1], 1)
+
+  def testTailLatencyWithRetries(self):
+    self.faults.rtt, self.faults.jitter = 0.01, 0.005
+    self.faults.error_codes = (grpc.StatusCode.UNAVAILABLE,)
+    self.faults.error_rate = 0.2
+    latency = gnmi_metrics.Histogram()
+    for _ in range(50):
+      start = time.time()
+      for _ in range(10):
+        try:
+          self._Get()
+          break
+        except grpc.RpcError as e:
+          self.assertTrue(gnmi_lib.IsRetryable(e))
+      else:
+        self.fail('Retries exhausted')
+      latency.Observe(time.time() - start)
+    # Four retries in a row are one in 625; the tail stays a few RTTs.
+    self.assertLess(latency.Percentile(99), 0.25)
+
+
+class FleetTest(unittest.TestCase):
+
+  def _Start(self, aps, per_ap_ports=False):
+    server = fake_ap.FleetServer(fake_ap.FakeTarget(aps),
+                                 per_ap_ports=per_ap_ports).Start()
+    self.addCleanup(server.Stop)
+    return server
+
+  def _Stub(self, port):
+    return gnmi_lib.CreateStub(None, 'localhost', str(port), interceptors=[])
+
+  def testThousandApsOnOnePort(self):
+    layout = fake_ap.Layout()
+    aps = fake_ap.Fleet(1000, 'mist', convergence_delay=0, layout=layout)
+    server = self._Start(aps)
+    self.assertEqual(len(set(server.ports.values())), 1)
+    stub = self._Stub(server.ports[aps[0].hostname])
+    with open(_FILES + 'mist_radio_base.json', 'rt') as f:
+      radio = json.load(f)
+    for ap in aps:
+      gnmi_lib.Set(stub, _Path(_RADIO % (ap.hostname, 'config')), '', '',
+                   radio, 'update')
+    response = gnmi_lib.Get(stub, _Path(_RADIO % (aps[-1].hostname,
+                                                  'state/channel')), '', '')
+    self.assertEqual(
+        json.loads(response.notification[0].update[0].val.json_ietf_val), 36)
+    # Every AP shares the fleet's leaf paths and only holds their values.
+    self.assertLess(len(layout.paths), 40)
+    self.assertEqual(len(aps[0].values), len(aps[-1].values))
+
+  def testPortPerAp(self):
+    aps = fake_ap.Fleet(3, 'arista')
+    server = self._Start(aps, per_ap_ports=True)
+    self.assertEqual(len(set(server.ports.values())), 3)
+    stub = self._Stub(server.ports[aps[1].hostname])
+    xpath = '/joined-aps/joined-ap[hostname=%s]/state/serial'
+    response = gnmi_lib.Get(stub, _Path(xpath % aps[1].hostname), '', '')
+    self.assertEqual(
+        json.loads(response.notification[0].update[0].val.json_ietf_val),
+        'FAKE00000001')
+    with self.assertRaises(grpc.RpcError) as e:
+      gnmi_lib.Get(stub, _Path(xpath % aps[2].hostname), '', '')
+    self.assertEqual(e.exception.code(), grpc.StatusCode.NOT_FOUND)
+
+  def testSubscribeOnce(self):
+    aps = fake_ap.Fleet(2, 'mist')
+    server = self._Start(aps)
+    stub = self._Stub(server.ports[aps[0].hostname])
+    responses = list(gnmi_lib.Subscribe(
+        stub, [_Path('/joined-aps/joined-ap[hostname=%s]/state' %
+                     aps[1].hostname)], '', '', mode='ONCE', encoding='PROTO'))
+    self.assertTrue(responses[-1].sync_response)
+    self.assertIn('AP1', [gnmi_lib.DecodeTypedValue(u.val)
+                          for u in responses[0].update.update])
+
+
+if __name__ == '__main__':
+  unittest.main()
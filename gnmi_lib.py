@@ -2,9 +2,18 @@
 
 This library used for Get and SetRequests using gNMI.
 """
+import collections
+import decimal
+import itertools
 import json
+import os
 import re
-from typing import List, Text, Iterable, Optional
+import struct
+import threading
+import time
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, Optional,
+                    Text, Tuple, Union)
+import gnmi_metrics
 import gnmi_pb2  # pip install protobuf
 import gnmi_pb2_grpc
 import grpc
@@ -28,6 +37,26 @@ class XpathError(Error):
   """Error parsing xpath provided."""
 
 
+class AliasError(Error):
+  """A notification referenced an alias that was never defined."""
+
+
+class CircuitOpenError(Error):
+  """RPCs to a target are refused after repeated transport failures."""
+
+
+# Status codes that retrying the same request will not fix.
+FATAL_CODES = frozenset([grpc.StatusCode.UNAUTHENTICATED,
+                         grpc.StatusCode.PERMISSION_DENIED,
+                         grpc.StatusCode.UNIMPLEMENTED,
+                         grpc.StatusCode.INVALID_ARGUMENT])
+# Status codes meaning the target could not be reached or did not answer.
+TRANSPORT_CODES = frozenset([grpc.StatusCode.UNAVAILABLE,
+                             grpc.StatusCode.DEADLINE_EXCEEDED])
+# UNAVAILABLE details pointing at a certificate or TLS mismatch.
+_RE_TLS_FAILURE = re.compile(r'certificate|ssl|tls|handshake', re.IGNORECASE)
+
+
 def PathNames(xpath: Text) -> List[Text]:
   """Parses the xpath names.
 
@@ -73,6 +102,331 @@ def ParsePath(p_names: Iterable[Text]) -> gnmi_pb2.Path:
   return gnmi_pb2.Path(elem=gnmi_elems)
 
 
+def PathToXpath(path: gnmi_pb2.Path) -> Text:
+  """Converts a gNMI Path object back into an xpath string.
+
+  This is the inverse of ParsePath(PathNames(xpath)); keys are emitted in sorted
+  order so that equal paths always produce equal strings.
+
+  Args:
+    path: (gnmi_pb2.Path) gNMI Path object.
+
+  Returns:
+    xpath formatted path, eg. /access-points/access-point[hostname=ap1].
+  """
+  words = []
+  for elem in path.elem:
+    if elem.key:
+      words.append(elem.name + ''.join(
+          '[%s=%s]' % (k, elem.key[k]) for k in sorted(elem.key)))
+    else:
+      words.append(elem.name)
+  if not words:  # Pre gNMI 0.4.0 targets may only populate 'element'.
+    words = list(path.element)
+  return '/' + '/'.join(words)
+
+
+def NormalizeXpath(xpath: Text) -> Text:
+  """Returns the xpath as PathToXpath would format it, eg. sorted keys."""
+  return PathToXpath(ParsePath(PathNames(xpath)))
+
+
+def JoinXpaths(prefix: Text, xpath: Text) -> Text:
+  """Joins a prefix xpath and a (relative) xpath into one xpath string."""
+  if not prefix or prefix == '/':
+    return xpath or '/'
+  if not xpath or xpath == '/':
+    return prefix
+  return prefix.rstrip('/') + '/' + xpath.lstrip('/')
+
+
+class AliasTable(object):
+  """Tracks gNMI path aliases negotiated on a Subscribe stream.
+
+  Aliases are either defined by the client (sent in an AliasList) or by the
+  target (a Notification with the alias field set and the aliased path as its
+  prefix).  Notifications then carry the alias as the single element of their
+  prefix.  The xpath of each alias is computed once, so resolving an aliased
+  prefix is a dict lookup rather than a walk of the Path message.
+  """
+
+  def __init__(self):
+    self._xpaths = {}  # alias name -> xpath string.
+
+  def Define(self, alias: Text, path: gnmi_pb2.Path) -> None:
+    """Defines (or redefines) an alias for the given path."""
+    self._xpaths[alias] = PathToXpath(path)
+
+  def Learn(self, notification: gnmi_pb2.Notification) -> bool:
+    """Records a target-defined alias, returns True if one was defined."""
+    if not notification.alias:
+      return False
+    self.Define(notification.alias, notification.prefix)
+    return True
+
+  def ResolveXpath(self, prefix: gnmi_pb2.Path) -> Optional[Text]:
+    """Returns the xpath of an aliased prefix or None if it is not an alias.
+
+    Raises:
+      AliasError: If the prefix references an alias that was never defined.
+    """
+    if len(prefix.elem) == 1 and not prefix.elem[0].key:
+      name = prefix.elem[0].name
+    elif not prefix.elem and len(prefix.element) == 1:
+      name = prefix.element[0]
+    else:
+      return None
+    if not name.startswith('#'):
+      return None
+    try:
+      return self._xpaths[name]
+    except KeyError:
+      raise AliasError('Undefined alias in notification prefix: %s' % name)
+
+  def AliasList(self, aliases: Dict[Text, Text]) -> gnmi_pb2.AliasList:
+    """Builds an AliasList from {alias: xpath}, defining each alias locally."""
+    alias_list = gnmi_pb2.AliasList()
+    for alias, xpath in aliases.items():
+      path = ParsePath(PathNames(xpath))
+      self.Define(alias, path)
+      alias_list.alias.add(path=path, alias=alias)
+    return alias_list
+
+
+def NotificationPrefix(notification: gnmi_pb2.Notification,
+                       aliases: Optional[AliasTable] = None) -> Text:
+  """Returns the xpath of a notification prefix, resolving aliases."""
+  if aliases is not None:
+    xpath = aliases.ResolveXpath(notification.prefix)
+    if xpath is not None:
+      return xpath
+  return PathToXpath(notification.prefix)
+
+
+def DecodeNotification(
+    notification: gnmi_pb2.Notification,
+    aliases: Optional[AliasTable] = None
+) -> Iterator[Tuple[Text, gnmi_pb2.TypedValue]]:
+  """Yields the full xpath and value of every update in a notification.
+
+  Alias definitions (a notification with the alias field set) are recorded in
+  the alias table and yield nothing.
+
+  Args:
+    notification: (gnmi_pb2.Notification) from a Get or Subscribe response.
+    aliases: (AliasTable) aliases negotiated on the stream, if any.
+
+  Yields:
+    (xpath, gnmi_pb2.TypedValue) tuples.
+  """
+  if aliases is not None and aliases.Learn(notification):
+    return
+  prefix = NotificationPrefix(notification, aliases)
+  for update in notification.update:
+    yield JoinXpaths(prefix, PathToXpath(update.path)), update.val
+
+
+def _ElemKey(elem: gnmi_pb2.PathElem) -> Tuple[Text, Tuple[Tuple[Text, Text],
+                                                         ...]]:
+  """Returns a hashable (name, keys) tuple for a PathElem, without module."""
+  return elem.name.split(':')[-1], tuple(sorted(elem.key.items()))
+
+
+def _Member(node: Dict[Text, Any], name: Text) -> Optional[Text]:
+  """Returns the JSON member name of name in node, with or without module."""
+  if name in node:
+    return name
+  for member in node:
+    if member.endswith(':' + name):
+      return member
+  return None
+
+
+def _EntryMatches(entry: Dict[Text, Any], keys: Iterable[Tuple[Text, Text]]
+                 ) -> bool:
+  """Whether a JSON list entry has all the given (key, value) pairs."""
+  for key, value in keys:
+    member = _Member(entry, key)
+    if member is None or str(entry[member]) != value:
+      return False
+  return True
+
+
+def _EntryKeys(entry: Dict[Text, Any]) -> List[Tuple[Text, Text]]:
+  """Returns the key leaves of a JSON list entry.
+
+  OpenConfig list entries only hold their keys (leafrefs to config) as direct
+  leaves, everything else lives in containers, so those are used as the keys.
+  """
+  return [(k.split(':')[-1], str(v)) for k, v in entry.items()
+          if not isinstance(v, (dict, list))]
+
+
+def _Merge(dst: Any, src: Any) -> Any:
+  """Merges src into dst in place, returns the merged value."""
+  if isinstance(dst, dict) and isinstance(src, dict):
+    for name, value in src.items():
+      member = _Member(dst, name.split(':')[-1]) or name
+      dst[member] = _Merge(dst.get(member), value)
+    return dst
+  if isinstance(dst, list) and isinstance(src, list):
+    for entry in src:
+      if isinstance(entry, dict):
+        keys = _EntryKeys(entry)
+        for existing in dst:
+          if keys and isinstance(existing, dict) and _EntryMatches(
+              existing, keys):
+            _Merge(existing, entry)
+            break
+        else:
+          dst.append(entry)
+      elif entry not in dst:
+        dst.append(entry)
+    return dst
+  return src
+
+
+def _Child(node: Dict[Text, Any], name: Text,
+           keys: Tuple[Tuple[Text, Text]], create: bool) -> Any:
+  """Returns the child of node for a path element, optionally creating it."""
+  member = _Member(node, name)
+  if not keys:
+    if member is None:
+      if not create:
+        return None
+      member = name
+      node[member] = {}
+    return node[member]
+  if member is None:
+    if not create:
+      return None
+    member = name
+    node[member] = []
+  for entry in node[member]:
+    if _EntryMatches(entry, keys):
+      return entry
+  if not create:
+    return None
+  entry = dict(keys)
+  node[member].append(entry)
+  return entry
+
+
+def _DecodeStripped(val: gnmi_pb2.TypedValue, strip: Iterable[bytes]) -> Any:
+  """DecodeTypedValue removing the given byte strings (eg. module prefixes)."""
+  kind = val.WhichOneof('value')
+  if strip and kind in ('json_ietf_val', 'json_val'):
+    data = getattr(val, kind)
+    for chunk in strip:
+      data = data.replace(chunk, b'')
+    return json.loads(data)
+  value = DecodeTypedValue(val)
+  if strip and isinstance(value, str):
+    for chunk in strip:
+      value = value.replace(chunk.decode('utf8'), '')
+  return value
+
+
+class _Tree(object):
+  """Holds the JSON tree being assembled below the requested root path."""
+
+  def __init__(self):
+    self.root = None
+
+  def Insert(self, relative, value):
+    if not relative:
+      self.root = _Merge(self.root, value)
+      return
+    if not isinstance(self.root, dict):
+      self.root = {}
+    node = self.root
+    for name, keys in relative[:-1]:
+      node = _Child(node, name, keys, create=True)
+    name, keys = relative[-1]
+    if keys:
+      _Merge(_Child(node, name, keys, create=True), value)
+    else:
+      member = _Member(node, name) or name
+      node[member] = _Merge(node.get(member), value)
+
+  def Delete(self, relative):
+    if not relative:
+      self.root = None
+      return
+    node = self.root
+    for name, keys in relative[:-1]:
+      if not isinstance(node, dict):
+        return
+      node = _Child(node, name, keys, create=False)
+    if not isinstance(node, dict):
+      return
+    name, keys = relative[-1]
+    member = _Member(node, name)
+    if member is None:
+      return
+    if not keys:
+      del node[member]
+      return
+    node[member] = [entry for entry in node[member]
+                    if not _EntryMatches(entry, keys)]
+
+
+def _Descend(value: Any, elems: Iterable[Tuple[Text, Tuple]]) -> Any:
+  """Walks down a decoded JSON value along path elements, None if missing."""
+  for name, keys in elems:
+    if not isinstance(value, dict):
+      return None
+    value = _Child(value, name, keys, create=False)
+  return value
+
+
+def AssembleNotifications(notifications: Iterable[gnmi_pb2.Notification],
+                          root: Text = '/',
+                          strip: Iterable[bytes] = ()) -> Any:
+  """Merges every update and delete of the notifications into one JSON tree.
+
+  Targets may split a container across several notifications or updates,
+  return it with a prefix, or answer with a value at a higher level than the
+  requested path.  All of those are folded, in a single pass and in the order
+  received, into the JSON tree rooted at the requested path.  As in gNMI, the
+  deletes of a notification are applied before its updates.  Values are merged
+  in place rather than copied; list entries are matched on their keys.
+
+  Args:
+    notifications: (list) gnmi_pb2.Notification objects, eg.
+      GetResponse.notification.
+    root: (str) the xpath that was requested; the returned tree is its value.
+    strip: (list) byte strings removed from values before decoding, eg.
+      module prefixes such as b'openconfig-wifi-types:'.
+
+  Returns:
+    the decoded value at root (usually a dict), or None if nothing was sent.
+  """
+  root_elems = [_ElemKey(e) for e in ParsePath(PathNames(root)).elem]
+  depth = len(root_elems)
+  tree = _Tree()
+  for notification in notifications:
+    if notification.alias:  # Alias definitions carry no data.
+      continue
+    prefix = [_ElemKey(e) for e in notification.prefix.elem]
+    for path in notification.delete:
+      full = prefix + [_ElemKey(e) for e in path.elem]
+      if full[:depth] == root_elems:
+        tree.Delete(full[depth:])
+      elif root_elems[:len(full)] == full:  # An ancestor of root was deleted.
+        tree.Delete([])
+    for update in notification.update:
+      full = prefix + [_ElemKey(e) for e in update.path.elem]
+      if full[:depth] == root_elems:
+        tree.Insert(full[depth:], _DecodeStripped(update.val, strip))
+      elif root_elems[:len(full)] == full:  # Value of an ancestor of root.
+        value = _Descend(_DecodeStripped(update.val, strip),
+                         root_elems[len(full):])
+        if value is not None:
+          tree.Insert([], value)
+  return tree.root
+
+
 def CreateCreds(
     root_cert: Optional[Text] = None) -> grpc.ssl_channel_credentials:
   """Creates credentials used in gNMI Requests.
@@ -87,54 +441,237 @@ def CreateCreds(
       root_certificates=root_cert, private_key=None, certificate_chain=None)
 
 
-def CreateStub(creds: grpc.ssl_channel_credentials,
+def CreateStub(creds: Optional[grpc.ssl_channel_credentials],
                target: Text,
                port: Text,
-               host_override: Optional[Text] = None) -> gnmi_pb2_grpc.gNMIStub:
+               host_override: Optional[Text] = None,
+               interceptors: Optional[Iterable[Any]] = None
+              ) -> gnmi_pb2_grpc.gNMIStub:
   """Creates a gNMI GetRequest.
 
   Args:
-    creds: (object) of gNMI Credentials class used to build the secure channel.
+    creds: (object) of gNMI Credentials class used to build the secure channel,
+      None for an insecure channel (eg. to a local fake_ap target).
     target: (str) gNMI Target.
     port: (str) gNMI Target IP port.
     host_override: (str) Hostname being overridden for Cert check.
+    interceptors: (list) gRPC client interceptors installed on the channel.
+      Defaults to a gnmi_metrics.MetricsInterceptor for the target; pass an
+      empty list to install none.
 
   Returns:
     a gnmi_pb2_grpc object representing a gNMI Stub.
   """
-  if host_override:
+  if creds is None:
+    channel = grpc.insecure_channel(target + ':' + port)
+  elif host_override:
     channel = grpc.secure_channel(target + ':' + port, creds, ((
         'grpc.ssl_target_name_override',
         host_override,
     ),))
   else:
     channel = grpc.secure_channel(target + ':' + port, creds)
+  if interceptors is None:
+    interceptors = [gnmi_metrics.MetricsInterceptor(target=target + ':' + port)]
+  if interceptors:
+    channel = grpc.intercept_channel(channel, *interceptors)
   return gnmi_pb2_grpc.gNMIStub(channel)
 
 
-def Get(stub: gnmi_pb2_grpc.gNMIStub, paths: gnmi_pb2.Path, username: Text,
-        password: Text) -> gnmi_pb2.GetResponse:
+def IsRetryable(error: grpc.RpcError) -> bool:
+  """Returns whether an RPC that failed with error may succeed if retried.
+
+  Authentication, authorization, unsupported and malformed requests fail the
+  same way every time, as does a TLS handshake against a mismatched
+  certificate (reported as UNAVAILABLE).
+
+  Args:
+    error: (grpc.RpcError) the error raised by the RPC.
+  """
+  code = error.code()
+  if code in FATAL_CODES:
+    return False
+  if (code == grpc.StatusCode.UNAVAILABLE and
+      _RE_TLS_FAILURE.search(error.details() or '')):
+    return False
+  return True
+
+
+class CircuitBreaker(object):
+  """Fails RPCs to a target fast once it stopped answering.
+
+  The breaker opens after threshold consecutive transport failures (see
+  TRANSPORT_CODES).  While open, Check raises CircuitOpenError.  After the
+  cooldown a single trial RPC is let through: success closes the breaker, a
+  transport failure opens it again.  Any answer from the target, even an error
+  status, counts as success.
+  """
+
+  def __init__(self, target: Text, threshold: int = 5,
+               cooldown: float = 300.0):
+    """Initializes a CircuitBreaker.
+
+    Args:
+      target: (str) the target this breaker guards, used in errors.
+      threshold: (int) consecutive transport failures opening the breaker.
+      cooldown: (float) seconds the breaker stays open before a trial RPC.
+    """
+    self.target = target
+    self.threshold = threshold
+    self.cooldown = cooldown
+    self.failures = 0
+    self.opened_at = None
+    self.last_error = None
+    self._trial = False
+    self._lock = threading.Lock()
+
+  def IsOpen(self) -> bool:
+    """Returns whether RPCs to the target are currently refused."""
+    with self._lock:
+      return (self.opened_at is not None and
+              (self._trial or time.time() - self.opened_at < self.cooldown))
+
+  def Check(self) -> None:
+    """Raises CircuitOpenError unless an RPC may be sent to the target."""
+    with self._lock:
+      if self.opened_at is None:
+        return
+      if not self._trial and time.time() - self.opened_at >= self.cooldown:
+        self._trial = True  # Let this RPC through as the trial.
+        return
+      raise CircuitOpenError(
+          'Circuit to %s is open after %d transport failures, last: %s' % (
+              self.target, self.failures, self.last_error))
+
+  def Record(self, error: Optional[grpc.RpcError] = None) -> None:
+    """Records the outcome of an RPC to the target.
+
+    Args:
+      error: (grpc.RpcError) the error raised by the RPC, None on success.
+    """
+    with self._lock:
+      self._trial = False
+      if error is None or error.code() not in TRANSPORT_CODES:
+        self.failures = 0
+        self.opened_at = None
+        return
+      self.failures += 1
+      self.last_error = '%s: %s' % (error.code().name, error.details())
+      if self.failures >= self.threshold or self.opened_at is not None:
+        self.opened_at = time.time()
+
+
+def Capabilities(stub: gnmi_pb2_grpc.gNMIStub,
+                 username: Text,
+                 password: Text,
+                 timeout: Optional[float] = None
+                ) -> gnmi_pb2.CapabilityResponse:
+  """Sends a gNMI CapabilityRequest.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    timeout: (float) RPC deadline in seconds, None waits indefinitely.
+
+  Returns:
+    a gnmi_pb2.CapabilityResponse listing the target's models and encodings.
+  """
+  return stub.Capabilities(gnmi_pb2.CapabilityRequest(),
+                           metadata=_Metadata(username, password),
+                           timeout=timeout)
+
+
+def Get(stub: gnmi_pb2_grpc.gNMIStub,
+        paths: Union[gnmi_pb2.Path, Iterable[gnmi_pb2.Path]],
+        username: Text,
+        password: Text,
+        data_type: Text = 'ALL',
+        use_models: Optional[Iterable[gnmi_pb2.ModelData]] = None,
+        prefix: Optional[gnmi_pb2.Path] = None,
+        encoding: Text = 'JSON_IETF',
+        timeout: Optional[float] = None) -> gnmi_pb2.GetResponse:
   """Creates a gNMI GetRequest.
 
   Args:
     stub: (class) gNMI Stub used to build the secure channel.
-    paths: gNMI Path
+    paths: gNMI Path, or a list of gNMI Paths to batch in one request.
     username: (str) Username used when building the channel.
     password: (str) Password used when building the channel.
+    data_type: (str) GetRequest.DataType, one of ALL, CONFIG, STATE or
+      OPERATIONAL.  Anything other than ALL lets the target omit unrelated
+      data (eg. counters when only config is wanted).
+    use_models: (list) gnmi_pb2.ModelData the target should restrict the
+      response to.
+    prefix: gNMI Path prepended to every path in the request, paths are then
+      relative to it.
+    encoding: (str) gNMI Encoding, eg. JSON_IETF or PROTO (scalar leaves).
+    timeout: (float) RPC deadline in seconds, None waits indefinitely.
 
   Returns:
     a gnmi_pb2.GetResponse object representing a gNMI GetResponse.
   """
+  return stub.Get(
+      _GetRequest(paths, data_type, use_models, prefix, encoding),
+      metadata=_Metadata(username, password), timeout=timeout)
+
+
+def GetFuture(stub: gnmi_pb2_grpc.gNMIStub,
+              paths: Union[gnmi_pb2.Path, Iterable[gnmi_pb2.Path]],
+              username: Text,
+              password: Text,
+              data_type: Text = 'ALL',
+              use_models: Optional[Iterable[gnmi_pb2.ModelData]] = None,
+              prefix: Optional[gnmi_pb2.Path] = None,
+              encoding: Text = 'JSON_IETF',
+              timeout: Optional[float] = None) -> grpc.Future:
+  """Sends a gNMI GetRequest without waiting for the response.
+
+  Several requests can be in flight on the same stub; see Get for the
+  arguments.
+
+  Returns:
+    a grpc.Future whose result() is the gnmi_pb2.GetResponse.  Cancelling it
+    cancels the RPC.
+  """
+  return stub.Get.future(
+      _GetRequest(paths, data_type, use_models, prefix, encoding),
+      metadata=_Metadata(username, password), timeout=timeout)
+
+
+def _GetRequest(paths: Union[gnmi_pb2.Path, Iterable[gnmi_pb2.Path]],
+                data_type: Text,
+                use_models: Optional[Iterable[gnmi_pb2.ModelData]],
+                prefix: Optional[gnmi_pb2.Path],
+                encoding: Text) -> gnmi_pb2.GetRequest:
+  if isinstance(paths, gnmi_pb2.Path):
+    paths = [paths]
+  return gnmi_pb2.GetRequest(path=paths, type=data_type, encoding=encoding,
+                             prefix=prefix, use_models=use_models)
+
+
+def _Metadata(username: Text,
+              password: Text) -> Optional[List[Tuple[Text, Text]]]:
+  """Returns the call metadata carrying the credentials, if any."""
   if username and password:  # User/pass supplied for Authentication.
-    return stub.Get(
-        gnmi_pb2.GetRequest(path=[paths], encoding='JSON_IETF'),
-        metadata=[('username', username), ('password', password)])
-  return stub.Get(gnmi_pb2.GetRequest(path=[paths], encoding='JSON_IETF'))
+    return [('username', username), ('password', password)]
+  return None
+
+
+def ModelDataList(models: Dict[Text, Text],
+                  organization: Text = 'OpenConfig working group'
+                 ) -> List[gnmi_pb2.ModelData]:
+  """Returns ModelData for a {model name: version} dict, eg. for use_models."""
+  return [gnmi_pb2.ModelData(name=name, version=version,
+                             organization=organization)
+          for name, version in sorted(models.items())]
 
 
 def Set(stub: gnmi_pb2_grpc.gNMIStub, paths: gnmi_pb2.Path, username: Text,
         password: Text, json_value: Text,
-        set_type: Text) -> gnmi_pb2.SetResponse:
+        set_type: Text,
+        prefix: Optional[gnmi_pb2.Path] = None,
+        timeout: Optional[float] = None) -> gnmi_pb2.SetResponse:
   """Creates a gNMI SetRequest.
 
   Args:
@@ -144,6 +681,8 @@ def Set(stub: gnmi_pb2_grpc.gNMIStub, paths: gnmi_pb2.Path, username: Text,
     password: (str) Password used when building the channel.
     json_value: (str) JSON_IETF Value or file.
     set_type: (str) Type of gNMI SetRequest to build.
+    prefix: gNMI Path prepended to the path, which is then relative to it.
+    timeout: (float) RPC deadline in seconds, None waits indefinitely.
   Returns:
     a gnmi_pb2.SetResponse object representing a gNMI SetResponse.
   """
@@ -151,12 +690,756 @@ def Set(stub: gnmi_pb2_grpc.gNMIStub, paths: gnmi_pb2.Path, username: Text,
     val = gnmi_pb2.TypedValue()
     val.json_ietf_val = json.dumps(json_value).encode('utf8')
     path_val = gnmi_pb2.Update(path=paths, val=val,)
+  metadata = [('username', username), ('password', password)]
   if set_type == 'update':
-    return stub.Set(gnmi_pb2.SetRequest(update=[path_val]), metadata=[
-        ('username', username), ('password', password)])
+    return stub.Set(gnmi_pb2.SetRequest(prefix=prefix, update=[path_val]),
+                    metadata=metadata, timeout=timeout)
   elif set_type == 'replace':
-    return stub.Set(gnmi_pb2.SetRequest(replace=[path_val]), metadata=[
-        ('username', username), ('password', password)])
+    return stub.Set(gnmi_pb2.SetRequest(prefix=prefix, replace=[path_val]),
+                    metadata=metadata, timeout=timeout)
   elif set_type == 'delete':
-    return stub.Set(gnmi_pb2.SetRequest(delete=[paths]), metadata=[
-        ('username', username), ('password', password)])
+    return stub.Set(gnmi_pb2.SetRequest(prefix=prefix, delete=[paths]),
+                    metadata=metadata, timeout=timeout)
+
+
+def TypedValueFromPython(value: Any,
+                         encoding: Text = 'PROTO') -> gnmi_pb2.TypedValue:
+  """Builds a TypedValue for a scalar leaf value.
+
+  Args:
+    value: (bool, int, float, str, bytes or list) the leaf value.
+    encoding: (str) PROTO for scalar TypedValues (eg. uint_val), or JSON_IETF
+      to send the value as RFC7951 JSON text.
+
+  Returns:
+    a gnmi_pb2.TypedValue object.
+  """
+  if encoding == 'JSON_IETF':
+    return gnmi_pb2.TypedValue(json_ietf_val=json.dumps(value).encode('utf8'))
+  if isinstance(value, bool):  # bool is a subclass of int, check it first.
+    return gnmi_pb2.TypedValue(bool_val=value)
+  if isinstance(value, int):
+    if value < 0:
+      return gnmi_pb2.TypedValue(int_val=value)
+    return gnmi_pb2.TypedValue(uint_val=value)
+  if isinstance(value, float):
+    return gnmi_pb2.TypedValue(float_val=value)
+  if isinstance(value, bytes):
+    return gnmi_pb2.TypedValue(bytes_val=value)
+  if isinstance(value, (list, tuple)):
+    return gnmi_pb2.TypedValue(leaflist_val=gnmi_pb2.ScalarArray(
+        element=[TypedValueFromPython(v) for v in value]))
+  return gnmi_pb2.TypedValue(string_val=str(value))
+
+
+def DecodeTypedValue(val: gnmi_pb2.TypedValue) -> Any:
+  """Decodes a TypedValue into a native Python value.
+
+  JSON (json_val and json_ietf_val) is parsed, decimal64 becomes a
+  decimal.Decimal, leaf-lists become lists and any_val is returned as the
+  google.protobuf.Any message.  Scalar (PROTO) encoded leaves never touch the
+  JSON parser.
+
+  Args:
+    val: (gnmi_pb2.TypedValue) the value of an Update.
+
+  Returns:
+    the decoded value, or None if no value is set.
+  """
+  kind = val.WhichOneof('value')
+  if kind is None:
+    return None
+  if kind in ('json_ietf_val', 'json_val'):
+    return json.loads(getattr(val, kind))
+  if kind == 'decimal_val':
+    return decimal.Decimal(val.decimal_val.digits).scaleb(
+        -val.decimal_val.precision)
+  if kind == 'leaflist_val':
+    return [DecodeTypedValue(v) for v in val.leaflist_val.element]
+  return getattr(val, kind)
+
+
+def SetLeaves(stub: gnmi_pb2_grpc.gNMIStub,
+              leaves: Iterable[Tuple[gnmi_pb2.Path, Any]],
+              username: Text,
+              password: Text,
+              encoding: Text = 'PROTO',
+              prefix: Optional[gnmi_pb2.Path] = None,
+              timeout: Optional[float] = None) -> gnmi_pb2.SetResponse:
+  """Creates a gNMI SetRequest updating individual leaves.
+
+  Unlike Set, which sends a JSON_IETF container, every leaf is its own Update
+  carrying a scalar TypedValue.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    leaves: (list) of (gNMI Path, value) tuples, one per leaf.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    encoding: (str) PROTO for scalar values, JSON_IETF for JSON text values.
+    prefix: gNMI Path prepended to every leaf path.
+    timeout: (float) RPC deadline in seconds, None waits indefinitely.
+  Returns:
+    a gnmi_pb2.SetResponse object representing a gNMI SetResponse.
+  """
+  updates = [gnmi_pb2.Update(path=path,
+                             val=TypedValueFromPython(value, encoding))
+             for path, value in leaves]
+  return stub.Set(gnmi_pb2.SetRequest(prefix=prefix, update=updates),
+                  metadata=[('username', username), ('password', password)],
+                  timeout=timeout)
+
+
+def SplitXpath(xpath: Text, prefix: Text) -> Optional[Tuple[Text, Text]]:
+  """Splits an xpath into a prefix and the remaining relative xpath.
+
+  Args:
+    xpath: (str) full xpath, eg. /access-points/access-point[hostname=x]/radios
+    prefix: (str) the xpath prefix to split off.
+
+  Returns:
+    (prefix, relative xpath) or None if xpath is not strictly below prefix.
+  """
+  prefix = '/' + prefix.strip('/')
+  xpath = '/' + xpath.strip('/')
+  if len(xpath) <= len(prefix) + 1 or not xpath.startswith(prefix + '/'):
+    return None
+  return prefix, xpath[len(prefix):]
+
+
+def _SubscribeRequests(
+    subscription_list: gnmi_pb2.SubscriptionList,
+    alias_list: Optional[gnmi_pb2.AliasList] = None
+) -> Iterator[gnmi_pb2.SubscribeRequest]:
+  """Yields the SubscribeRequests that open a subscription."""
+  yield gnmi_pb2.SubscribeRequest(subscribe=subscription_list)
+  if alias_list is not None and alias_list.alias:
+    yield gnmi_pb2.SubscribeRequest(aliases=alias_list)
+
+
+def Subscribe(stub: gnmi_pb2_grpc.gNMIStub,
+              paths: Iterable[gnmi_pb2.Path],
+              username: Text,
+              password: Text,
+              mode: Text = 'STREAM',
+              sub_mode: Text = 'TARGET_DEFINED',
+              sample_interval: int = 0,
+              use_aliases: bool = False,
+              aliases: Optional[Dict[Text, Text]] = None,
+              alias_table: Optional[AliasTable] = None,
+              prefix: Optional[gnmi_pb2.Path] = None,
+              encoding: Text = 'JSON_IETF',
+              timeout: Optional[float] = None
+             ) -> Iterator[gnmi_pb2.SubscribeResponse]:
+  """Creates a gNMI Subscribe stream.
+
+  When use_aliases is set the target is allowed to define aliases for the
+  subscribed paths, client-defined aliases ({'#name': xpath}) are sent right
+  after the SubscriptionList.  Pass the same alias_table to DecodeNotification
+  to resolve the aliased prefixes in the returned notifications.
+
+  Args:
+    stub: (class) gNMI Stub used to build the secure channel.
+    paths: gNMI Paths to subscribe to.
+    username: (str) Username used when building the channel.
+    password: (str) Password used when building the channel.
+    mode: (str) SubscriptionList mode, one of STREAM, ONCE or POLL.
+    sub_mode: (str) Subscription mode, eg. TARGET_DEFINED, ON_CHANGE, SAMPLE.
+    sample_interval: (int) nanoseconds between samples in SAMPLE mode.
+    use_aliases: (bool) Whether the target may use aliases.
+    aliases: (dict) client-defined aliases, alias name to xpath.
+    alias_table: (AliasTable) table the client-defined aliases are added to.
+    prefix: gNMI Path prepended to every subscribed path.
+    encoding: (str) gNMI Encoding, eg. JSON_IETF or PROTO (scalar leaves).
+    timeout: (float) deadline in seconds for the whole stream, None waits
+      indefinitely.
+
+  Returns:
+    an iterator of gnmi_pb2.SubscribeResponse objects.
+  """
+  subscription_list = gnmi_pb2.SubscriptionList(
+      prefix=prefix,
+      subscription=[gnmi_pb2.Subscription(
+          path=path, mode=sub_mode, sample_interval=sample_interval)
+                    for path in paths],
+      mode=mode, use_aliases=use_aliases or bool(aliases),
+      encoding=encoding)
+  alias_list = None
+  if aliases:
+    if alias_table is None:
+      alias_table = AliasTable()
+    alias_list = alias_table.AliasList(aliases)
+  requests = _SubscribeRequests(subscription_list, alias_list)
+  if username and password:  # User/pass supplied for Authentication.
+    return stub.Subscribe(requests, metadata=[
+        ('username', username), ('password', password)], timeout=timeout)
+  return stub.Subscribe(requests, timeout=timeout)
+
+
+# Cassettes record every RPC of a run for replay without a device.  A cassette
+# is an append-only file: a header, then records of a struct header (kind,
+# call id, seconds since the cassette was opened, payload length) followed by
+# the payload.  A call is a _CALL record with the method name, then _REQUEST
+# and _RESPONSE records with serialized messages, then a _STATUS record with
+# the status code and details.
+_CASSETTE_HEADER = b'gNMI cassette 1\n'
+_RECORD = struct.Struct('<BIdI')
+_CALL, _REQUEST, _RESPONSE, _STATUS = range(4)
+_STATUS_CODE = struct.Struct('<I')
+_STATUS_CODES = {code.value[0]: code for code in grpc.StatusCode}
+
+
+class CassetteError(Error):
+  """A cassette is unreadable or has no recording of a replayed RPC."""
+
+
+def _Serialized(message: Any) -> bytes:
+  return message.SerializeToString(deterministic=True)
+
+
+def _MethodName(method: Union[Text, bytes]) -> Text:
+  return method.decode('utf8') if isinstance(method, bytes) else method
+
+
+class Recorder(object):
+  """Appends the RPCs seen by RecordingInterceptors to a cassette file.
+
+  Nothing is recorded until Open; every record is flushed as it is written, so
+  a cassette of a run that crashed is still readable up to the crash.
+  """
+
+  def __init__(self):
+    self.path = None
+    self._file = None
+    self._start = 0.0
+    self._ids = itertools.count(1)
+    self._first_id = 1  # Calls before it were recorded in an earlier cassette.
+    self._in_flight = set()  # Unary calls whose status is not recorded yet.
+    self._lock = threading.Lock()
+    self._idle = threading.Condition(self._lock)
+
+  def Open(self, path: Text) -> None:
+    """Starts recording to path, replacing the cassette there, if any."""
+    self.Close()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with self._lock:
+      self._file = open(path, 'wb')
+      self._file.write(_CASSETTE_HEADER)
+      self.path = path
+      self._start = time.time()
+      self._first_id = next(self._ids)
+
+  def Close(self, timeout: float = 10.0) -> None:
+    """Stops recording once the unary calls in flight have ended.
+
+    Their status is recorded on a gRPC thread, possibly after the caller got
+    the response.  Calls still in flight after timeout seconds are replayed as
+    UNAVAILABLE, see ReadCassette.
+
+    Args:
+      timeout: (float) seconds to wait for the calls in flight.
+    """
+    with self._lock:
+      self._idle.wait_for(lambda: not self._in_flight, timeout)
+      if self._file is not None:
+        self._file.close()
+      self._file = self.path = None
+      self._in_flight.clear()
+
+  def Call(self, method: Union[Text, bytes],
+           unary: bool = False) -> Optional[int]:
+    """Records the start of an RPC.
+
+    Args:
+      method: (str) the full method name.
+      unary: (bool) Whether Close waits for the Status of the call.
+
+    Returns:
+      the id of the call, None when not recording.
+    """
+    with self._lock:
+      if self._file is None:
+        return None
+      call_id = next(self._ids)
+      if unary:
+        self._in_flight.add(call_id)
+    self.Add(_CALL, call_id, _MethodName(method).encode('utf8'))
+    return call_id
+
+  def Add(self, kind: int, call_id: Optional[int], payload: bytes) -> None:
+    """Appends a record of a call, unless call_id is None.
+
+    Args:
+      kind: (int) _REQUEST, _RESPONSE, _STATUS or _CALL.
+      call_id: (int) id returned by Call.
+      payload: (bytes) the serialized message, status or method.
+    """
+    if call_id is None:
+      return
+    with self._lock:
+      self._Write(kind, call_id, payload)
+
+  def Status(self, call_id: Optional[int], code: grpc.StatusCode,
+             details: Optional[Text]) -> None:
+    """Records the status a call ended with."""
+    if call_id is None:
+      return
+    with self._lock:
+      self._Write(_STATUS, call_id, _STATUS_CODE.pack(code.value[0]) +
+                  (details or '').encode('utf8'))
+      self._in_flight.discard(call_id)
+      if not self._in_flight:
+        self._idle.notify_all()
+
+  def _Write(self, kind: int, call_id: int, payload: bytes) -> None:
+    """Appends a record to the open cassette, with the lock held."""
+    # Calls outliving the cassette they started in are not recorded in the next.
+    if self._file is None or call_id < self._first_id:
+      return
+    self._file.write(_RECORD.pack(kind, call_id, time.time() - self._start,
+                                  len(payload)) + payload)
+    self._file.flush()
+
+
+RECORDER = Recorder()
+
+
+class _RecordedStream(object):
+  """Wraps a streaming call, recording its responses and final status."""
+
+  def __init__(self, call, recorder: Recorder, call_id: Optional[int]):
+    self._call = call
+    self._recorder = recorder
+    self._call_id = call_id
+    self._done = False
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    try:
+      response = next(self._call)
+    except StopIteration:
+      self._Finish(grpc.StatusCode.OK, '')
+      raise
+    except grpc.RpcError as e:
+      self._Finish(e.code(), e.details())
+      raise
+    self._recorder.Add(_RESPONSE, self._call_id, _Serialized(response))
+    return response
+
+  def cancel(self):
+    self._Finish(grpc.StatusCode.CANCELLED, 'Cancelled by the client')
+    return self._call.cancel()
+
+  def _Finish(self, code, details):
+    if not self._done:
+      self._done = True
+      self._recorder.Status(self._call_id, code, details)
+
+  def __getattr__(self, name):
+    return getattr(self._call, name)
+
+
+class RecordingInterceptor(grpc.UnaryUnaryClientInterceptor,
+                           grpc.StreamStreamClientInterceptor):
+  """Records every request and response, with timing, in a cassette.
+
+  Credentials in the metadata are never recorded.
+  """
+
+  def __init__(self, recorder: Recorder = RECORDER):
+    self.recorder = recorder
+
+  def intercept_unary_unary(self, continuation, client_call_details, request):
+    call_id = self.recorder.Call(client_call_details.method, unary=True)
+    self.recorder.Add(_REQUEST, call_id, _Serialized(request))
+    call = continuation(client_call_details, request)
+
+    def _Done(future):
+      code = future.code() or grpc.StatusCode.OK
+      if code == grpc.StatusCode.OK:
+        self.recorder.Add(_RESPONSE, call_id, _Serialized(future.result()))
+      self.recorder.Status(call_id, code, future.details())
+
+    if call_id is not None:
+      call.add_done_callback(_Done)
+    return call
+
+  def intercept_stream_stream(self, continuation, client_call_details,
+                              request_iterator):
+    call_id = self.recorder.Call(client_call_details.method)
+
+    def _Requests():
+      for request in request_iterator:
+        self.recorder.Add(_REQUEST, call_id, _Serialized(request))
+        yield request
+
+    call = continuation(client_call_details, _Requests())
+    return _RecordedStream(call, self.recorder, call_id)
+
+
+class _Recording(object):
+  """One call read from a cassette."""
+
+  def __init__(self, method: Text, start: float):
+    self.method = method
+    self.start = start
+    self.requests = []
+    self.responses = []  # (seconds after the call started, bytes) tuples.
+    self.code = None
+    self.details = ''
+    self.end = 0.0  # Seconds after the call started.
+
+
+def ReadCassette(path: Text) -> List[_Recording]:
+  """Returns the calls recorded in a cassette, in the order they started.
+
+  Calls the recording stopped in the middle of end with UNAVAILABLE.
+
+  Raises:
+    CassetteError: If path is not a cassette.
+  """
+  with open(path, 'rb') as f:
+    data = f.read()
+  if not data.startswith(_CASSETTE_HEADER):
+    raise CassetteError('%s is not a gNMI cassette' % path)
+  calls = {}
+  offset = len(_CASSETTE_HEADER)
+  while offset + _RECORD.size <= len(data):
+    kind, call_id, seconds, size = _RECORD.unpack_from(data, offset)
+    offset += _RECORD.size
+    payload = data[offset:offset + size]
+    offset += size
+    if len(payload) < size:
+      break  # Truncated by a crash while recording.
+    if kind == _CALL:
+      calls[call_id] = _Recording(payload.decode('utf8'), seconds)
+      continue
+    call = calls.get(call_id)
+    if call is None:
+      raise CassetteError('%s: record of unknown call %d' % (path, call_id))
+    if kind == _REQUEST:
+      call.requests.append(payload)
+    elif kind == _RESPONSE:
+      call.responses.append((seconds - call.start, payload))
+    elif kind == _STATUS:
+      call.code = _STATUS_CODES[_STATUS_CODE.unpack_from(payload)[0]]
+      call.details = payload[_STATUS_CODE.size:].decode('utf8')
+      call.end = seconds - call.start
+  for call in calls.values():
+    if call.code is None:
+      call.code, call.details = (grpc.StatusCode.UNAVAILABLE,
+                                 'Recording stopped during the call')
+      call.end = call.responses[-1][0] if call.responses else 0.0
+  return sorted(calls.values(), key=lambda c: c.start)
+
+
+class Player(object):
+  """Serves the calls of a cassette back to ReplayChannels.
+
+  A replayed call is matched by its method and first request, calls with the
+  same ones are served in the order they were recorded.  In real time the
+  responses arrive as long after the call as they did when recorded,
+  otherwise at once.
+  """
+
+  def __init__(self, realtime: bool = False):
+    self.realtime = realtime
+    self.path = None
+    self._calls = {}  # (method, first request) -> deque of _Recordings.
+    self._lock = threading.Lock()
+
+  def Load(self, path: Text) -> int:
+    """Replaces the calls served by the ones recorded in a cassette.
+
+    Returns:
+      the number of calls loaded.
+
+    Raises:
+      CassetteError: If path is not a cassette.
+    """
+    calls = {}
+    recordings = ReadCassette(path)
+    for call in recordings:
+      key = (call.method, call.requests[0] if call.requests else b'')
+      calls.setdefault(key, collections.deque()).append(call)
+    with self._lock:
+      self.path = path
+      self._calls = calls
+    return len(recordings)
+
+  def Take(self, method: Union[Text, bytes], request: Any) -> _Recording:
+    """Returns the next recording of a call.
+
+    Raises:
+      CassetteError: If the cassette has no (more) recordings of the call.
+    """
+    method = _MethodName(method)
+    with self._lock:
+      recordings = self._calls.get((method, _Serialized(request)))
+      if not recordings:
+        raise CassetteError('%s has no recording of %s(%s)' % (
+            self.path, method, request))
+      return recordings.popleft()
+
+  def Sleep(self, seconds: float) -> None:
+    """Sleeps seconds in real time, skips the sleep otherwise."""
+    if self.realtime and seconds > 0:
+      time.sleep(seconds)
+
+
+PLAYER = Player()
+
+
+class _ReplayedCall(grpc.RpcError, grpc.Call, grpc.Future):
+  """A replayed unary call: its future, its outcome and its error."""
+
+  def __init__(self, recording: _Recording, deserializer: Callable):
+    self._recording = recording
+    self.seconds = recording.end  # How long the call took when recorded.
+    self._response = None
+    if recording.code == grpc.StatusCode.OK:
+      self._response = deserializer(recording.responses[-1][1])
+    self._done = threading.Event()
+    self._callbacks = []
+    self._lock = threading.Lock()
+
+  def Finish(self) -> None:
+    with self._lock:
+      self._done.set()
+      callbacks, self._callbacks = self._callbacks, []
+    for callback in callbacks:
+      callback(self)
+
+  # grpc.Call and grpc.Future.
+  def initial_metadata(self):
+    return ()
+
+  def trailing_metadata(self):
+    return ()
+
+  def code(self):
+    return self._recording.code
+
+  def details(self):
+    return self._recording.details
+
+  def is_active(self):
+    return not self._done.is_set()
+
+  def time_remaining(self):
+    return None
+
+  def cancel(self):
+    return False
+
+  def cancelled(self):
+    return False
+
+  def running(self):
+    return not self._done.is_set()
+
+  def done(self):
+    return self._done.is_set()
+
+  def add_callback(self, callback):
+    return False
+
+  def add_done_callback(self, fn):
+    with self._lock:
+      if not self._done.is_set():
+        self._callbacks.append(fn)
+        return
+    fn(self)
+
+  def result(self, timeout=None):
+    if not self._done.wait(timeout):
+      raise grpc.FutureTimeoutError()
+    if self._response is None:
+      raise self
+    return self._response
+
+  def exception(self, timeout=None):
+    if not self._done.wait(timeout):
+      raise grpc.FutureTimeoutError()
+    return None if self._response is not None else self
+
+  def traceback(self, timeout=None):
+    return None
+
+  def __str__(self):
+    return '<Replayed RPC that terminated with %s: %s>' % (
+        self.code(), self.details())
+
+
+class _ReplayUnary(object):
+  """Replays the calls of a unary method."""
+
+  def __init__(self, player: Player, method: Text, deserializer: Callable):
+    self._player = player
+    self._method = method
+    self._deserializer = deserializer
+
+  def _Call(self, request) -> _ReplayedCall:
+    recording = self._player.Take(self._method, request)
+    return _ReplayedCall(recording, self._deserializer)
+
+  def __call__(self, request, timeout=None, metadata=None, credentials=None,
+               wait_for_ready=None, compression=None):
+    return self.with_call(request)[0]
+
+  def with_call(self, request, timeout=None, metadata=None, credentials=None,
+                wait_for_ready=None, compression=None):
+    call = self._Call(request)
+    self._player.Sleep(call.seconds)
+    call.Finish()
+    return call.result(), call
+
+  def future(self, request, timeout=None, metadata=None, credentials=None,
+             wait_for_ready=None, compression=None):
+    call = self._Call(request)
+    if self._player.realtime:
+      timer = threading.Timer(call.seconds, call.Finish)
+      timer.daemon = True
+      timer.start()
+    else:
+      call.Finish()
+    return call
+
+
+class _ReplayedStream(grpc.RpcError, grpc.Call):
+  """A replayed streaming call: the iterator of its responses and its error."""
+
+  def __init__(self, player: Player, recording: _Recording,
+               deserializer: Callable):
+    self._player = player
+    self._recording = recording
+    self._deserializer = deserializer
+    self._start = time.time()
+    self._next = 0
+    self._code = None
+    self._details = ''
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    if self._code is None and self._next < len(self._recording.responses):
+      seconds, response = self._recording.responses[self._next]
+      self._next += 1
+      self._player.Sleep(self._start + seconds - time.time())
+      return self._deserializer(response)
+    if self._code is None:
+      self._player.Sleep(self._start + self._recording.end - time.time())
+      self._code = self._recording.code
+      self._details = self._recording.details
+    if self._code == grpc.StatusCode.OK:
+      raise StopIteration
+    raise self
+
+  def cancel(self):
+    if self._code is None:
+      self._code, self._details = (grpc.StatusCode.CANCELLED,
+                                   'Cancelled by the client')
+    return True
+
+  def initial_metadata(self):
+    return ()
+
+  def trailing_metadata(self):
+    return ()
+
+  def code(self):
+    return self._code
+
+  def details(self):
+    return self._details
+
+  def is_active(self):
+    return self._code is None
+
+  def time_remaining(self):
+    return None
+
+  def add_callback(self, callback):
+    return False
+
+  def __str__(self):
+    return '<Replayed stream that terminated with %s: %s>' % (
+        self._code, self._details)
+
+
+class _ReplayStream(object):
+  """Replays the calls of a bidirectional streaming method."""
+
+  def __init__(self, player: Player, method: Text, deserializer: Callable):
+    self._player = player
+    self._method = method
+    self._deserializer = deserializer
+
+  def __call__(self, request_iterator, timeout=None, metadata=None,
+               credentials=None, wait_for_ready=None, compression=None):
+    # Later requests (eg. polls) do not change what was recorded.
+    recording = self._player.Take(self._method, next(iter(request_iterator)))
+    return _ReplayedStream(self._player, recording, self._deserializer)
+
+
+class ReplayChannel(grpc.Channel):
+  """A channel answering every RPC from the cassette loaded in a Player."""
+
+  def __init__(self, player: Player = PLAYER):
+    self.player = player
+
+  def unary_unary(self, method, request_serializer=None,
+                  response_deserializer=None, _registered_method=False):
+    return _ReplayUnary(self.player, _MethodName(method),
+                        response_deserializer)
+
+  def stream_stream(self, method, request_serializer=None,
+                    response_deserializer=None, _registered_method=False):
+    return _ReplayStream(self.player, _MethodName(method),
+                         response_deserializer)
+
+  def unary_stream(self, method, request_serializer=None,
+                   response_deserializer=None, _registered_method=False):
+    raise ValueError('gNMI has no unary-stream methods, %s can not be '
+                     'replayed' % _MethodName(method))
+
+  def stream_unary(self, method, request_serializer=None,
+                   response_deserializer=None, _registered_method=False):
+    raise ValueError('gNMI has no stream-unary methods, %s can not be '
+                     'replayed' % _MethodName(method))
+
+  def subscribe(self, callback, try_to_connect=False):
+    callback(grpc.ChannelConnectivity.READY)
+
+  def unsubscribe(self, callback):
+    pass
+
+  def close(self):
+    pass
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    return False
+
+
+def CreateReplayStub(player: Player = PLAYER,
+                     interceptors: Optional[Iterable[Any]] = None
+                    ) -> gnmi_pb2_grpc.gNMIStub:
+  """Creates a gNMI stub replaying the cassette loaded in player.
+
+  Args:
+    player: (Player) serves the recorded calls.
+    interceptors: (list) gRPC client interceptors installed on the channel.
+
+  Returns:
+    a gnmi_pb2_grpc object representing a gNMI Stub.
+  """
+  channel = ReplayChannel(player)
+  if interceptors:
+    channel = grpc.intercept_channel(channel, *interceptors)
+  return gnmi_pb2_grpc.gNMIStub(channel)
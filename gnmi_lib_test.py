@@ -0,0 +1,422 @@
+"""Unit tests for gnmi_lib that do not require a real gNMI target."""
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import fake_ap
+import gnmi_lib
+import gnmi_pb2
+import grpc
+
+
+_AP_PATH = '/access-points/access-point[hostname=ap-01.example.com]'
+_COUNTERS = 'ssids/ssid[name=Guest]/bssids/bssid[radio-id=0]/state/counters'
+
+
+def _Path(xpath):
+  return gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath))
+
+
+class PathTest(unittest.TestCase):
+
+  def testPathToXpathRoundTrip(self):
+    xpath = _AP_PATH + '/radios/radio[id=0]/config'
+    path = gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath))
+    self.assertEqual(gnmi_lib.PathToXpath(path), xpath)
+
+  def testPathToXpathEmpty(self):
+    self.assertEqual(gnmi_lib.PathToXpath(gnmi_pb2.Path()), '/')
+
+  def testJoinXpaths(self):
+    self.assertEqual(gnmi_lib.JoinXpaths('/a/b/', '/c'), '/a/b/c')
+    self.assertEqual(gnmi_lib.JoinXpaths('/', '/c'), '/c')
+    self.assertEqual(gnmi_lib.JoinXpaths('/a', '/'), '/a')
+
+  def testSplitXpath(self):
+    self.assertEqual(
+        gnmi_lib.SplitXpath(_AP_PATH + '/radios/radio[id=0]/config',
+                            _AP_PATH + '/'),
+        (_AP_PATH, '/radios/radio[id=0]/config'))
+    self.assertIsNone(gnmi_lib.SplitXpath(_AP_PATH + '/', _AP_PATH))
+    self.assertIsNone(gnmi_lib.SplitXpath('/joined-aps', _AP_PATH))
+
+
+class _RecordingStub(object):
+  """Stub that records the requests it is given instead of sending them."""
+
+  def __init__(self):
+    self.requests = []
+
+  def Get(self, request, metadata=None, timeout=None):
+    self.requests.append(request)
+    return gnmi_pb2.GetResponse()
+
+
+class GetTest(unittest.TestCase):
+
+  def testDefaultGetRequest(self):
+    stub = _RecordingStub()
+    gnmi_lib.Get(stub, gnmi_lib.ParsePath(['a']), '', '')
+    self.assertEqual(stub.requests[0].type, gnmi_pb2.GetRequest.ALL)
+    self.assertEqual(stub.requests[0].encoding, gnmi_pb2.JSON_IETF)
+
+  def testGetRequestFilters(self):
+    stub = _RecordingStub()
+    gnmi_lib.Get(stub, gnmi_lib.ParsePath(['config']), 'user', 'pass',
+                 data_type='CONFIG',
+                 use_models=gnmi_lib.ModelDataList(
+                     {'openconfig-access-points': '0.2.0'}),
+                 prefix=gnmi_lib.ParsePath(gnmi_lib.PathNames(_AP_PATH)))
+    request = stub.requests[0]
+    self.assertEqual(request.type, gnmi_pb2.GetRequest.CONFIG)
+    self.assertEqual(request.use_models[0].name, 'openconfig-access-points')
+    self.assertEqual(gnmi_lib.PathToXpath(request.prefix), _AP_PATH)
+
+  def testBatchedGetSharesPrefix(self):
+    stub = _RecordingStub()
+    gnmi_lib.Get(stub, [gnmi_lib.ParsePath(['radios']),
+                        gnmi_lib.ParsePath(['ssids'])], '', '',
+                 prefix=gnmi_lib.ParsePath(gnmi_lib.PathNames(_AP_PATH)))
+    self.assertEqual(len(stub.requests[0].path), 2)
+    self.assertEqual(gnmi_lib.PathToXpath(stub.requests[0].path[1]), '/ssids')
+
+
+class TypedValueTest(unittest.TestCase):
+
+  def testScalarTypedValues(self):
+    self.assertEqual(gnmi_lib.TypedValueFromPython(36).uint_val, 36)
+    self.assertEqual(gnmi_lib.TypedValueFromPython(-3).int_val, -3)
+    self.assertTrue(gnmi_lib.TypedValueFromPython(True).bool_val)
+    self.assertEqual(
+        gnmi_lib.TypedValueFromPython(True).WhichOneof('value'), 'bool_val')
+    self.assertEqual(gnmi_lib.TypedValueFromPython('x').string_val, 'x')
+    leaflist = gnmi_lib.TypedValueFromPython([1, 6]).leaflist_val
+    self.assertEqual([e.uint_val for e in leaflist.element], [1, 6])
+
+  def testJsonIetfTypedValue(self):
+    self.assertEqual(
+        gnmi_lib.TypedValueFromPython(36, 'JSON_IETF').json_ietf_val, b'36')
+
+
+class DecodeTypedValueTest(unittest.TestCase):
+
+  def testScalars(self):
+    decode = gnmi_lib.DecodeTypedValue
+    self.assertEqual(decode(gnmi_pb2.TypedValue(uint_val=44)), 44)
+    self.assertEqual(decode(gnmi_pb2.TypedValue(int_val=-1)), -1)
+    self.assertIs(decode(gnmi_pb2.TypedValue(bool_val=False)), False)
+    self.assertEqual(decode(gnmi_pb2.TypedValue(string_val='UP')), 'UP')
+    self.assertEqual(decode(gnmi_pb2.TypedValue(ascii_val='a')), 'a')
+    self.assertEqual(decode(gnmi_pb2.TypedValue(bytes_val=b'\x01')), b'\x01')
+    self.assertAlmostEqual(decode(gnmi_pb2.TypedValue(float_val=1.5)), 1.5)
+    self.assertIsNone(decode(gnmi_pb2.TypedValue()))
+
+  def testDecimal(self):
+    val = gnmi_pb2.TypedValue(
+        decimal_val=gnmi_pb2.Decimal64(digits=1234, precision=2))
+    self.assertEqual(str(gnmi_lib.DecodeTypedValue(val)), '12.34')
+
+  def testJsonAndLeafList(self):
+    decode = gnmi_lib.DecodeTypedValue
+    self.assertEqual(
+        decode(gnmi_pb2.TypedValue(json_ietf_val=b'{"channel": 36}')),
+        {'channel': 36})
+    self.assertEqual(decode(gnmi_pb2.TypedValue(json_val=b'[1, 2]')), [1, 2])
+    self.assertEqual(decode(gnmi_lib.TypedValueFromPython([1, 'a'])),
+                     [1, 'a'])
+
+
+def _JsonUpdate(notification, xpath, value):
+  notification.update.add(
+      path=gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath)),
+      val=gnmi_pb2.TypedValue(json_ietf_val=value))
+
+
+class AssembleNotificationsTest(unittest.TestCase):
+
+  def testSingleUpdate(self):
+    notification = gnmi_pb2.Notification()
+    _JsonUpdate(notification, _AP_PATH + '/radios/radio[id=0]/config',
+                b'{"openconfig-access-points:channel": 36}')
+    self.assertEqual(
+        gnmi_lib.AssembleNotifications(
+            [notification], _AP_PATH + '/radios/radio[id=0]/config'),
+        {'openconfig-access-points:channel': 36})
+
+  def testSplitAcrossNotificationsWithPrefix(self):
+    root = _AP_PATH + '/radios/radio[id=0]/state'
+    first = gnmi_pb2.Notification(
+        prefix=gnmi_lib.ParsePath(gnmi_lib.PathNames(_AP_PATH)))
+    _JsonUpdate(first, 'radios/radio[id=0]/state',
+                b'{"openconfig-access-points:channel": 36}')
+    second = gnmi_pb2.Notification(
+        prefix=gnmi_lib.ParsePath(gnmi_lib.PathNames(root)))
+    second.update.add(path=gnmi_lib.ParsePath(['enabled']),
+                      val=gnmi_pb2.TypedValue(bool_val=True))
+    _JsonUpdate(second, 'counters', b'{"failed-fcs-frames": 1}')
+    self.assertEqual(
+        gnmi_lib.AssembleNotifications([first, second], root),
+        {'openconfig-access-points:channel': 36, 'enabled': True,
+         'counters': {'failed-fcs-frames': 1}})
+
+  def testKeyedListsAndDeletes(self):
+    notification = gnmi_pb2.Notification()
+    _JsonUpdate(notification, _AP_PATH + '/radios',
+                b'{"radio": [{"id": 0, "config": {"channel": 36}}]}')
+    _JsonUpdate(notification, _AP_PATH + '/radios/radio[id=1]/config',
+                b'{"channel": 1}')
+    _JsonUpdate(notification, _AP_PATH + '/radios/radio[id=0]/config',
+                b'{"channel-width": 20}')
+    # Deletes in a notification apply before its updates, so use a later one.
+    deletion = gnmi_pb2.Notification()
+    deletion.delete.add().CopyFrom(gnmi_lib.ParsePath(
+        gnmi_lib.PathNames(_AP_PATH + '/radios/radio[id=1]')))
+    self.assertEqual(
+        gnmi_lib.AssembleNotifications([notification, deletion],
+                                       _AP_PATH + '/radios'),
+        {'radio': [{'id': 0, 'config': {'channel': 36, 'channel-width': 20}}]})
+
+  def testAncestorValueAndStrip(self):
+    notification = gnmi_pb2.Notification()
+    _JsonUpdate(notification, _AP_PATH,
+                b'{"openconfig-access-points:radios": {"radio": [{"id": 0, '
+                b'"state": {"operating-frequency": '
+                b'"openconfig-wifi-types:FREQ_5GHZ"}}]}}')
+    self.assertEqual(
+        gnmi_lib.AssembleNotifications(
+            [notification], _AP_PATH + '/radios/radio[id=0]/state',
+            strip=(b'openconfig-wifi-types:',)),
+        {'operating-frequency': 'FREQ_5GHZ'})
+
+  def testNothingReturned(self):
+    self.assertIsNone(gnmi_lib.AssembleNotifications([], _AP_PATH))
+
+
+class AliasTest(unittest.TestCase):
+
+  def _Notification(self, prefix_xpath, alias='', updates=()):
+    notification = gnmi_pb2.Notification(
+        prefix=gnmi_lib.ParsePath(gnmi_lib.PathNames(prefix_xpath)),
+        alias=alias)
+    for xpath, value in updates:
+      notification.update.add(
+          path=gnmi_lib.ParsePath(gnmi_lib.PathNames(xpath)),
+          val=gnmi_pb2.TypedValue(uint_val=value))
+    return notification
+
+  def testTargetDefinedAlias(self):
+    aliases = gnmi_lib.AliasTable()
+    counters = _AP_PATH + '/' + _COUNTERS
+    definition = self._Notification(counters, alias='#c0')
+    self.assertEqual(
+        list(gnmi_lib.DecodeNotification(definition, aliases)), [])
+    update = self._Notification('#c0', updates=[('tx-mcs', 7)])
+    decoded = list(gnmi_lib.DecodeNotification(update, aliases))
+    self.assertEqual(decoded[0][0], counters + '/tx-mcs')
+    self.assertEqual(decoded[0][1].uint_val, 7)
+
+  def testClientDefinedAlias(self):
+    aliases = gnmi_lib.AliasTable()
+    counters = _AP_PATH + '/' + _COUNTERS
+    alias_list = aliases.AliasList({'#c1': counters})
+    self.assertEqual(alias_list.alias[0].alias, '#c1')
+    update = self._Notification('#c1', updates=[('rx-mcs', 3)])
+    decoded = list(gnmi_lib.DecodeNotification(update, aliases))
+    self.assertEqual(decoded[0][0], counters + '/rx-mcs')
+
+  def testUndefinedAlias(self):
+    update = self._Notification('#missing', updates=[('tx-mcs', 7)])
+    with self.assertRaises(gnmi_lib.AliasError):
+      list(gnmi_lib.DecodeNotification(update, gnmi_lib.AliasTable()))
+
+  def testPrefixWithoutAliases(self):
+    update = self._Notification(_AP_PATH, updates=[('radios', 1)])
+    decoded = list(gnmi_lib.DecodeNotification(update))
+    self.assertEqual(decoded[0][0], _AP_PATH + '/radios')
+
+
+class _RpcError(grpc.RpcError):
+
+  def __init__(self, code, details=''):
+    super(_RpcError, self).__init__()
+    self._code = code
+    self._details = details
+
+  def code(self):
+    return self._code
+
+  def details(self):
+    return self._details
+
+
+class IsRetryableTest(unittest.TestCase):
+
+  def testFatalCodes(self):
+    self.assertFalse(gnmi_lib.IsRetryable(
+        _RpcError(grpc.StatusCode.UNAUTHENTICATED)))
+    self.assertFalse(gnmi_lib.IsRetryable(
+        _RpcError(grpc.StatusCode.INVALID_ARGUMENT)))
+    self.assertTrue(gnmi_lib.IsRetryable(
+        _RpcError(grpc.StatusCode.DEADLINE_EXCEEDED)))
+
+  def testCertificateMismatch(self):
+    self.assertFalse(gnmi_lib.IsRetryable(_RpcError(
+        grpc.StatusCode.UNAVAILABLE, 'failed to connect to all addresses; '
+        'Ssl handshake failed: SSL_ERROR_SSL: CERTIFICATE_VERIFY_FAILED')))
+    self.assertTrue(gnmi_lib.IsRetryable(_RpcError(
+        grpc.StatusCode.UNAVAILABLE, 'Connection refused')))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+  def setUp(self):
+    super(CircuitBreakerTest, self).setUp()
+    self.breaker = gnmi_lib.CircuitBreaker('ap:8080', threshold=2,
+                                           cooldown=60)
+    self.unavailable = _RpcError(grpc.StatusCode.UNAVAILABLE, 'refused')
+
+  def testOpensAfterConsecutiveTransportFailures(self):
+    self.breaker.Record(self.unavailable)
+    self.breaker.Record(_RpcError(grpc.StatusCode.NOT_FOUND))  # Answered.
+    self.breaker.Record(self.unavailable)
+    self.breaker.Check()
+    self.breaker.Record(self.unavailable)
+    self.assertTrue(self.breaker.IsOpen())
+    with self.assertRaises(gnmi_lib.CircuitOpenError):
+      self.breaker.Check()
+
+  def testTrialAfterCooldown(self):
+    with mock.patch.object(gnmi_lib.time, 'time', return_value=100.0):
+      self.breaker.Record(self.unavailable)
+      self.breaker.Record(self.unavailable)
+    with mock.patch.object(gnmi_lib.time, 'time', return_value=161.0):
+      self.breaker.Check()  # The trial RPC.
+      with self.assertRaises(gnmi_lib.CircuitOpenError):
+        self.breaker.Check()
+      self.breaker.Record(self.unavailable)  # The trial failed.
+      with self.assertRaises(gnmi_lib.CircuitOpenError):
+        self.breaker.Check()
+    with mock.patch.object(gnmi_lib.time, 'time', return_value=222.0):
+      self.breaker.Check()
+      self.breaker.Record()
+      self.assertFalse(self.breaker.IsOpen())
+
+
+class CassetteTest(unittest.TestCase):
+
+  def setUp(self):
+    super(CassetteTest, self).setUp()
+    self.path = os.path.join(tempfile.mkdtemp(), 'test.cassette')
+    self.faults = fake_ap.Faults()
+    server, port = fake_ap.Serve(fake_ap.FakeTarget([fake_ap.FakeAp(
+        'ap-01.example.com', 'mist', convergence_delay=0,
+        faults=self.faults)]))
+    self.addCleanup(server.stop, None)
+    self.recorder = gnmi_lib.Recorder()
+    self.stub = gnmi_lib.CreateStub(
+        None, 'localhost', str(port),
+        interceptors=[gnmi_lib.RecordingInterceptor(self.recorder)])
+    self.player = gnmi_lib.Player()
+    self.replay = gnmi_lib.CreateReplayStub(self.player)
+
+  def _Calls(self, stub):
+    """Makes some RPCs, returning their responses and error codes."""
+    outcomes = []
+    config = _AP_PATH + '/radios/radio[id=0]/config'
+    outcomes.append(gnmi_lib.SetLeaves(
+        stub, [(_Path(config + '/channel'), 36)], '', ''))
+    outcomes.append(gnmi_lib.Get(stub, _Path(config), '', ''))
+    try:
+      gnmi_lib.Get(stub, _Path(_AP_PATH + '/ssids'), '', '')
+    except grpc.RpcError as e:
+      outcomes.append(e.code())
+    outcomes.append(list(gnmi_lib.Subscribe(
+        stub, [_Path(config)], '', '', mode='ONCE', encoding='PROTO')))
+    outcomes.append(gnmi_lib.GetFuture(stub, _Path(config), '', '').result())
+    return outcomes
+
+  def _Record(self, calls=None):
+    self.recorder.Open(self.path)
+    try:
+      return (calls or self._Calls)(self.stub)
+    finally:
+      self.recorder.Close()
+
+  def testReplayServesRecordedResponses(self):
+    recorded = self._Record()
+    self.assertEqual(recorded[2], grpc.StatusCode.NOT_FOUND)
+    self.assertEqual(self.player.Load(self.path), 5)
+    self.assertEqual(self._Calls(self.replay), recorded)
+    with self.assertRaises(gnmi_lib.CassetteError):
+      gnmi_lib.Get(self.replay, _Path(_AP_PATH), '', '')
+
+  def testCredentialsAreNotRecorded(self):
+    self._Record(lambda stub: gnmi_lib.Get(
+        stub, _Path('/joined-aps'), 'admin', 's3cret'))
+    with open(self.path, 'rb') as f:
+      self.assertNotIn(b's3cret', f.read())
+
+  def testRealtimeReplay(self):
+    self.faults.rtt = 0.3
+    self._Record()
+    self.player.Load(self.path)
+    start = time.time()
+    self._Calls(self.replay)
+    self.assertLess(time.time() - start, 0.3)
+    self.player.realtime = True
+    self.player.Load(self.path)
+    start = time.time()
+    self._Calls(self.replay)
+    self.assertGreater(time.time() - start, 1.2)
+
+  def testReplayChannelOnlyServesGnmiMethods(self):
+    channel = gnmi_lib.ReplayChannel(self.player)
+    with self.assertRaisesRegex(ValueError, '/gnmi.gNMI/Stream'):
+      channel.unary_stream('/gnmi.gNMI/Stream')
+    with self.assertRaises(ValueError):
+      channel.stream_unary(b'/gnmi.gNMI/Stream')
+
+  def testCloseWaitsForCallsInFlight(self):
+    self.faults.rtt = 0.3
+    self.recorder.Open(self.path)
+    future = gnmi_lib.GetFuture(self.stub, _Path(_AP_PATH + '/hostname'), '',
+                                '')
+    self.recorder.Close()
+    self.assertTrue(future.done())
+    calls = gnmi_lib.ReadCassette(self.path)
+    self.assertEqual(len(calls), 1)
+    self.assertEqual(calls[0].code, grpc.StatusCode.OK)
+    self.assertEqual(len(calls[0].responses), 1)
+
+  def testCallOutlivingItsCassette(self):
+    self.faults.rtt = 0.5
+    self.recorder.Open(self.path)
+    future = gnmi_lib.GetFuture(self.stub, _Path(_AP_PATH + '/hostname'), '',
+                                '')
+    self.recorder.Close(timeout=0)
+    self.recorder.Open(self.path + '2')
+    future.result()
+    self.recorder.Close()
+    self.assertEqual(gnmi_lib.ReadCassette(self.path)[0].code,
+                     grpc.StatusCode.UNAVAILABLE)
+    self.assertEqual(gnmi_lib.ReadCassette(self.path + '2'), [])
+
+  def testTruncatedCassette(self):
+    self._Record()
+    with open(self.path, 'rb') as f:
+      data = f.read()
+    with open(self.path, 'wb') as f:
+      f.write(data[:-10])
+    calls = gnmi_lib.ReadCassette(self.path)
+    self.assertEqual(len(calls), 5)
+    self.assertEqual(calls[-1].code, grpc.StatusCode.UNAVAILABLE)
+    with open(self.path, 'wb') as f:
+      f.write(b'not a cassette')
+    with self.assertRaises(gnmi_lib.CassetteError):
+      self.player.Load(self.path)
+
+
+if __name__ == '__main__':
+  unittest.main()
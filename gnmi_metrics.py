@@ -0,0 +1,304 @@
+"""gRPC client interceptors recording metrics for gNMI RPCs.
+
+Every RPC made through a stub built by gnmi_lib.CreateStub is recorded per
+(vendor, target, method, container): a latency histogram, request and response
+size histograms, a count per status code and the number of retries (RPCs made
+in a Retry block).  Results are available in-process through
+REGISTRY.Snapshot() or as a text exposition (Prometheus format) through
+REGISTRY.WriteText().
+"""
+import bisect
+import collections
+import contextlib
+import contextvars
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Text, Tuple
+import grpc
+
+
+# Upper bounds of the histogram buckets, the last bucket is unbounded.
+LATENCY_BOUNDS = tuple(0.001 * 2 ** i for i in range(19))  # 1ms to ~262s.
+BYTES_BOUNDS = tuple(64 * 4 ** i for i in range(11))  # 64B to 64MB.
+
+_LABEL_NAMES = ('vendor', 'target', 'method', 'container')
+_LABELS = contextvars.ContextVar('gnmi_metrics_labels', default={})
+_RETRY = contextvars.ContextVar('gnmi_metrics_retry', default=False)
+
+
+@contextlib.contextmanager
+def Labels(**labels: Text) -> Iterator[None]:
+  """Attaches labels (eg. container='radios') to RPCs made in the block."""
+  token = _LABELS.set(dict(_LABELS.get(), **labels))
+  try:
+    yield
+  finally:
+    _LABELS.reset(token)
+
+
+def CurrentLabels() -> Dict[Text, Text]:
+  """Returns the labels attached by the enclosing Labels blocks."""
+  return _LABELS.get()
+
+
+@contextlib.contextmanager
+def Retry(retry: bool = True) -> Iterator[None]:
+  """Counts the RPCs made in the block as retries of a failed request.
+
+  Repeated requests are not retries by themselves, eg. polling state sends the
+  same Get on purpose; callers mark the RPCs they re-send after a failure.
+
+  Args:
+    retry: (bool) Whether the block retries, so callers can mark conditionally.
+  """
+  token = _RETRY.set(retry)
+  try:
+    yield
+  finally:
+    _RETRY.reset(token)
+
+
+class Histogram(object):
+  """A fixed-bucket streaming histogram with percentile estimates."""
+
+  def __init__(self, bounds: Sequence[float] = LATENCY_BOUNDS):
+    self.bounds = tuple(bounds)
+    self.counts = [0] * (len(self.bounds) + 1)
+    self.count = 0
+    self.sum = 0.0
+    self.min = None
+    self.max = None
+
+  def Observe(self, value: float) -> None:
+    """Adds a value to the histogram."""
+    self.counts[bisect.bisect_left(self.bounds, value)] += 1
+    self.count += 1
+    self.sum += value
+    if self.min is None or value < self.min:
+      self.min = value
+    if self.max is None or value > self.max:
+      self.max = value
+
+  def Percentile(self, q: float) -> Optional[float]:
+    """Estimates the q-th percentile (0-100), interpolating within a bucket."""
+    if not self.count:
+      return None
+    rank = q / 100.0 * self.count
+    seen = 0
+    for i, count in enumerate(self.counts):
+      if count and seen + count >= rank:
+        lower = self.bounds[i - 1] if i else 0.0
+        upper = self.bounds[i] if i < len(self.bounds) else self.max
+        lower, upper = max(lower, self.min), min(upper, self.max)
+        return lower + (upper - lower) * max(rank - seen, 0) / count
+      seen += count
+    return self.max
+
+  def Summary(self) -> Dict[Text, Any]:
+    """Returns count, sum, min, max and the 50/90/99th percentiles."""
+    return {'count': self.count, 'sum': self.sum, 'min': self.min,
+            'max': self.max, 'p50': self.Percentile(50),
+            'p90': self.Percentile(90), 'p99': self.Percentile(99)}
+
+
+class _RpcStats(object):
+  """Metrics of one (vendor, target, method, container) combination."""
+
+  def __init__(self):
+    self.latency = Histogram(LATENCY_BOUNDS)
+    self.request_bytes = Histogram(BYTES_BOUNDS)
+    self.response_bytes = Histogram(BYTES_BOUNDS)
+    self.codes = collections.Counter()
+    self.retries = 0
+
+
+class Registry(object):
+  """Thread-safe store of RPC metrics."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._stats = {}  # label tuple -> _RpcStats.
+
+  def Observe(self, labels: Tuple[Text, ...], latency: float,
+              request_bytes: int, response_bytes: int,
+              code: grpc.StatusCode, retry: bool = False) -> None:
+    """Records one completed RPC.
+
+    Args:
+      labels: (tuple) vendor, target, method and container of the RPC.
+      latency: (float) seconds from sending the request to its completion.
+      request_bytes: (int) serialized size of the request(s).
+      response_bytes: (int) serialized size of the response(s).
+      code: (grpc.StatusCode) final status of the RPC.
+      retry: (bool) Whether the RPC retried a failed request, see Retry.
+    """
+    with self._lock:
+      stats = self._stats.get(labels)
+      if stats is None:
+        stats = self._stats[labels] = _RpcStats()
+      stats.latency.Observe(latency)
+      stats.request_bytes.Observe(request_bytes)
+      stats.response_bytes.Observe(response_bytes)
+      stats.codes[code.name] += 1
+      if retry:
+        stats.retries += 1
+
+  def Reset(self) -> None:
+    """Drops every recorded metric."""
+    with self._lock:
+      self._stats.clear()
+
+  def Snapshot(self) -> List[Dict[Text, Any]]:
+    """Returns the recorded metrics, one dict per label combination."""
+    with self._lock:
+      return [dict(zip(_LABEL_NAMES, labels),
+                   latency=stats.latency.Summary(),
+                   request_bytes=stats.request_bytes.Summary(),
+                   response_bytes=stats.response_bytes.Summary(),
+                   codes=dict(stats.codes), retries=stats.retries)
+              for labels, stats in sorted(self._stats.items())]
+
+  def TextExposition(self) -> Text:
+    """Returns the metrics in the Prometheus text exposition format."""
+    lines = []
+    with self._lock:
+      items = sorted(self._stats.items())
+      for name, attr in (('gnmi_rpc_latency_seconds', 'latency'),
+                         ('gnmi_rpc_request_bytes', 'request_bytes'),
+                         ('gnmi_rpc_response_bytes', 'response_bytes')):
+        lines.append('# TYPE %s histogram' % name)
+        for labels, stats in items:
+          lines.extend(_HistogramLines(name, labels, getattr(stats, attr)))
+      lines.append('# TYPE gnmi_rpc_total counter')
+      for labels, stats in items:
+        for code, count in sorted(stats.codes.items()):
+          lines.append('gnmi_rpc_total{%s,code="%s"} %d' % (
+              _FormatLabels(labels), code, count))
+      lines.append('# TYPE gnmi_rpc_retries_total counter')
+      for labels, stats in items:
+        lines.append('gnmi_rpc_retries_total{%s} %d' % (
+            _FormatLabels(labels), stats.retries))
+    return '\n'.join(lines) + '\n'
+
+  def WriteText(self, path: Text) -> None:
+    """Atomically writes the text exposition to a file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('wt', dir=directory, delete=False) as f:
+      f.write(self.TextExposition())
+    os.replace(f.name, path)
+
+
+def _FormatLabels(labels: Tuple[Text, ...]) -> Text:
+  return ','.join('%s="%s"' % (name, value.replace('"', '\\"'))
+                  for name, value in zip(_LABEL_NAMES, labels))
+
+
+def _HistogramLines(name: Text, labels: Tuple[Text, ...],
+                    histogram: Histogram) -> List[Text]:
+  """Returns the exposition lines of one histogram."""
+  label_str = _FormatLabels(labels)
+  lines = []
+  cumulative = 0
+  for bound, count in zip(histogram.bounds + (float('inf'),),
+                          histogram.counts):
+    cumulative += count
+    lines.append('%s_bucket{%s,le="%s"} %d' % (
+        name, label_str, '+Inf' if bound == float('inf') else '%g' % bound,
+        cumulative))
+  lines.append('%s_sum{%s} %g' % (name, label_str, histogram.sum))
+  lines.append('%s_count{%s} %d' % (name, label_str, histogram.count))
+  return lines
+
+
+REGISTRY = Registry()
+
+
+class _StreamCall(object):
+  """Wraps a streaming call, counting responses until the stream ends."""
+
+  def __init__(self, call, on_done):
+    self._call = call
+    self._on_done = on_done
+    self._bytes = 0
+    self._done = False
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    try:
+      response = next(self._call)
+    except StopIteration:
+      self._Finish(grpc.StatusCode.OK)
+      raise
+    except grpc.RpcError as e:
+      self._Finish(e.code())
+      raise
+    self._bytes += response.ByteSize()
+    return response
+
+  def _Finish(self, code):
+    if not self._done:
+      self._done = True
+      self._on_done(self._bytes, code)
+
+  def __getattr__(self, name):
+    return getattr(self._call, name)
+
+
+class MetricsInterceptor(grpc.UnaryUnaryClientInterceptor,
+                         grpc.StreamStreamClientInterceptor):
+  """Records latency, sizes, status codes and retries of every RPC."""
+
+  def __init__(self, vendor: Text = '', target: Text = '',
+               registry: Registry = REGISTRY):
+    self.vendor = vendor
+    self.target = target
+    self.registry = registry
+
+  def _Labels(self, client_call_details) -> Tuple[Text, ...]:
+    method = client_call_details.method
+    if isinstance(method, bytes):
+      method = method.decode('utf8')
+    return (self.vendor, self.target, method.rsplit('/', 1)[-1],
+            CurrentLabels().get('container', ''))
+
+  def intercept_unary_unary(self, continuation, client_call_details, request):
+    labels = self._Labels(client_call_details)
+    retry = _RETRY.get()
+    request_bytes = request.ByteSize()
+    start = time.time()
+    call = continuation(client_call_details, request)
+
+    def _Done(future):
+      code = future.code() or grpc.StatusCode.OK
+      response_bytes = 0
+      if code == grpc.StatusCode.OK:
+        response_bytes = future.result().ByteSize()
+      self.registry.Observe(labels, time.time() - start, request_bytes,
+                            response_bytes, code, retry)
+
+    call.add_done_callback(_Done)
+    return call
+
+  def intercept_stream_stream(self, continuation, client_call_details,
+                              request_iterator):
+    labels = self._Labels(client_call_details)
+    retry = _RETRY.get()
+    sent = [0]
+
+    def _Requests():
+      for request in request_iterator:
+        sent[0] += request.ByteSize()
+        yield request
+
+    start = time.time()
+    call = continuation(client_call_details, _Requests())
+
+    def _Done(received, code):
+      self.registry.Observe(labels, time.time() - start, sent[0], received,
+                            code, retry)
+
+    return _StreamCall(call, _Done)
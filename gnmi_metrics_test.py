@@ -0,0 +1,109 @@
+"""Unit tests for gnmi_metrics, using an in-process gNMI server."""
+from concurrent import futures
+import threading
+import unittest
+
+import gnmi_lib
+import gnmi_metrics
+import gnmi_pb2
+import gnmi_pb2_grpc
+import grpc
+
+
+class _Servicer(gnmi_pb2_grpc.gNMIServicer):
+  """Answers Get with one notification and fails Set."""
+
+  def Get(self, request, context):
+    response = gnmi_pb2.GetResponse()
+    response.notification.add(timestamp=1)
+    return response
+
+  def Set(self, request, context):
+    context.abort(grpc.StatusCode.UNIMPLEMENTED, 'no Set here')
+
+  def Subscribe(self, request_iterator, context):
+    for _ in request_iterator:
+      yield gnmi_pb2.SubscribeResponse(sync_response=True)
+
+
+class HistogramTest(unittest.TestCase):
+
+  def testPercentiles(self):
+    histogram = gnmi_metrics.Histogram((1, 2, 4, 8))
+    for value in range(1, 9):
+      histogram.Observe(value)
+    self.assertEqual(histogram.count, 8)
+    self.assertEqual(histogram.Percentile(100), 8)
+    self.assertLessEqual(histogram.Percentile(50), 4)
+    self.assertGreaterEqual(histogram.Percentile(50), 2)
+    self.assertIsNone(gnmi_metrics.Histogram().Percentile(50))
+
+
+class InterceptorTest(unittest.TestCase):
+
+  def setUp(self):
+    super(InterceptorTest, self).setUp()
+    self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    gnmi_pb2_grpc.add_gNMIServicer_to_server(_Servicer(), self.server)
+    port = self.server.add_insecure_port('localhost:0')
+    self.server.start()
+    self.registry = gnmi_metrics.Registry()
+    channel = grpc.intercept_channel(
+        grpc.insecure_channel('localhost:%d' % port),
+        gnmi_metrics.MetricsInterceptor('fake', 'localhost', self.registry))
+    self.stub = gnmi_pb2_grpc.gNMIStub(channel)
+
+  def tearDown(self):
+    self.server.stop(None)
+    super(InterceptorTest, self).tearDown()
+
+  def testUnaryMetrics(self):
+    path = gnmi_lib.ParsePath(['radios'])
+    with gnmi_metrics.Labels(container='radios'):
+      gnmi_lib.Get(self.stub, path, '', '')
+      gnmi_lib.Get(self.stub, path, '', '')  # A poll, not a retry.
+      with gnmi_metrics.Retry():
+        gnmi_lib.Get(self.stub, path, '', '')
+      with self.assertRaises(grpc.RpcError):
+        gnmi_lib.Set(self.stub, path, 'u', 'p', {'a': 1}, 'update')
+    snapshot = {s['method']: s for s in self.registry.Snapshot()}
+    self.assertEqual(snapshot['Get']['container'], 'radios')
+    self.assertEqual(snapshot['Get']['latency']['count'], 3)
+    self.assertEqual(snapshot['Get']['codes'], {'OK': 3})
+    self.assertEqual(snapshot['Get']['retries'], 1)
+    self.assertEqual(snapshot['Get']['request_bytes']['max'],
+                     gnmi_pb2.GetRequest(path=[path],
+                                         encoding=gnmi_pb2.JSON_IETF).ByteSize())
+    self.assertGreater(snapshot['Get']['response_bytes']['max'], 0)
+    self.assertEqual(snapshot['Set']['codes'], {'UNIMPLEMENTED': 1})
+    text = self.registry.TextExposition()
+    self.assertIn('gnmi_rpc_total{vendor="fake",target="localhost",'
+                  'method="Get",container="radios",code="OK"} 3', text)
+    self.assertIn('gnmi_rpc_retries_total{vendor="fake",target="localhost",'
+                  'method="Get",container="radios"} 1', text)
+
+  def testFutureMetrics(self):
+    future = gnmi_lib.GetFuture(self.stub, gnmi_lib.ParsePath(['radios']),
+                                '', '', data_type='STATE')
+    self.assertEqual(future.result().notification[0].timestamp, 1)
+    # Done callbacks run in order, so the interceptor's has run once ours has.
+    done = threading.Event()
+    future.add_done_callback(lambda _: done.set())
+    self.assertTrue(done.wait(5))
+    snapshot = self.registry.Snapshot()
+    self.assertEqual(snapshot[0]['method'], 'Get')
+    self.assertEqual(snapshot[0]['codes'], {'OK': 1})
+
+  def testStreamMetrics(self):
+    responses = gnmi_lib.Subscribe(
+        self.stub, [gnmi_lib.ParsePath(['radios'])], '', '', mode='ONCE')
+    self.assertTrue(next(responses).sync_response)
+    self.assertEqual(list(responses), [])
+    snapshot = self.registry.Snapshot()
+    self.assertEqual(snapshot[0]['method'], 'Subscribe')
+    self.assertEqual(snapshot[0]['codes'], {'OK': 1})
+    self.assertGreater(snapshot[0]['request_bytes']['max'], 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
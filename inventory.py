@@ -0,0 +1,262 @@
+"""Loads the APs under test from an inventory file.
+
+An inventory lists one record per AP: its hostname and vendor, the name of
+its credentials (see chido._GetUserPass), its gNMI endpoints and the joined-ap
+attributes it is expected to report (mac, model, serial, opstate...).  Records
+use __slots__ and share their repeated strings (vendor, model, opstate), so
+an inventory of thousands of APs stays small, and each file is parsed once per
+process.
+
+Inventories are JSON or YAML (a list of records, or a mapping with an
+"access_points" list) or CSV (a header row naming the fields), eg.:
+
+  [{"hostname": "ap-02-102.example.com", "vendor": "arista",
+    "targetip": "100.77.250.242", "mac": "30:86:2D:25:26:27",
+    "model": "C-130", "serial": "12330862D25E"}]
+
+  hostname,vendor,credentials,targetip,mac,model
+  ap-02-100.example.com,mist,mist,100.66.236.21,5C:5B:35:01:02:03,AP41
+"""
+import collections
+import csv
+import json
+import os
+import sys
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Text
+
+import constants
+
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'inventory.json')
+FIELDS = ('hostname', 'vendor', 'credentials', 'targetip', 'targetipv6',
+          'targetport', 'mac', 'model', 'serial', 'firmware', 'opstate',
+          'power_source')
+_REQUIRED = ('hostname', 'vendor')
+_DEFAULTS = {'opstate': 'UP', 'power_source': 'AT'}
+# Values repeated across a fleet, stored once.
+_INTERNED = ('vendor', 'credentials', 'model', 'firmware', 'opstate',
+             'power_source', 'targetport')
+
+
+class Error(Exception):
+  """Module-level Exception class."""
+
+
+class InventoryError(Error):
+  """Raised when an inventory can not be read or has invalid records."""
+
+
+class ApRecord(object):
+  """An AP of the inventory, its fields are strings or None if not set."""
+  __slots__ = FIELDS
+
+  def __init__(self, **fields: Any):
+    for name in FIELDS:
+      value = fields.get(name)
+      if value is None or value == '':
+        value = None
+      else:  # Eg. a port read from YAML, or a binding's leaf.
+        value = str(value)
+        if name in _INTERNED:
+          value = sys.intern(value)
+      setattr(self, name, value)
+
+  def __repr__(self):
+    return 'ApRecord(%s, %s)' % (self.hostname, self.vendor)
+
+  def AsDict(self) -> Dict[Text, Any]:
+    """Returns the fields of the record."""
+    return {name: getattr(self, name) for name in FIELDS}
+
+
+class Inventory(object):
+  """The APs of an inventory file, in file order."""
+
+  def __init__(self, records: Iterable[ApRecord], path: Optional[Text] = None):
+    """Initializes an Inventory.
+
+    Args:
+      records: (list) ApRecords, with unique hostnames.
+      path: (str) file the records were read from, for error messages.
+
+    Raises:
+      InventoryError: two records have the same hostname.
+    """
+    self.path = path
+    self.records = list(records)
+    self._by_hostname = {}
+    self._by_vendor = collections.defaultdict(list)
+    for record in self.records:
+      if record.hostname in self._by_hostname:
+        raise InventoryError('AP %s is listed twice in %s' % (
+            record.hostname, path or 'the inventory'))
+      self._by_hostname[record.hostname] = record
+      self._by_vendor[record.vendor].append(record)
+
+  def __len__(self):
+    return len(self.records)
+
+  def __iter__(self) -> Iterator[ApRecord]:
+    return iter(self.records)
+
+  def Get(self, hostname: Text) -> Optional[ApRecord]:
+    """Returns the record of an AP, None if it is not in the inventory."""
+    return self._by_hostname.get(hostname)
+
+  def ByVendor(self, vendor: Text) -> List[ApRecord]:
+    """Returns the records of a vendor's APs, in file order."""
+    return list(self._by_vendor.get(vendor, ()))
+
+  def Write(self, path: Text) -> None:
+    """Atomically writes the inventory to a .json or .csv file.
+
+    Raises:
+      InventoryError: path has another extension.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in ('.json', '.csv'):
+      raise InventoryError('Unable to write a %s inventory: %s' % (
+          extension, path))
+    rows = [{name: value for name, value in record.AsDict().items()
+             if value is not None} for record in self.records]
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('wt', dir=directory, newline='',
+                                     delete=False) as f:
+      if extension == '.json':
+        json.dump({'access_points': rows}, f, indent=2)
+      else:
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(f.name, path)
+
+
+def Record(fields: Mapping[Text, Any], source: Text = '') -> ApRecord:
+  """Returns the ApRecord of a dict of fields, after validating them.
+
+  Fields that are not set get their default (eg. opstate UP), so records read
+  from a file need not list them.
+
+  Args:
+    fields: (dict) field names to values, see FIELDS.
+    source: (str) where the fields come from, for error messages.
+
+  Raises:
+    InventoryError: fields is not a mapping, a field is unknown, a required
+      one is missing or the vendor is not supported.
+  """
+  if not isinstance(fields, Mapping):
+    raise InventoryError('%s is not a mapping of fields' % source)
+  unknown = sorted(str(name) for name in set(fields) - set(FIELDS))
+  if unknown:
+    raise InventoryError('Unknown fields %s in %s' % (
+        ', '.join(unknown), source))
+  missing = [name for name in _REQUIRED if not fields.get(name)]
+  if missing:
+    raise InventoryError('Missing %s in %s' % (', '.join(missing), source))
+  if fields['vendor'] not in constants.GNMI_TARGETPORTS:
+    raise InventoryError('Unsupported vendor %s in %s' % (
+        fields['vendor'], source))
+  return ApRecord(**dict(_DEFAULTS, **{
+      name: value for name, value in fields.items()
+      if value is not None and value != ''}))
+
+
+# YAML types plain scalars are not resolved to, see _ReadYaml.
+_YAML_TYPES = ('bool', 'int', 'float', 'timestamp')
+
+
+def _ReadJson(f) -> Any:
+  return json.load(f)
+
+
+def _ReadYaml(f) -> Any:
+  """Reads YAML, with every scalar but null as a string.
+
+  YAML 1.1 would make an unquoted MAC of digits a base 60 integer and a serial
+  with a leading 0 an octal one.
+  """
+  try:
+    import yaml  # pip install pyyaml
+  except ImportError:
+    raise InventoryError('YAML inventories need PyYAML: pip install pyyaml')
+
+  class _StringLoader(yaml.SafeLoader):
+    pass
+
+  _StringLoader.yaml_implicit_resolvers = {
+      first: [(tag, regexp) for tag, regexp in resolvers
+              if tag.rsplit(':', 1)[-1] not in _YAML_TYPES]
+      for first, resolvers in yaml.SafeLoader.yaml_implicit_resolvers.items()}
+  try:
+    return yaml.load(f, Loader=_StringLoader)
+  except yaml.YAMLError as e:
+    raise InventoryError('Unable to read inventory %s: %s' % (f.name, e))
+
+
+def _ReadCsv(f) -> Any:
+  """Reads CSV rows, the header row naming the fields."""
+  reader = csv.DictReader(f)
+  rows = []
+  try:
+    for row in reader:
+      if None in row:  # DictReader's key of the values past the header.
+        raise InventoryError('%s line %d has %d extra value(s)' % (
+            f.name, reader.line_num, len(row[None])))
+      rows.append(row)
+  except csv.Error as e:
+    raise InventoryError('Unable to read inventory %s: %s' % (f.name, e))
+  return rows
+
+
+_READERS = {'.json': _ReadJson, '.yaml': _ReadYaml, '.yml': _ReadYaml,
+            '.csv': _ReadCsv}
+
+
+def Load(path: Text) -> Inventory:
+  """Reads an inventory file, picking the format from its extension.
+
+  Args:
+    path: (str) a .json, .yaml, .yml or .csv inventory.
+
+  Returns:
+    the Inventory.
+
+  Raises:
+    InventoryError: the file can not be read, or has invalid records.
+  """
+  reader = _READERS.get(os.path.splitext(path)[1].lower())
+  if reader is None:
+    raise InventoryError('Unknown inventory format: %s' % path)
+  try:
+    with open(path, 'rt', newline='') as f:
+      data = reader(f)
+  except (OSError, ValueError) as e:
+    raise InventoryError('Unable to read inventory %s: %s' % (path, e))
+  if isinstance(data, dict):
+    data = data.get('access_points')
+  if not isinstance(data, list):
+    raise InventoryError('Inventory %s has no list of access points' % path)
+  return Inventory((Record(fields, '%s record %d' % (path, i))
+                    for i, fields in enumerate(data, 1)), path)
+
+
+_CACHE = {}  # Absolute path -> Inventory.
+_CACHE_LOCK = threading.Lock()
+
+
+def Cached(path: Optional[Text] = None) -> Inventory:
+  """Returns the inventory at path, reading it only the first time.
+
+  Args:
+    path: (str) inventory file, defaults to CHIDO_INVENTORY or DEFAULT_PATH.
+  """
+  path = os.path.abspath(path or os.environ.get('CHIDO_INVENTORY') or
+                         DEFAULT_PATH)
+  with _CACHE_LOCK:
+    if path not in _CACHE:
+      _CACHE[path] = Load(path)
+    return _CACHE[path]
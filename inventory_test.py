@@ -0,0 +1,152 @@
+"""Unit tests for the AP inventory loader."""
+import csv
+import json
+import os
+import tempfile
+import unittest
+
+import inventory
+
+
+_RECORDS = [
+    {'hostname': 'ap-02-102.example.com', 'vendor': 'arista',
+     'targetip': '100.77.250.242', 'mac': '30:86:2D:25:26:27',
+     'model': 'C-130', 'serial': '12330862D25E'},
+    {'hostname': 'ap-02-100.example.com', 'vendor': 'mist',
+     'credentials': 'mist', 'mac': '5C:5B:35:01:02:03', 'model': 'AP41'},
+]
+
+
+class InventoryTest(unittest.TestCase):
+
+  def setUp(self):
+    super(InventoryTest, self).setUp()
+    self.directory = tempfile.mkdtemp()
+
+  def _Write(self, name, text):
+    path = os.path.join(self.directory, name)
+    with open(path, 'wt') as f:
+      f.write(text)
+    return path
+
+  def _Check(self, aps):
+    self.assertEqual(len(aps), 2)
+    arista = aps.Get('ap-02-102.example.com')
+    self.assertEqual(arista.vendor, 'arista')
+    self.assertEqual(arista.serial, '12330862D25E')
+    self.assertEqual(arista.opstate, 'UP')  # Default.
+    self.assertIsNone(arista.credentials)
+    self.assertEqual([ap.hostname for ap in aps.ByVendor('mist')],
+                     ['ap-02-100.example.com'])
+    self.assertEqual(aps.ByVendor('aruba'), [])
+
+  def testJson(self):
+    self._Check(inventory.Load(self._Write(
+        'aps.json', json.dumps({'access_points': _RECORDS}))))
+
+  def testYaml(self):
+    self._Check(inventory.Load(self._Write('aps.yaml', '''
+- hostname: ap-02-102.example.com
+  vendor: arista
+  targetip: 100.77.250.242
+  mac: 30:86:2D:25:26:27
+  model: C-130
+  serial: 12330862D25E
+- {hostname: ap-02-100.example.com, vendor: mist, credentials: mist}
+''')))
+
+  def testYamlScalarsAreStrings(self):
+    aps = inventory.Load(self._Write('aps.yaml', '''
+- hostname: ap-02-102.example.com
+  vendor: arista
+  mac: 00:11:22:33:44:55
+  serial: 0123
+  targetip: 10.0.0.1
+  targetport: 6030
+  firmware: 8.8
+  opstate: ~
+'''))
+    arista = aps.Get('ap-02-102.example.com')
+    self.assertEqual(arista.mac, '00:11:22:33:44:55')
+    self.assertEqual(arista.serial, '0123')
+    self.assertEqual(arista.targetport, '6030')
+    self.assertEqual(arista.firmware, '8.8')
+    self.assertEqual(arista.opstate, 'UP')  # Null is not set.
+
+  def testDefaultsOnlyApplyToInventoryFiles(self):
+    fields = {'hostname': 'ap-1', 'vendor': 'mist', 'opstate': ''}
+    self.assertEqual(inventory.Record(fields).opstate, 'UP')
+    self.assertEqual(inventory.Record(fields).power_source, 'AT')
+    self.assertIsNone(inventory.ApRecord(**fields).opstate)
+
+  def testCsv(self):
+    self._Check(inventory.Load(self._Write('aps.csv', '\n'.join([
+        'hostname,vendor,credentials,targetip,mac,model,serial',
+        'ap-02-102.example.com,arista,,100.77.250.242,30:86:2D:25:26:27,'
+        'C-130,12330862D25E',
+        'ap-02-100.example.com,mist,mist,,5C:5B:35:01:02:03,AP41,']))))
+
+  def testWrite(self):
+    aps = inventory.Load(self._Write('aps.json', json.dumps(_RECORDS)))
+    for name in ('out.json', 'out.csv'):
+      path = os.path.join(self.directory, name)
+      aps.Write(path)
+      self._Check(inventory.Load(path))
+    with self.assertRaises(inventory.InventoryError):
+      aps.Write(os.path.join(self.directory, 'out.yaml'))
+
+  def testInvalidInventories(self):
+    cases = {
+        'unknown.json': [dict(_RECORDS[0], color='blue')],
+        'missing.json': [{'hostname': 'ap-1'}],
+        'vendor.json': [{'hostname': 'ap-1', 'vendor': 'acme'}],
+        'twice.json': [_RECORDS[0], _RECORDS[0]],
+        'empty.json': {'routers': []},
+        'scalar.json': ['ap1'],
+        'list.json': [['ap1', 'arista']],
+    }
+    for name, data in cases.items():
+      with self.subTest(name=name):
+        with self.assertRaises(inventory.InventoryError):
+          inventory.Load(self._Write(name, json.dumps(data)))
+    for path in (self._Write('aps.txt', ''), self._Write('bad.json', '[{'),
+                 os.path.join(self.directory, 'missing.csv'),
+                 self._Write('bad.yaml', '[{hostname: ap1'),
+                 self._Write('scalar.yaml', '- ap1\n- [ap2, arista]\n'),
+                 self._Write('extra.csv', 'hostname,vendor\nap1,arista,x\n'),
+                 self._Write('huge.csv', 'hostname,vendor\nap1,"%s"\n' % (
+                     'x' * (csv.field_size_limit() + 1)))):
+      with self.subTest(path=os.path.basename(path)):
+        with self.assertRaises(inventory.InventoryError):
+          inventory.Load(path)
+    with self.assertRaisesRegex(inventory.InventoryError,
+                                'line 2 has 1 extra value'):
+      inventory.Load(os.path.join(self.directory, 'extra.csv'))
+    with self.assertRaisesRegex(inventory.InventoryError,
+                                'record 1 is not a mapping'):
+      inventory.Load(os.path.join(self.directory, 'scalar.yaml'))
+
+  def testFleetRecordsAreCompact(self):
+    rows = ['hostname,vendor,model,serial']
+    rows.extend('ap-%05d.example.com,mist,AP41,%d' % (i, i)
+                for i in range(5000))
+    aps = inventory.Load(self._Write('fleet.csv', '\n'.join(rows)))
+    self.assertEqual(len(aps), 5000)
+    first, last = aps.records[0], aps.records[-1]
+    self.assertFalse(hasattr(first, '__dict__'))
+    self.assertIs(first.model, last.model)
+
+  def testCached(self):
+    path = self._Write('aps.json', json.dumps(_RECORDS))
+    aps = inventory.Cached(path)
+    os.remove(path)
+    self.assertIs(inventory.Cached(path), aps)
+
+  def testDefaultInventory(self):
+    aps = inventory.Load(inventory.DEFAULT_PATH)
+    self.assertEqual(sorted({ap.vendor for ap in aps}),
+                     ['arista', 'aruba', 'mist'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,208 @@
+"""Nested timing spans of chido operations, exported as JSON.
+
+A span times a block: its wall time, the CPU time of its thread, its parent
+and attributes such as the AP, vendor, container and attempt.  Spans nest per
+thread, so a Set-then-verify shows its path building, stub acquisition,
+serialization, RPCs, decoding, binding loads, comparisons and retry sleeps,
+and wall time not spent on CPU in an RPC span is time on the network.
+
+Only a sample of the top-level spans (traces) is kept, with all their
+children; spans of unsampled traces cost one attribute lookup.  Finished
+spans are written as JSON lines, one object per span, or as a Chrome trace
+(chrome://tracing, Perfetto).  Set CHIDO_TRACE_FILE to trace chido_test, and
+CHIDO_TRACE_SAMPLE to the fraction of traces to keep.
+"""
+import collections
+import contextlib
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Text
+
+_MAX_SPANS = 1000000  # Spans kept per run, later ones are counted only.
+
+
+class _Span(object):
+  """One timed block."""
+
+  __slots__ = ('name', 'span_id', 'trace_id', 'parent_id', 'thread',
+               'attributes', 'start', 'end', 'cpu_start', 'cpu')
+
+  def __init__(self, name: Text, span_id: int, trace_id: int,
+               parent_id: Optional[int], attributes: Dict[Text, Any]):
+    self.name = name
+    self.span_id = span_id
+    self.trace_id = trace_id
+    self.parent_id = parent_id
+    self.thread = threading.get_ident()
+    self.attributes = attributes
+    self.start = time.time()
+    self.cpu_start = time.thread_time()
+    self.end = None
+    self.cpu = None
+
+  def Dict(self) -> Dict[Text, Any]:
+    """Returns the span as a JSON-serializable dict, times in seconds."""
+    return {'name': self.name, 'span_id': self.span_id,
+            'trace_id': self.trace_id, 'parent_id': self.parent_id,
+            'thread': self.thread, 'start': self.start,
+            'duration': self.end - self.start, 'cpu': self.cpu,
+            'attributes': self.attributes}
+
+
+class Tracer(object):
+  """Records the spans of sampled traces, thread-safe."""
+
+  def __init__(self, enabled: bool = True, sample_rate: float = 1.0,
+               rng: Optional[random.Random] = None,
+               max_spans: int = _MAX_SPANS):
+    """Initializes a Tracer.
+
+    Args:
+      enabled: (bool) Whether to record anything.
+      sample_rate: (float) fraction of traces recorded, between 0 and 1.
+      rng: (random.Random) source of the sampling decisions.
+      max_spans: (int) spans kept, later ones are only counted as dropped.
+    """
+    self.enabled = enabled
+    self.sample_rate = sample_rate
+    self.max_spans = max_spans
+    self.dropped = 0
+    self._rng = rng or random.Random()
+    self._ids = itertools.count(1)
+    self._local = threading.local()
+    self._lock = threading.Lock()
+    self._spans = []
+
+  def _Stack(self) -> List[Optional[_Span]]:
+    stack = getattr(self._local, 'stack', None)
+    if stack is None:
+      stack = self._local.stack = []
+    return stack
+
+  @contextlib.contextmanager
+  def Span(self, name: Text, **attributes: Any) -> Iterator[None]:
+    """Times the block as a span, a child of the thread's current span.
+
+    Attributes of the enclosing spans are inherited unless given here.
+
+    Args:
+      name: (str) the phase or operation, eg. 'rpc:Get' or 'binding load'.
+      **attributes: JSON-serializable values describing the span.
+    """
+    if not self.enabled:
+      yield
+      return
+    stack = self._Stack()
+    parent = stack[-1] if stack else None
+    if stack and parent is None:  # Inside a trace that was not sampled.
+      yield
+      return
+    if parent is None and self._rng.random() >= self.sample_rate:
+      stack.append(None)
+      try:
+        yield
+      finally:
+        stack.pop()
+      return
+    if parent is not None:
+      attributes = dict(parent.attributes, **attributes)
+    span = _Span(name, next(self._ids),
+                 parent.trace_id if parent else None,
+                 parent.span_id if parent else None, attributes)
+    if span.trace_id is None:
+      span.trace_id = span.span_id
+    stack.append(span)
+    try:
+      yield
+    finally:
+      stack.pop()
+      span.end = time.time()
+      span.cpu = time.thread_time() - span.cpu_start
+      with self._lock:
+        if len(self._spans) < self.max_spans:
+          self._spans.append(span)
+        else:
+          self.dropped += 1
+
+  def Annotate(self, **attributes: Any) -> None:
+    """Adds attributes to the thread's current span, if it is recorded."""
+    stack = getattr(self._local, 'stack', None)
+    if stack and stack[-1] is not None:
+      stack[-1].attributes.update(attributes)
+
+  def Spans(self) -> List[Dict[Text, Any]]:
+    """Returns the finished spans, in the order they finished."""
+    with self._lock:
+      return [span.Dict() for span in self._spans]
+
+  def Reset(self) -> None:
+    """Drops every finished span."""
+    with self._lock:
+      self._spans = []
+      self.dropped = 0
+
+  def Summary(self) -> Dict[Text, Dict[Text, float]]:
+    """Returns the count, wall and CPU seconds of the spans, per name."""
+    summary = collections.OrderedDict()
+    for span in self.Spans():
+      entry = summary.setdefault(span['name'],
+                                 {'count': 0, 'wall': 0.0, 'cpu': 0.0})
+      entry['count'] += 1
+      entry['wall'] += span['duration']
+      entry['cpu'] += span['cpu']
+    return summary
+
+  def Table(self) -> Text:
+    """Returns the summary as a text table, slowest phases first."""
+    lines = ['%-32s %7s %9s %9s %9s' % ('span', 'count', 'wall s', 'cpu s',
+                                        'wait s')]
+    for name, entry in sorted(self.Summary().items(),
+                              key=lambda item: -item[1]['wall']):
+      lines.append('%-32s %7d %9.3f %9.3f %9.3f' % (
+          name, entry['count'], entry['wall'], entry['cpu'],
+          max(entry['wall'] - entry['cpu'], 0.0)))
+    return '\n'.join(lines) + '\n'
+
+  def ChromeTrace(self) -> Dict[Text, Any]:
+    """Returns the spans in the Chrome trace event format."""
+    pid = os.getpid()
+    events = []
+    for span in self.Spans():
+      events.append({
+          'name': span['name'], 'cat': 'chido', 'ph': 'X', 'pid': pid,
+          'tid': span['thread'], 'ts': span['start'] * 1e6,
+          'dur': span['duration'] * 1e6,
+          'args': dict(span['attributes'], cpu_ms=span['cpu'] * 1e3,
+                       span_id=span['span_id'],
+                       parent_id=span['parent_id'])})
+    events.sort(key=lambda e: e['ts'])
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+  def Write(self, path: Text) -> None:
+    """Atomically writes the spans to path.
+
+    Files ending in .jsonl get one JSON object per span, others a Chrome
+    trace.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('wt', dir=directory, delete=False) as f:
+      if path.endswith('.jsonl'):
+        for span in self.Spans():
+          f.write(json.dumps(span, default=str) + '\n')
+      else:
+        json.dump(self.ChromeTrace(), f, default=str)
+    os.replace(f.name, path)
+
+
+TRACER = Tracer(enabled=bool(os.environ.get('CHIDO_TRACE_FILE')),
+                sample_rate=float(os.environ.get('CHIDO_TRACE_SAMPLE') or 1.0))
+
+
+def Span(name: Text, **attributes: Any):
+  """Returns TRACER.Span(name, **attributes)."""
+  return TRACER.Span(name, **attributes)
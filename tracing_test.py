@@ -0,0 +1,92 @@
+"""Unit tests for tracing."""
+import json
+import os
+import random
+import tempfile
+import threading
+import unittest
+
+import tracing
+
+
+class TracerTest(unittest.TestCase):
+
+  def _Tracer(self, **kwargs):
+    return tracing.Tracer(rng=random.Random(1), **kwargs)
+
+  def testNestedSpans(self):
+    tracer = self._Tracer()
+    with tracer.Span('SetContainer', ap='ap-01', container='radios'):
+      with tracer.Span('rpc:Set'):
+        pass
+      with tracer.Span('attempt', attempt=2):
+        tracer.Annotate(state='pending')
+    spans = {span['name']: span for span in tracer.Spans()}
+    root = spans['SetContainer']
+    self.assertIsNone(root['parent_id'])
+    self.assertEqual(spans['rpc:Set']['parent_id'], root['span_id'])
+    self.assertEqual(spans['rpc:Set']['trace_id'], root['trace_id'])
+    self.assertEqual(spans['attempt']['attributes'], {
+        'ap': 'ap-01', 'container': 'radios', 'attempt': 2,
+        'state': 'pending'})
+    self.assertGreaterEqual(root['duration'], spans['rpc:Set']['duration'])
+
+  def testDisabled(self):
+    tracer = self._Tracer(enabled=False)
+    with tracer.Span('SetContainer'):
+      tracer.Annotate(attempt=1)
+    self.assertEqual(tracer.Spans(), [])
+
+  def testSamplingKeepsWholeTraces(self):
+    tracer = self._Tracer(sample_rate=0.5)
+    for _ in range(100):
+      with tracer.Span('CycleChannels'):
+        with tracer.Span('rpc:Get'):
+          pass
+    summary = tracer.Summary()
+    self.assertEqual(summary['CycleChannels']['count'],
+                     summary['rpc:Get']['count'])
+    self.assertTrue(20 < summary['rpc:Get']['count'] < 80)
+
+  def testSpansNestPerThread(self):
+    tracer = self._Tracer()
+
+    def _Other():
+      with tracer.Span('other'):
+        pass
+
+    with tracer.Span('main'):
+      thread = threading.Thread(target=_Other)
+      thread.start()
+      thread.join()
+    spans = {span['name']: span for span in tracer.Spans()}
+    self.assertIsNone(spans['other']['parent_id'])
+    self.assertNotEqual(spans['other']['trace_id'], spans['main']['trace_id'])
+
+  def testMaxSpans(self):
+    tracer = self._Tracer(max_spans=2)
+    for _ in range(3):
+      with tracer.Span('rpc:Get'):
+        pass
+    self.assertEqual(len(tracer.Spans()), 2)
+    self.assertEqual(tracer.dropped, 1)
+
+  def testWrite(self):
+    tracer = self._Tracer()
+    with tracer.Span('retry sleep', reason='stale'):
+      pass
+    directory = tempfile.mkdtemp()
+    tracer.Write(os.path.join(directory, 'trace.jsonl'))
+    with open(os.path.join(directory, 'trace.jsonl'), 'rt') as f:
+      lines = [json.loads(line) for line in f]
+    self.assertEqual(lines[0]['attributes'], {'reason': 'stale'})
+    tracer.Write(os.path.join(directory, 'trace.json'))
+    with open(os.path.join(directory, 'trace.json'), 'rt') as f:
+      event = json.load(f)['traceEvents'][0]
+    self.assertEqual((event['name'], event['ph']), ('retry sleep', 'X'))
+    self.assertIn('cpu_ms', event['args'])
+    self.assertIn('retry sleep', tracer.Table())
+
+
+if __name__ == '__main__':
+  unittest.main()